@@ -0,0 +1,153 @@
+# clock.py - NTP-disciplined epoch clock for the station
+# =======================================================
+#
+# The RTC is never stepped. sync() asks NTP (ntptime) for the time and keeps the offset
+# of the local clock (time.time()) to it; epoch() turns a local time into epoch seconds
+# (UTC) with that offset plus the drift rate of the local clock measured between syncs.
+#
+# Readings are stamped with local time. Until the first sync of a boot the local time
+# is meaningless (the Pico starts at 2021-01-01), so such readings are marked unsynced
+# and kept; because the local clock does not jump, epoch() still converts them
+# correctly once a sync succeeded. Readings left unsynced by an earlier boot cannot be
+# converted: their boot number differs from ``boot``.
+#
+# The boot counter and the drift rate are kept in a small state file, so the drift is
+# known right after a reboot.
+#
+# Networks that block NTP (UDP port 123) would keep the station unsynced, and nothing
+# is sent before the first sync. sync() counts its failures in a row; after a few the
+# caller can take the time from the Date header of an HTTP reply instead (sync_http()),
+# which only needs a TCP connection and is good to a second or two.
+
+import json
+import time
+
+try:
+    import ntptime
+except ImportError:
+    ntptime = None
+
+try:
+    import socket
+except ImportError:
+    socket = None
+
+DRIFT_BASELINE = 3600  # s between two syncs before their offsets give a drift rate
+NTP_TIMEOUT = 1        # s ntptime waits for the answer
+HTTP_TIMEOUT = 5       # s for the HTTP fallback to connect and answer
+_MONTHS = b"JanFebMarAprMayJunJulAugSepOctNovDec"
+# Unix seconds of the port's epoch: 2000-01-01 on older MicroPython ports, like ntptime
+_EPOCH = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+
+def _days(year, month, day):
+    """Days from 1970-01-01 to a date (proleptic Gregorian calendar)."""
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+
+def parse_http_date(value):
+    """b"Sat, 17 Oct 2026 12:34:56 GMT" -> seconds since the port's epoch."""
+    parts = value.split()
+    index = _MONTHS.find(parts[2])
+    if index % 3 or len(parts[2]) != 3:
+        raise ValueError("month")
+    month = index // 3 + 1
+    hour, minute, second = (int(v) for v in parts[4].split(b":"))
+    days = _days(int(parts[3]), month, int(parts[1]))
+    return days * 86400 + hour * 3600 + minute * 60 + second - _EPOCH
+
+
+class Clock:
+    def __init__(self, state_file="clock.json"):
+        self.state_file = state_file
+        self.synced = False
+        self.offset = 0     # s, NTP time - local time at the last sync
+        self.drift = 0.0    # s the local clock falls behind per s
+        self.synced_at = 0  # local time of the last sync
+        self.syncs = 0
+        self.failures = 0   # failed NTP queries in a row
+        self._first = None  # (local time, offset) of the first sync of this boot
+        self.boot = 0
+        try:
+            with open(state_file) as f:
+                state = json.loads(f.read())
+            self.boot = state["boot"]
+            self.drift = state["drift"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self.boot += 1
+        self._save()
+
+    def _save(self):
+        try:
+            with open(self.state_file, "w") as f:
+                f.write(json.dumps({"boot": self.boot, "drift": self.drift}))
+        except OSError:
+            pass
+
+    def sync(self):
+        """Query NTP; returns True if the offset was updated."""
+        try:
+            if ntptime is None:
+                raise OSError("no ntptime")
+            ntptime.timeout = NTP_TIMEOUT
+            ntp = ntptime.time()
+        except Exception:
+            self.failures += 1
+            return False
+        self.failures = 0
+        return self._adopt(ntp)
+
+    def sync_http(self, host, port=80):
+        """Take the time from the Date header of an HTTP reply of host; returns True if
+        the offset was updated."""
+        if socket is None:
+            return False
+        sock = None
+        try:
+            addr = socket.getaddrinfo(host, port)[0][-1]
+            sock = socket.socket()
+            sock.settimeout(HTTP_TIMEOUT)
+            sock.connect(addr)
+            sock.write(b"HEAD / HTTP/1.0\r\nHost: " + host.encode() + b"\r\n\r\n")
+            while True:
+                line = sock.readline()
+                if line in (b"", b"\r\n"):
+                    return False  # no Date header
+                if line[:5].lower() == b"date:":
+                    return self._adopt(parse_http_date(line[5:]))
+        except Exception:
+            return False
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def _adopt(self, now):
+        """Take now (epoch seconds) as the time of the local clock."""
+        local = int(time.time())
+        offset = now - local
+        if self._first is None:
+            self._first = (local, offset)
+        elif local - self._first[0] >= DRIFT_BASELINE:
+            # Over the whole span since the first sync: NTP only gives whole seconds
+            self.drift = (offset - self._first[1]) / (local - self._first[0])
+            self._save()
+        self.offset = offset
+        self.synced_at = local
+        self.synced = True
+        self.syncs += 1
+        return True
+
+    def epoch(self, local):
+        """Local time (time.time() of this boot) -> epoch seconds; unchanged before the
+        first sync."""
+        if not self.synced:
+            return int(local)
+        return int(local + self.offset + self.drift * (local - self.synced_at))
+
+    def now(self):
+        return self.epoch(time.time())
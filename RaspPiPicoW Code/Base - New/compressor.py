@@ -0,0 +1,119 @@
+# compressor.py - Deadband / swinging-door compression of readings
+# =================================================================
+#
+# Decides per sensor (mid) which readings are worth keeping. Channels are temperature,
+# humidity, pressure and gas, each with its own tolerance; a reading is kept for all
+# channels at once.
+#
+#   "deadband"  keep a reading when a channel moved more than its tolerance away from
+#               the last kept one. The server holds each kept value until the next.
+#   "swing"     swinging-door trending: keep a reading only when no straight line from
+#               the last kept reading can pass within the tolerance of all readings
+#               since. The server interpolates linearly between kept readings.
+#
+# Either way a reconstructed series stays within the tolerance of every reading taken
+# (plus the rounding of the cache), and a reading is kept at least every heartbeat
+# seconds so the server can tell a steady room from a silent station.
+#
+# With "swing" a reading is only known to be needed once the next one arrives, so
+# kept readings leave one interval late. Its kept values are moved onto the line
+# that fits the readings before (by at most the tolerance), which keeps the bound.
+
+CHANNELS = 4  # temperature, humidity, pressure, gas
+MODES = ("deadband", "swing")
+
+
+class Compressor:
+    def __init__(self, mode, tolerances, heartbeat):
+        if mode not in MODES:
+            raise ValueError("unknown compression mode %r" % mode)
+        self.mode = mode
+        self.tolerances = tolerances
+        self.heartbeat = heartbeat  # s
+        self.offered = 0
+        self.kept = 0
+        self._state = {}  # mid -> _Door (swing) or [ts, values] (deadband)
+
+    def offer(self, ts, mid, values, flags=0):
+        """Offer one reading (values per channel). Returns the readings to keep now, as
+        a list of (ts, mid, values, flags): none, this one, or (swing) an earlier one."""
+        self.offered += 1
+        state = self._state.get(mid)
+        if state is None:
+            self._state[mid] = _Door(ts, values) if self.mode == "swing" else [ts, values]
+            kept = [(ts, mid, values, flags)]
+        elif self.mode == "deadband":
+            kept = self._deadband(state, ts, mid, values, flags)
+        else:
+            kept = self._swing(state, ts, mid, values, flags)
+        self.kept += len(kept)
+        return kept
+
+    def _deadband(self, state, ts, mid, values, flags):
+        last_ts, last = state
+        if ts - last_ts < self.heartbeat:
+            for i in range(CHANNELS):
+                if abs(values[i] - last[i]) > self.tolerances[i]:
+                    break
+            else:
+                return []
+        state[0] = ts
+        state[1] = values
+        return [(ts, mid, values, flags)]
+
+    def _swing(self, door, ts, mid, values, flags):
+        kept = []
+        if not door.admit(ts, values, self.tolerances):
+            # Doors closed: keep the previous reading, on a line that fits all before it
+            prev_ts, prev_values, prev_flags = door.last
+            fitted = door.fit(prev_ts, prev_values)
+            kept.append((prev_ts, mid, fitted, prev_flags))
+            door.restart(prev_ts, fitted)
+            door.admit(ts, values, self.tolerances)  # one reading always fits
+        door.last = (ts, values, flags)
+        if ts - door.ts >= self.heartbeat:
+            fitted = door.fit(ts, values)
+            kept.append((ts, mid, fitted, flags))
+            door.restart(ts, fitted)
+        return kept
+
+
+class _Door:
+    """Swinging door of one sensor: the anchor (last kept reading) and, per channel, the
+    range of slopes from it that pass within the tolerance of every reading since."""
+
+    def __init__(self, ts, values):
+        self.low = [0.0] * CHANNELS
+        self.high = [0.0] * CHANNELS
+        self.restart(ts, values)
+
+    def restart(self, ts, values):
+        self.ts = ts
+        self.values = values
+        self.last = None  # (ts, values, flags) of the newest admitted reading
+        for i in range(CHANNELS):
+            self.low[i] = -1e30
+            self.high[i] = 1e30
+
+    def admit(self, ts, values, tolerances):
+        """Narrow the slopes by one reading; False (and unchanged) if none is left."""
+        dt = ts - self.ts
+        low = self.low[:]
+        high = self.high[:]
+        for i in range(CHANNELS):
+            delta = values[i] - self.values[i]
+            low[i] = max(low[i], (delta - tolerances[i]) / dt)
+            high[i] = min(high[i], (delta + tolerances[i]) / dt)
+            if low[i] > high[i]:
+                return False
+        self.low = low
+        self.high = high
+        return True
+
+    def fit(self, ts, values):
+        """values (admitted at ts) moved onto the nearest line from the anchor that
+        passes within the tolerance of all admitted readings."""
+        dt = ts - self.ts
+        return tuple(self.values[i] + min(max((values[i] - self.values[i]) / dt, self.low[i]),
+                                          self.high[i]) * dt
+                     for i in range(CHANNELS))
@@ -1,8 +1,9 @@
+import sys
 import imaplib
 import email
 import json
-import mysql.connector
 import time
+import zlib
 
 # ============================
 # E-Mail Zugang
@@ -23,116 +24,279 @@ DB_NAME = "wetterstation2026_db"
 # DB Verbindung herstellen
 # ============================
 def connect_db():
+    import mysql.connector  # nur der Dienst braucht den Treiber, nicht die Decoder
     return mysql.connector.connect(
         host=DB_HOST,
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME,
-        autocommit=False
+        autocommit=False,
+        time_zone="+00:00"  # FROM_UNIXTIME() liefert so UTC
     )
 
-conn = connect_db()
-cursor = conn.cursor()
+# ============================
+# Nutzlast dekodieren
+# ============================
+# Die Station sendet je nach UPLINK_FORMAT (siehe wire.py auf der Station):
+#   Version 1: JSON-Liste von Objekten (oder ein einzelnes Objekt)
+#   Version 2: {"v":2,"t0":...,"rows":[[mid,dt,temp,feuchte,druck,gas,flags],...]}
+#   Version 3: Binärdaten b"WS" 0x03 + zigzag-Varints, per Base64 übertragen
+# Große Rückstände kommen als application/zlib (Base64), darin eine der Versionen.
+# Version 2 und 3: Zeitstempel als Differenz zur Vorzeile (ab t0 bzw. 0), Messwerte
+# x100 als Ganzzahl und als Differenz zur letzten Zeile desselben Sensors.
+# Zeitstempel sind Epochensekunden (UTC) und gehen ohne Umwandlung in FROM_UNIXTIME(),
+# die Spalte timestamp hält also UTC (ältere Zeilen: siehe migriere_utc()).
+# Nur der einmal gesendete cache.json der Firmware vor cache.bin trägt sie noch als
+# Text ("2025-01-31 12:00:00") in Ortszeit; CONVERT_TZ() rechnet ihn nach UTC um.
+# Datensätze mit "unsynced" tragen noch Ortszeit der Station (vor dem ersten
+# NTP-Abgleich eines früheren Starts) und werden nicht gespeichert.
+PAYLOAD_TYPES = ["application/json", "text/plain", "application/octet-stream", "application/zlib"]
+BINARY_MAGIC = b"WS"
+FLAG_UNSYNCED = 0x02  # wie in ringcache.py auf der Station
+
+def undelta(rows, t0):
+    data_array = []
+    last = {}
+    ts = t0
+    for mid, dt, temp, hum, pres, gas, flags in rows:
+        ts += dt
+        values = (temp, hum, pres, gas)
+        if mid in last:
+            values = tuple(a + b for a, b in zip(last[mid], values))
+        last[mid] = values
+        data = {
+            "mid": mid,
+            "temperatur": values[0] / 100,
+            "feuchte": values[1] / 100,
+            "druck": values[2] / 100,
+            "qualitaet": values[3],
+            "timestamp": ts
+        }
+        if flags & FLAG_UNSYNCED:
+            data["unsynced"] = True
+        data_array.append(data)
+    return data_array
+
+def decode_v2(data):
+    return undelta(data["rows"], data["t0"])
+
+def decode_v3(raw):
+    values = []
+    pos = 3
+    try:
+        while pos < len(raw):
+            value = shift = 0
+            while True:
+                byte = raw[pos]
+                pos += 1
+                value |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            values.append(value)
+    except IndexError:
+        raise ValueError("Binärdaten abgeschnitten")
+    if len(values) % 7:
+        raise ValueError("Binärdaten unvollständig")
+    rows = []
+    for i in range(0, len(values), 7):
+        mid, *signed, flags = values[i:i + 7]
+        # zigzag zurück: dt und Messwerte sind vorzeichenbehaftet
+        rows.append([mid] + [(v >> 1) ^ -(v & 1) for v in signed] + [flags])
+    return undelta(rows, 0)
+
+def part_payload(part):
+    # Inhalt eines Mail-Teils, Base64 dekodiert und application/zlib entpackt
+    payload = part.get_payload(decode=True)
+    if payload and part.get_content_type() == "application/zlib":
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(f"zlib: {e}")
+    return payload
+
+def decode_payload(payload):
+    # Liste von Datensätzen wie in Version 1, ValueError bei unbekanntem Inhalt
+    if not payload:
+        raise ValueError("leer")
+    if payload[:2] == BINARY_MAGIC:
+        if payload[2] == 3:
+            return decode_v3(payload)
+        raise ValueError(f"unbekannte Binärversion {payload[2]}")
+
+    json_text = payload.decode(errors="ignore").strip()
+    if not json_text.startswith(("{","[")):
+        raise ValueError("kein JSON")
+    data = json.loads(json_text)
+    if isinstance(data, list):
+        return data
+    version = data.get("v", 1)
+    if version == 1:
+        return [data]
+    if version == 2:
+        return decode_v2(data)
+    raise ValueError(f"unbekannte Version {version}")
 
-print("▶ Starte Mail → DB Service")
+def log_health(data):
+    # Gesundheitsmeldung der Station (Laufzeiten und Heap, siehe profiler.py):
+    # keine Messung, wird nur ausgegeben
+    health = data.get("health", {})
+    print(f"🩺 Gesundheit {data.get('timestamp')} - MID:{data.get('mid')}, "
+          f"Laufzeit {health.get('uptime_s')} s, Heap frei min {health.get('mem_free_min')} B, "
+          f"GC {health.get('gc_runs')}, ausgelassen {health.get('samples_missed')}, "
+          f"Cache {health.get('cache')}")
+    for stage, (count, avg_us, max_us) in health.get("stages", {}).items():
+        print(f"   {stage:<7} {count:>5}x  Mittel {avg_us / 1000:9.1f} ms  max {max_us / 1000:9.1f} ms")
+
+def store_mail(conn, data_array):
+    # Alle Datensätze einer Mail in einer Transaktion: entweder alle gültigen werden
+    # gespeichert oder bei einem DB-Fehler keiner (rollback). Sonst committet die
+    # nächste Mail die schon eingefügten Zeilen mit, und die ungelesen gebliebene
+    # Mail wird später noch einmal eingefügt (doppelte Zeilen).
+    # Liefert (gespeichert, übersprungen), wirft bei DB-Fehlern.
+    cursor = conn.cursor()
+    gespeichert = uebersprungen = 0
+    try:
+        for data in data_array:
+            if "health" in data:
+                log_health(data)
+                continue
+            if data.get("unsynced"):
+                print("⚠ Zeitstempel ohne NTP-Abgleich, übersprungen:", data)
+                uebersprungen += 1
+                continue
+
+            if isinstance(data["timestamp"], str):
+                zeit = "CONVERT_TZ(%s, 'SYSTEM', '+00:00')"
+            else:
+                zeit = "FROM_UNIXTIME(%s)"
+            sql = """
+            INSERT INTO messungen
+            (mid, temperatur, feuchte, druck, qualitaet, timestamp)
+            VALUES (%s, %s, %s, %s, %s, {})
+            """.format(zeit)
+            cursor.execute(sql, (
+                data["mid"],
+                data["temperatur"],
+                data["feuchte"],
+                data["druck"],
+                data["qualitaet"],
+                data["timestamp"]
+            ))
+            gespeichert += 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return gespeichert, uebersprungen
 
 # ============================
-# Endlosschleife
+# Einmalig: alte Zeilen nach UTC
 # ============================
-while True:
+def migriere_utc(conn, bis):
+    # Frühere Versionen speicherten die Uhrzeit der Station (Pico-RTC, von Thonny auf
+    # die Ortszeit des PCs gestellt), jetzt steht UTC in der Spalte. Einmal ausführen,
+    # bevor die neue Version die erste Messung speichert, mit bis = Umstellung in
+    # Ortszeit:
+    #   python mail_to_db.py --utc "2026-10-17 20:00:00"
+    # Umgerechnet wird aus der Systemzeitzone des MySQL-Servers (braucht keine
+    # Zeitzonentabellen). Ein zweiter Lauf würde die Zeilen noch einmal verschieben.
+    # Liefert die Anzahl umgerechneter Zeilen.
+    cursor = conn.cursor()
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ACCOUNT, EMAIL_APP_PASSWORD)
-        mail.select("inbox")
-
-        status, messages = mail.search(None, '(UNSEEN)')
-
-        if status == "OK" and messages[0] != b'':
-            for num in messages[0].split():
-
-                status, data = mail.fetch(num, "(RFC822)")
-                if status != "OK":
-                    continue
-
-                raw_email = data[0][1]
-                msg = email.message_from_bytes(raw_email)
-
-                # ----------------------------
-                # JSON aus Mail extrahieren
-                # ----------------------------
-                json_text = None
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        if content_type in ["application/json", "text/plain"]:
-                            payload = part.get_payload(decode=True)
-                            if payload:
-                                json_text = payload.decode(errors="ignore").strip()
-                                break
-                else:
-                    payload = msg.get_payload(decode=True)
-                    if payload:
-                        json_text = payload.decode(errors="ignore").strip()
-
-                if not json_text or not json_text.startswith(("{","[")):
-                    print("⚠ Ungültiges JSON, übersprungen")
-                    continue
-
-                # ----------------------------
-                # JSON verarbeiten
-                # ----------------------------
-                try:
-                    data_array = json.loads(json_text)
-                    if isinstance(data_array, dict):
-                        data_array = [data_array]
-
-                    # DB reconnect falls nötig
-                    if not conn.is_connected():
-                        print("🔄 DB reconnect...")
-                        conn = connect_db()
-                        cursor = conn.cursor()
-
-                    for data in data_array:
-                        # Timestamp ins MySQL Format konvertieren, falls nötig
-                        ts = data.get("timestamp", "")
-                        if "." in ts:  # z.B. DD.MM.YYYY
-                            try:
-                                parts = ts.split(" ")
-                                d, m, y = parts[0].split(".")
-                                ts = f"{y}-{m}-{d} {parts[1]}"
-                            except:
-                                ts = ts  # fallback
-
-                        sql = """
-                        INSERT INTO messungen
-                        (mid, temperatur, feuchte, druck, qualitaet, timestamp)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        """
-                        cursor.execute(sql, (
-                            data["mid"],
-                            data["temperatur"],
-                            data["feuchte"],
-                            data["druck"],
-                            data["qualitaet"],
-                            ts
-                        ))
-
-                    conn.commit()
-                    print(f"💾 {len(data_array)} Datensätze gespeichert")
-
-                    # Mail als gelesen markieren
-                    mail.store(num, '+FLAGS', '\\Seen')
-
-                except Exception as e:
-                    print("❌ Fehler beim JSON/DB Verarbeiten:", e)
-
-        else:
-            print("⏱ Keine neuen Mails")
-
-        mail.logout()
-
-    except Exception as e:
-        print("❌ Fehler beim Abrufen:", e)
-
-    print("⏱ Warte 60 Sekunden...\n")
-    time.sleep(60)
\ No newline at end of file
+        cursor.execute("UPDATE messungen SET timestamp = CONVERT_TZ(timestamp, 'SYSTEM', '+00:00') "
+                       "WHERE timestamp < %s", (bis,))
+        conn.commit()
+        return cursor.rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# ============================
+# Dienst: Endlosschleife
+# ============================
+def main():
+    conn = connect_db()
+
+    print("▶ Starte Mail → DB Service")
+
+    while True:
+        try:
+            mail = imaplib.IMAP4_SSL(IMAP_SERVER)
+            mail.login(EMAIL_ACCOUNT, EMAIL_APP_PASSWORD)
+            mail.select("inbox")
+
+            status, messages = mail.search(None, '(UNSEEN)')
+
+            if status == "OK" and messages[0] != b'':
+                for num in messages[0].split():
+
+                    status, data = mail.fetch(num, "(RFC822)")
+                    if status != "OK":
+                        continue
+
+                    raw_email = data[0][1]
+                    msg = email.message_from_bytes(raw_email)
+
+                    # ----------------------------
+                    # Nutzlast aus Mail extrahieren
+                    # ----------------------------
+                    try:
+                        payload = None
+                        if msg.is_multipart():
+                            for part in msg.walk():
+                                content_type = part.get_content_type()
+                                if content_type in PAYLOAD_TYPES:
+                                    payload = part_payload(part)
+                                    if payload:
+                                        break
+                        else:
+                            payload = part_payload(msg)
+
+                        data_array = decode_payload(payload)
+                    except ValueError as e:
+                        print("⚠ Ungültige Nutzlast, übersprungen:", e)
+                        continue
+
+                    # ----------------------------
+                    # Datensätze verarbeiten
+                    # ----------------------------
+                    try:
+                        # DB reconnect falls nötig
+                        if not conn.is_connected():
+                            print("🔄 DB reconnect...")
+                            conn = connect_db()
+
+                        gespeichert, uebersprungen = store_mail(conn, data_array)
+                        print(f"💾 {gespeichert} Datensätze gespeichert, {uebersprungen} übersprungen")
+
+                        # Mail als gelesen markieren
+                        mail.store(num, '+FLAGS', '\\Seen')
+
+                    except Exception as e:
+                        # store_mail() hat zurückgerollt, die Mail bleibt ungelesen
+                        print("❌ Fehler beim JSON/DB Verarbeiten:", e)
+
+            else:
+                print("⏱ Keine neuen Mails")
+
+            mail.logout()
+
+        except Exception as e:
+            print("❌ Fehler beim Abrufen:", e)
+
+        print("⏱ Warte 60 Sekunden...\n")
+        time.sleep(60)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--utc":
+        conn = connect_db()
+        print("🕒 Nach UTC umgerechnet:", migriere_utc(conn, sys.argv[2]), "Datensätze")
+        conn.close()
+    else:
+        main()
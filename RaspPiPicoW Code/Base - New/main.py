@@ -1,20 +1,56 @@
+import os
 import time
 import json
 import network
 from machine import Pin, I2C
-from bme680 import BME680_I2C
+from bme680 import BME680Bus
 from umail import SMTP
+from ringcache import RingCache, FLAG_GAS_CARRIED, FLAG_UNSYNCED
+from clock import Clock, NTP_TIMEOUT, HTTP_TIMEOUT
+from compressor import Compressor
+from sampling import AdaptiveInterval
+from uplink import UplinkBatcher
+from wire import make_format
+import profiler
 
 # ===============================
 # WLAN
 # ===============================
 WIFI_SSID = "dd-wrt"
 WIFI_PASSWORD = "54tzck23"
+WLAN_PRUEFEN = 60  # Sekunden zwischen zwei Verbindungsversuchen, solange das WLAN weg ist
 
 # ===============================
 # Sensor-ID
 # ===============================
 SENSOR_MID = 1  # eindeutige ID des Sensors
+# IDs je (I2C-Bus, Adresse), falls mehrere BME680 angeschlossen sind
+SENSOR_MIDS = {
+    (0, 0x77): SENSOR_MID,
+    (0, 0x76): SENSOR_MID + 1,
+}
+SENSOR_VERSUCHE = 5  # so oft den Bus absuchen (alle 2 s), bevor die Station ohne Sensor aufgibt
+GAS_EVERY = 1   # Gasmessung (Heizer) nur jede N-te Messung, dazwischen letzter Wert
+MESS_INTERVALL = 60  # Sekunden zwischen zwei Messungen (festes Raster, ohne ADAPTIV)
+ADAPTIV = True           # schneller messen, solange sich die Werte schnell ändern, sonst seltener
+MESS_INTERVALL_MIN = 20  # Sekunden, Raster der adaptiven Messung (kürzester Abstand)
+MESS_INTERVALL_MAX = 80  # Sekunden, längster Abstand bei ruhigem Wetter (Vielfaches von MIN)
+MESS_SCHRITT = (0.2, 1.0, 0.2, 10000)  # aufzulösende Änderung je Messung: °C, %, hPa, Ohm (None = egal)
+
+# ===============================
+# Uhr
+# ===============================
+NTP_INTERVALL = 3600       # Sekunden zwischen zwei NTP-Abgleichen
+CLOCK_FILE = "clock.json"  # Boot-Zähler und gemessene Gangabweichung der Uhr
+NTP_AUSWEICH_NACH = 3      # so viele NTP-Fehlschläge in Folge, dann Zeit per HTTP holen
+ZEIT_HTTP_HOST = "google.com"  # dessen Date-Header ersetzt NTP, wenn UDP 123 gesperrt ist
+
+# ===============================
+# Kompression (siehe compressor.py)
+# ===============================
+KOMPRESSION = "swing"    # "deadband", "swing" (Swinging Door) oder None = jede Messung speichern
+TOLERANZ = (0.1, 0.5, 0.1, 5000)  # größte Abweichung je Kanal: °C, %, hPa, Ohm
+HERZSCHLAG = 900         # Sekunden, spätestens so oft wird je Sensor gespeichert
 
 # ===============================
 # E-Mail
@@ -26,25 +62,52 @@ SMTP_SENDER_EMAIL = "jazz.kiewicz@gmail.com"
 SMTP_APP_PASSWORD = "muurnoakhmehjhuj"
 EMAIL_RECIPIENT = "wetter.station.2026@fds-limburg.schule"
 EMAIL_SUBJECT = "🌡 Wetterstation BME680 JSON"
+SMTP_TIMEOUT = 5  # Sekunden, die ein SMTP-Schritt (Verbindung, TLS, eine Antwort) höchstens blockiert
 
 # ===============================
 # Cache
 # ===============================
-CACHE_FILE = "cache.json"
+CACHE_FILE = "cache.bin"
+ALT_CACHE_FILE = "cache.json"  # Cache der Firmware vor cache.bin: wird einmal gesendet, dann gelöscht
+CACHE_CAPACITY = 2880  # Datensätze im Ringpuffer (2 Tage bei 1/min), danach wird überschrieben
+
+# ===============================
+# Uplink (gebündelt senden)
+# ===============================
+UPLINK_MAX_RECORDS = 60     # senden, sobald so viele Datensätze im Cache liegen
+UPLINK_MAX_AGE = 3600       # ... oder der älteste Datensatz so alt ist (s)
+UPLINK_MAX_BYTES = 8000     # ... oder die Nutzlast so groß wird
+UPLINK_MAX_MESSAGE = 100000 # höchstens so viele Bytes pro E-Mail (wird gestreamt, kostet kein RAM)
+UPLINK_FORMAT = 3           # 1 = JSON-Objekte, 2 = kompaktes JSON, 3 = binär/Base64 (siehe wire.py)
+UPLINK_COMPRESS_MIN = 300   # ab so vielen Datensätzen im Cache gepackt senden (0 = nie)
+
+# ===============================
+# Gesundheitsmeldung (siehe profiler.py)
+# ===============================
+GESUNDHEIT_INTERVALL = 3600  # Sekunden; Laufzeiten und Heap als eigene Nachricht (0 = aus)
+
+stats = profiler.Profiler()  # Laufzeiten der Stufen und Heap seit der letzten Meldung
 
 # ===============================
 # WLAN verbinden
 # ===============================
-def connect_wlan():
+wlan = None
+
+def connect_wlan(timeout=10):
+    # Bis zu timeout Sekunden auf die Verbindung warten; mit 0 nur den Versuch
+    # anstoßen, isconnected() zeigt später das Ergebnis
+    global wlan
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
     if not wlan.isconnected():
         print("📡 WLAN verbinden...")
+        t = stats.start()
         wlan.connect(WIFI_SSID, WIFI_PASSWORD)
-        timeout = 10
         while not wlan.isconnected() and timeout > 0:
             time.sleep(1)
             timeout -= 1
+        if wlan.isconnected():
+            stats.stop(profiler.WIFI, t)
     if wlan.isconnected():
         print("✅ WLAN verbunden:", wlan.ifconfig())
         return True
@@ -52,97 +115,285 @@ def connect_wlan():
         print("⚠ WLAN nicht verbunden, Offline-Modus")
         return False
 
+# ===============================
+# Cache-Datensatz → JSON-Objekt
+# ===============================
+def record_to_dict(record):
+    ts, mid, temperatur, feuchte, druck, gas, flags = record
+    data = {
+        "mid": mid,
+        "temperatur": temperatur,
+        "feuchte": feuchte,
+        "druck": druck,
+        "qualitaet": gas,
+        "timestamp": ts  # Epochensekunden (UTC)
+    }
+    if flags & FLAG_UNSYNCED:
+        data["unsynced"] = True  # Ortszeit eines früheren Starts, nicht umrechenbar
+    return data
+
 # ===============================
 # E-Mail senden
 # ===============================
-def send_email(data_list):
+smtp = None  # offene SMTP-Sitzung, gilt für alle Nachrichten eines Sendevorgangs
+
+def send_email(reader):
+    global smtp
     try:
-        smtp = SMTP(
-            SMTP_SERVER,
-            SMTP_PORT,
-            username=SMTP_SENDER_EMAIL,
-            password=SMTP_APP_PASSWORD,
-            ssl=True
-        )
-        payload = json.dumps(data_list)
-        msg = (
+        if smtp is None:
+            # Nur die erste Nachricht zahlt Verbindung, TLS und AUTH
+            t = stats.start()
+            smtp = SMTP(
+                SMTP_SERVER,
+                SMTP_PORT,
+                username=SMTP_SENDER_EMAIL,
+                password=SMTP_APP_PASSWORD,
+                ssl=True,
+                keepalive=True,
+                timeout=SMTP_TIMEOUT
+            )
+            stats.stop(profiler.TLS, t)
+        t = stats.start()
+        header = (
             "Subject: {}\r\n"
             "To: {}\r\n"
             "From: {}\r\n"
-            "Content-Type: application/json\r\n\r\n{}"
+            "MIME-Version: 1.0\r\n"
+            "{}\r\n"
         ).format(
             EMAIL_SUBJECT,
             EMAIL_RECIPIENT,
             SMTP_SENDER_EMAIL,
-            payload
+            reader.headers
         )
         smtp.to(EMAIL_RECIPIENT, mail_from=SMTP_SENDER_EMAIL)
-        smtp.send(msg.encode("utf-8"))
-        smtp.quit()
-        print("📧 E-Mail gesendet:", payload)
-
-        # Cache nach Versand leeren
-        with open(CACHE_FILE, "w") as f:
-            f.write("[]")
+        smtp.write(header.encode("utf-8"))
+        # Datensätze direkt vom Flash in den Socket, über einen festen Puffer
+        smtp.write_from(reader)
+        code, resp = smtp.send()
+        stats.stop(profiler.SMTP, t)
+        if code != 250:
+            print("❌ E-Mail abgelehnt, Daten bleiben im Cache:", code, resp)
+            return False
+        print("📧 E-Mail gesendet:", reader.records, "Datensätze,", reader.size, "Bytes")
+        return True
 
     except Exception as e:
-        print("❌ Fehler beim Senden, speichere in Cache:", e)
-        # Cache speichern
+        print("❌ Fehler beim Senden, Daten bleiben im Cache:", e)
+        close_email()
+        return False
+
+def sendezeit(frist):
+    # Ein Sendeschritt (Nachricht, alter Cache, Gesundheitsmeldung) beginnt nur, wenn
+    # vor dem Termin frist (ticks_ms) noch ein hängender Schritt samt QUIT Platz hat
+    return time.ticks_diff(frist, time.ticks_ms()) >= 2 * SMTP_TIMEOUT * 1000
+
+def close_email():
+    # Sitzung nach dem Sendevorgang schließen (TLS belegt viel RAM)
+    global smtp
+    if smtp is not None:
         try:
-            with open(CACHE_FILE, "r") as f:
-                cache = json.load(f)
-        except:
-            cache = []
-        cache += data_list
-        with open(CACHE_FILE, "w") as f:
-            json.dump(cache, f)
+            smtp.quit()
+        except Exception:
+            pass
+        smtp = None
+
+# ===============================
+# JSON-Nachricht, alter Cache (cache.json), Gesundheitsmeldung
+# ===============================
+class JsonNachricht:
+    # Datensätze (dicts) als Nachricht für send_email(): JSON-Liste (Format 1), ein
+    # Objekt pro Zeile; für den Rückstand der Firmware vor cache.bin und die
+    # Gesundheitsmeldung
+    headers = "Content-Type: application/json\r\n"
+
+    def __init__(self, daten):
+        self.records = len(daten)
+        self.size = 0
+        self._text = ("[\r\n" + ",\r\n".join(json.dumps(d) for d in daten) + "\r\n]\r\n").encode("utf-8")
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self._text) - self.size)
+        buf[:n] = self._text[self.size:self.size + n]
+        self.size += n
+        return n
+
+def altcache_senden():
+    # cache.json der alten Firmware einmal senden; die Zeitstempel sind dort Text
+    # ("2025-01-31 12:00:00"), den mail_to_db.py wie früher übernimmt. True, wenn
+    # nichts mehr zu senden ist
+    try:
+        with open(ALT_CACHE_FILE) as f:
+            daten = json.load(f)
+    except OSError:
+        return True  # keine alte Datei
+    except ValueError:
+        print("⚠", ALT_CACHE_FILE, "unlesbar, umbenannt in", ALT_CACHE_FILE + ".defekt")
+        os.rename(ALT_CACHE_FILE, ALT_CACHE_FILE + ".defekt")
+        return True
+    if daten and not send_email(JsonNachricht(daten)):
+        return False  # beim nächsten Senden wieder versuchen
+    os.remove(ALT_CACHE_FILE)
+    print("💾 Alter Cache", ALT_CACHE_FILE, "gesendet:", len(daten), "Datensätze")
+    return True
+
+def gesundheit_senden(ts):
+    # Laufzeiten der Stufen und Heap seit der letzten Meldung (profiler.py) als
+    # eigene Nachricht; mail_to_db.py gibt sie aus und speichert sie nicht. Scheitert
+    # das Senden, fehlt dieses Intervall (die Zahlen sind schon zurückgesetzt)
+    gesundheit = stats.health()
+    gesundheit["samples_missed"] = ausgelassen
+    gesundheit["cache"] = len(cache)
+    if compressor is not None:
+        gesundheit["compress_kept"] = [compressor.kept, compressor.offered]
+    return send_email(JsonNachricht([{"mid": SENSOR_MID, "health": gesundheit, "timestamp": ts}]))
 
 # ===============================
-# Sensor initialisieren
+# Sensoren initialisieren
 # ===============================
 i2c = I2C(0, sda=Pin(4), scl=Pin(5), freq=100000)
-sensor = BME680_I2C(i2c)
+sensors = BME680Bus([i2c], ids=SENSOR_MIDS)
+for versuch in range(SENSOR_VERSUCHE):
+    if sensors.scan():
+        break
+    print("❌ Kein BME680 gefunden, Versuch", versuch + 1, "von", SENSOR_VERSUCHE)
+    time.sleep(2)
+else:
+    # ohne Sensor gäbe es nur leere Durchläufe: anhalten wie Old/main.py
+    print("❌ Ohne Sensor kein Betrieb, Station angehalten")
+    raise SystemExit
+for mid, sensor in sensors.sensors:
+    sensor.gas_every = GAS_EVERY
+print("✅ Sensoren gefunden:", [mid for mid, sensor in sensors.sensors])
 
 # ===============================
 # Start
 # ===============================
+cache = RingCache(CACHE_FILE, CACHE_CAPACITY)
+print("💾 Datensätze im Cache:", len(cache))
+clock = Clock(CLOCK_FILE)
+compressor = Compressor(KOMPRESSION, TOLERANZ, HERZSCHLAG) if KOMPRESSION else None
+cache_boot = cache.head  # erster Datensatz dieses Starts
+uplink_format = make_format(UPLINK_FORMAT, lambda r: json.dumps(record_to_dict(r)))
+uplink = UplinkBatcher(cache, send_email, uplink_format,
+                       max_records=UPLINK_MAX_RECORDS, max_age=UPLINK_MAX_AGE,
+                       max_bytes=UPLINK_MAX_BYTES, max_message=UPLINK_MAX_MESSAGE,
+                       compress_min=UPLINK_COMPRESS_MIN)
 internet = connect_wlan()
+
+def sync_clock():
+    # NTP-Abgleich; beim ersten Erfolg die bis dahin in Ortszeit gespeicherten
+    # Datensätze dieses Starts auf Epochensekunden umstempeln
+    first = not clock.synced
+    if not internet:
+        return
+    if not clock.sync():
+        # Netze, die NTP sperren: nach einigen Fehlschlägen die Zeit aus dem
+        # Date-Header einer HTTP-Antwort, sonst würde nie gesendet
+        if clock.failures < NTP_AUSWEICH_NACH or not clock.sync_http(ZEIT_HTTP_HOST):
+            print("⚠ NTP nicht erreichbar, Uhr nicht abgeglichen")
+            return
+        print("🕒 Uhr per HTTP von", ZEIT_HTTP_HOST)
+    print("🕒 Uhr abgeglichen, Abweichung", clock.offset, "s")
+    if first:
+        print("🕒 Umgestempelt:", cache.restamp(cache_boot, clock.epoch), "Datensätze")
+
+sync_clock()
 print("▶ Wetterstation gestartet")
 
 # ===============================
 # Hauptschleife
 # ===============================
+# Feste Termine im Raster von MESS_INTERVALL: der nächste Termin ist der vorige plus
+# Intervall (ticks_ms), nicht Ende der Messung plus Pause. So summieren sich Mess- und
+# Sendezeit nicht zu einer Drift, und jeder Datensatz trägt die Zeit seines Termins.
+# Zeitstempel sind Epochensekunden der mit NTP abgeglichenen Uhr (clock.py); vor dem
+# ersten Abgleich Ortszeit mit FLAG_UNSYNCED, sync_clock() stempelt sie später um.
+# Das Netz kommt nach der Messung und blockiert (ein Kern, keine Tasks wie in
+# Old/main.py): jeder Schritt ist durch einen Socket-Timeout begrenzt (SMTP_TIMEOUT,
+# NTP_TIMEOUT, HTTP_TIMEOUT) und beginnt nur, wenn dieser bis zum nächsten Termin
+# passt. Das WLAN wird nur angestoßen, der nächste Durchlauf sieht das Ergebnis.
+# Mit ADAPTIV ist das Raster MESS_INTERVALL_MIN, und sampling.py entscheidet nach jeder
+# Messung aus der Änderungsrate, wie viele Termine bis zur nächsten vergehen.
+if ADAPTIV:
+    raster = MESS_INTERVALL_MIN
+    pacer = AdaptiveInterval(raster, MESS_INTERVALL_MAX // raster, MESS_SCHRITT)
+else:
+    raster = MESS_INTERVALL
+    pacer = None
+intervall_ms = raster * 1000
+termin = time.ticks_ms()
+t0 = int(time.time())
+slot = 0
+naechster_abgleich = clock.synced_at + NTP_INTERVALL
+naechster_wlan_versuch = t0 + WLAN_PRUEFEN
+naechste_gesundheit = 0  # erste Meldung beim ersten Senden nach dem Start
+ausgelassen = 0  # Termine, die eine lange Messung oder ein Sendevorgang überdauert hat
+altcache_offen = True
 while True:
-    # Timestamp im MySQL-kompatiblen Format
-    t = time.localtime()
-    timestamp = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
-        t[0], t[1], t[2], t[3], t[4], t[5]
-    )
+    ortszeit = t0 + slot * raster
+    ts = clock.epoch(ortszeit)
+    flags = 0 if clock.synced else FLAG_UNSYNCED
 
-    # Aktuelle Messung
-    data = {
-        "mid": SENSOR_MID,
-        "temperatur": float(sensor.temperature),
-        "feuchte": float(sensor.humidity),
-        "druck": float(sensor.pressure),
-        "qualitaet": float(sensor.gas),
-        "timestamp": timestamp
-    }
+    # Aktuelle Messung aller Sensoren (eine gemeinsame Wandlung) → Cache; mit
+    # Kompression nur, was der Compressor behält (bei "swing" ggf. die vorige Messung)
+    t = stats.start()
+    messungen = sensors.read_all()
+    stats.stop(profiler.READ, t)
+    for mid, reading in messungen:
+        werte = (reading.temperature, reading.humidity, reading.pressure, reading.gas)
+        if pacer is not None:
+            pacer.offer(ortszeit, mid, werte)
+        gas_flag = FLAG_GAS_CARRIED if reading.gas_carried else 0
+        if compressor is None:
+            behalten = [(ortszeit, mid, werte, gas_flag)]
+        else:
+            behalten = compressor.offer(ortszeit, mid, werte, gas_flag)
+        for zeit, mid, (temp, hum, press, gas), gas_flag in behalten:
+            t = stats.start()
+            cache.append(clock.epoch(zeit), mid, temp, hum, press, int(gas + 0.5),
+                         flags | gas_flag)
+            stats.stop(profiler.CACHE, t)
 
-    if internet and EMAIL_ENABLED:
-        # Internet da → direkt senden
-        send_email([data])
-    else:
-        # Offline → Cache speichern
-        try:
-            with open(CACHE_FILE, "r") as f:
-                cache = json.load(f)
-        except:
-            cache = []
-        cache.append(data)
-        with open(CACHE_FILE, "w") as f:
-            json.dump(cache, f)
+    # Nächster Termin nach Plan: bis dahin darf das Netz die Schleife aufhalten
+    geplant = 1 if pacer is None else pacer.next_slots()
+    frist = time.ticks_add(termin, geplant * intervall_ms)
+
+    # WLAN verloren (oder beim Start nicht da): höchstens alle WLAN_PRUEFEN Sekunden
+    # einen Versuch anstoßen
+    internet = wlan.isconnected()
+    if not internet and ortszeit >= naechster_wlan_versuch:
+        connect_wlan(timeout=0)
+        naechster_wlan_versuch = ortszeit + WLAN_PRUEFEN
+    if internet and (ortszeit >= naechster_abgleich or not clock.synced) and \
+            time.ticks_diff(frist, time.ticks_ms()) >= (NTP_TIMEOUT + HTTP_TIMEOUT) * 1000:
+        sync_clock()
+        naechster_abgleich = ortszeit + NTP_INTERVALL
+        ts = clock.epoch(ortszeit)
+
+    if not (internet and EMAIL_ENABLED):
         print("⚠ Keine Internetverbindung, Messung in Cache gespeichert")
+    elif not clock.synced:
+        print("⚠ Uhr nicht abgeglichen, Messung in Cache gespeichert")
+    else:
+        # Alles in einer SMTP-Sitzung, danach schließen; was bis zum nächsten Termin
+        # nicht mehr passt, folgt nach der nächsten Messung
+        if altcache_offen and sendezeit(frist):
+            altcache_offen = not altcache_senden()
+        if uplink.due(ts) and sendezeit(frist):
+            # Schwelle erreicht → ganzen Cache (inkl. aktueller Messung) senden
+            print("📤 Gesendet:", uplink.flush(lambda: sendezeit(frist)), "Datensätze, im Cache:", len(cache))
+        if GESUNDHEIT_INTERVALL and ts >= naechste_gesundheit and sendezeit(frist):
+            gesundheit_senden(ts)
+            naechste_gesundheit = ts + GESUNDHEIT_INTERVALL
+        close_email()
 
-    # Messintervall
-    time.sleep(60)
+    # Nächster Termin; Termine, die ein langer Sendevorgang überdauert hat, auslassen
+    schritt = time.ticks_diff(time.ticks_ms(), termin) // intervall_ms + 1
+    if schritt > geplant:
+        print("⚠ Messungen ausgelassen:", schritt - geplant)
+        ausgelassen += schritt - geplant
+    schritt = max(schritt, geplant)
+    slot += schritt
+    termin = time.ticks_add(termin, schritt * intervall_ms)
+    time.sleep_ms(time.ticks_diff(termin, time.ticks_ms()))
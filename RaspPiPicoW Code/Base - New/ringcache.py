@@ -0,0 +1,218 @@
+import struct
+
+# ===============================
+# Ringpuffer-Cache auf dem Flash
+# ===============================
+# Feste Datensätze (struct) in einer Datei, dazu ein Kopf mit Anfang (tail) und
+# Ende (head) der Warteschlange. Anhängen und Entfernen kosten konstant wenig,
+# egal wie viele Messungen im Cache liegen.
+#
+# Dateiaufbau:
+#   [Kopf A][Kopf B][Satz 0][Satz 1] ... [Satz capacity-1]
+#
+# Der Kopf wird abwechselnd in A und B geschrieben (Generationszähler + Prüfsumme).
+# Ein Stromausfall mitten im Schreiben trifft also höchstens eine Kopie; beim
+# Öffnen gilt die gültige Kopie mit der höchsten Generation. Jeder Satz trägt
+# seine laufende Nummer und eine Prüfsumme: ein halb geschriebener Satz wird
+# verworfen, ein vollständig geschriebener, aber noch nicht im Kopf vermerkter
+# Satz wird beim Öffnen wieder aufgenommen.
+#
+# Passt die Datei nicht (andere Kapazität, beide Köpfe defekt), wird sie neu
+# angelegt; die noch lesbaren Sätze werden dabei in die neue Datei übernommen:
+# bei gültigem Kopf die Warteschlange tail..head, sonst jeder Satz mit gültiger
+# Prüfsumme (dann können schon gesendete Sätze ein zweites Mal gesendet werden).
+
+_MAGIC = b"WRC1"
+_HEADER = "<4sIIII"      # magic, generation, tail, head, capacity
+_HEADER_DATA = struct.calcsize(_HEADER)
+_HEADER_SIZE = _HEADER_DATA + 2  # + Prüfsumme
+_RECORD = "<IIHhHIIB"    # seq, ts, mid, temp*100, feuchte*100, druck Pa, gas Ohm, flags
+_RECORD_DATA = struct.calcsize(_RECORD)
+_RECORD_SIZE = _RECORD_DATA + 2  # + Prüfsumme
+
+FLAG_GAS_CARRIED = 0x01  # Gaswert von einer früheren Messung übernommen
+FLAG_UNSYNCED = 0x02     # Zeitstempel noch Ortszeit, vor der ersten NTP-Synchronisierung (clock.py)
+
+
+def _checksum(buf, length):
+    # Fletcher-16, reicht gegen halb geschriebene Sätze
+    a = b = 0
+    for i in range(length):
+        a = (a + buf[i]) % 255
+        b = (b + a) % 255
+    return (b << 8) | a
+
+
+class RingCache:
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self._buf = bytearray(_RECORD_SIZE)
+        self._hbuf = bytearray(_HEADER_SIZE)
+        self._generation = 0
+        self.tail = 0  # laufende Nummer des ältesten Satzes
+        self.head = 0  # laufende Nummer des nächsten Satzes
+        try:
+            self._f = open(path, "r+b")
+        except OSError:
+            self._create()  # noch keine Datei
+            return
+        try:
+            self._load()
+        except OSError as e:
+            records = self._salvage()
+            self._f.close()
+            print("⚠ Cache", path, "neu angelegt:", e, "-", len(records), "Datensätze übernommen")
+            self._create()
+            for record in records[-capacity:]:
+                self._write_slot(self.head, *record[1:])
+                self.head += 1
+            self._write_header()
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def _create(self):
+        self._f = open(self.path, "w+b")
+        self._write_header()
+        self._write_header()  # beide Kopien gültig anlegen
+
+    # ---------- Kopf ----------
+    def _best_header(self):
+        # (generation, tail, head, capacity) der gültigen Kopie mit der höchsten
+        # Generation, None wenn keine gültig ist
+        best = None
+        for slot in (0, 1):
+            self._f.seek(slot * _HEADER_SIZE)
+            if self._f.readinto(self._hbuf) != _HEADER_SIZE:
+                continue
+            if _checksum(self._hbuf, _HEADER_DATA) != struct.unpack_from("<H", self._hbuf, _HEADER_DATA)[0]:
+                continue
+            magic, gen, tail, head, capacity = struct.unpack_from(_HEADER, self._hbuf)
+            if magic != _MAGIC or not capacity:
+                continue
+            if best is None or gen > best[0]:
+                best = (gen, tail, head, capacity)
+        return best
+
+    def _load(self):
+        best = self._best_header()
+        if best is None:
+            raise OSError("Kopf ungültig")
+        if best[3] != self.capacity:
+            raise OSError("Kapazität %d statt %d" % (best[3], self.capacity))
+        self._generation, self.tail, self.head, _ = best
+        # Sätze, die vor dem Stromausfall noch ganz geschrieben wurden, übernehmen
+        recovered = False
+        while self._read_slot(self.head) is not None:
+            self.head += 1
+            recovered = True
+        if self.head - self.tail > self.capacity:
+            self.tail = self.head - self.capacity
+        if recovered:
+            self._write_header()
+
+    def _salvage(self):
+        # Lesbare Sätze der alten Datei, nach laufender Nummer sortiert, als
+        # (seq, ts, mid, temperatur, feuchte, druck, gas, flags)
+        capacity = self.capacity
+        best = self._best_header()
+        if best is not None:
+            _, tail, head, self.capacity = best
+            seqs = range(max(tail, head - self.capacity), head)
+        else:
+            # ohne Kopf: jeden Platz der Datei, die Nummer steht im Satz
+            self._f.seek(0, 2)
+            self.capacity = max((self._f.tell() - 2 * _HEADER_SIZE) // _RECORD_SIZE, 1)
+            seqs = None
+        records = []
+        for slot in (range(self.capacity) if seqs is None else seqs):
+            record = self._read_slot(slot, seqs is None)
+            if record is not None:
+                _, ts, mid, temp, hum, pres, gas, flags = record
+                records.append((record[0], ts, mid, temp / 100, hum / 100, pres / 100, gas, flags))
+        self.capacity = capacity
+        records.sort()
+        return records
+
+    def _write_header(self):
+        self._generation += 1
+        struct.pack_into(_HEADER, self._hbuf, 0, _MAGIC, self._generation,
+                         self.tail, self.head, self.capacity)
+        struct.pack_into("<H", self._hbuf, _HEADER_DATA, _checksum(self._hbuf, _HEADER_DATA))
+        self._f.seek((self._generation & 1) * _HEADER_SIZE)
+        self._f.write(self._hbuf)
+        self._f.flush()
+
+    # ---------- Sätze ----------
+    def _offset(self, seq):
+        return 2 * _HEADER_SIZE + (seq % self.capacity) * _RECORD_SIZE
+
+    def _read_slot(self, seq, any_seq=False):
+        # any_seq: Platz seq lesen, egal welche Nummer der Satz trägt
+        self._f.seek(self._offset(seq))
+        if self._f.readinto(self._buf) != _RECORD_SIZE:
+            return None
+        if _checksum(self._buf, _RECORD_DATA) != struct.unpack_from("<H", self._buf, _RECORD_DATA)[0]:
+            return None
+        record = struct.unpack_from(_RECORD, self._buf)
+        if record[0] != seq & 0xFFFFFFFF and not any_seq:
+            return None
+        return record
+
+    def _write_slot(self, seq, ts, mid, temperatur, feuchte, druck, gas, flags):
+        # druck in hPa, wird als ganze Pascal gespeichert
+        struct.pack_into(_RECORD, self._buf, 0, seq & 0xFFFFFFFF, ts, mid,
+                         int(round(temperatur * 100)), int(round(feuchte * 100)),
+                         int(round(druck * 100)), int(gas), flags)
+        struct.pack_into("<H", self._buf, _RECORD_DATA, _checksum(self._buf, _RECORD_DATA))
+        self._f.seek(self._offset(seq))
+        self._f.write(self._buf)
+        self._f.flush()
+
+    def append(self, ts, mid, temperatur, feuchte, druck, gas, flags=0):
+        self._write_slot(self.head, ts, mid, temperatur, feuchte, druck, gas, flags)
+        self.head += 1
+        if self.head - self.tail > self.capacity:
+            self.tail += 1  # voll: ältesten Satz überschreiben
+        self._write_header()
+
+    def read(self, index):
+        # Satz Nummer index ab dem ältesten als
+        # (ts, mid, temperatur, feuchte, druck, gas, flags), None wenn defekt
+        record = self._read_slot(self.tail + index)
+        if record is None:
+            return None
+        _, ts, mid, temp, hum, pres, gas, flags = record
+        return (ts, mid, temp / 100, hum / 100, pres / 100, gas, flags)
+
+    def peek(self, count):
+        # Die ältesten count Sätze (count <= len); defekte Sätze fehlen
+        records = []
+        for index in range(min(count, len(self))):
+            record = self.read(index)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def restamp(self, start, epoch):
+        # Sätze ab laufender Nummer start mit FLAG_UNSYNCED auf epoch(ts) umstempeln
+        # (nach der ersten NTP-Synchronisierung); gibt die Anzahl zurück
+        count = 0
+        for seq in range(max(start, self.tail), self.head):
+            record = self._read_slot(seq)
+            if record is None or not record[7] & FLAG_UNSYNCED:
+                continue
+            _, ts, mid, temp, hum, pres, gas, flags = record
+            self._write_slot(seq, epoch(ts), mid, temp / 100, hum / 100, pres / 100, gas,
+                             flags & ~FLAG_UNSYNCED)
+            count += 1
+        return count
+
+    def drop(self, count):
+        # Nach bestätigtem Versand die mit peek(count) gelesenen Sätze freigeben
+        self.tail = min(self.tail + count, self.head)
+        self._write_header()
+
+    def close(self):
+        self._f.close()
@@ -0,0 +1,111 @@
+import time
+from wire import Message
+
+# ===============================
+# Uplink: Datensätze bündeln
+# ===============================
+# Statt jede Messung einzeln zu verschicken (eine TLS-Sitzung pro Minute), wird
+# gesendet, sobald
+#   - max_records Datensätze im Cache liegen, oder
+#   - der älteste Datensatz max_age Sekunden alt ist, oder
+#   - die Nutzlast voraussichtlich max_bytes erreicht.
+# Dann wird der ganze Cache geleert, aufgeteilt in Nachrichten von höchstens
+# max_message Bytes. Ein Datensatz verlässt den Cache erst nach bestätigtem Versand.
+#
+# Die Nachricht wird nie am Stück im RAM gebaut: send() bekommt einen CacheReader,
+# der die Datensätze beim Lesen (readinto) einzeln vom Flash holt und im gewählten
+# Übertragungsformat (wire.py) in den Puffer des Aufrufers schreibt. Der
+# Speicherbedarf hängt so weder von der Größe des Rückstaus noch von max_message ab.
+# Liegen mindestens compress_min Datensätze im Cache (Rückstau nach einem Ausfall),
+# wird die Nachricht gepackt.
+
+
+class CacheReader:
+    # Nachricht aus den ältesten Datensätzen; die Formate halten Zeilen unter den
+    # 998 Zeichen, die SMTP erlaubt
+    def __init__(self, cache, message, max_message):
+        self.cache = cache
+        self.message = message  # wire.Message
+        self.headers = message.headers
+        self.max_message = max_message
+        self.slots = 0    # gelesene Plätze im Cache (inkl. defekter Sätze)
+        self.records = 0  # gesendete Datensätze
+        self.size = 0     # Bytes der Nutzlast
+        self._pending = memoryview(message.begin())
+        self._done = False
+
+    def readinto(self, buf):
+        n = 0
+        while n < len(buf):
+            if not len(self._pending):
+                if self._done:
+                    break
+                self._pending = memoryview(self._next())
+            take = min(len(buf) - n, len(self._pending))
+            buf[n:n + take] = self._pending[:take]
+            self._pending = self._pending[take:]
+            n += take
+            self.size += take  # gleich mitzählen, _next() prüft damit die Grenze
+        return n
+
+    def _next(self):
+        while self.slots < len(self.cache):
+            record = self.cache.read(self.slots)
+            if record is None:
+                self.slots += 1
+                continue
+            if self.records and self.size + self.message.held + self.message.reserve > self.max_message:
+                if self.message.held:
+                    # Der Packer hält noch Daten zurück: ausgeben, dann genau messen
+                    return self.message.sync()
+                break
+            self.slots += 1
+            self.records += 1
+            return self.message.row(record)
+        self._done = True
+        return self.message.end()
+
+
+class UplinkBatcher:
+    def __init__(self, cache, send, fmt, max_records=60, max_age=3600,
+                 max_bytes=8000, max_message=16000, compress_min=0):
+        self.cache = cache
+        self.send = send        # send(reader) -> True bei Erfolg, liest reader.readinto()
+        self.fmt = fmt          # Übertragungsformat aus wire.py
+        self.max_records = max_records
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_message = max_message
+        self.compress_min = compress_min  # 0 = nie packen
+        self.record_bytes = fmt.reserve // 2  # Schätzwert, wird beim Senden nachgeführt
+
+    def due(self, now=None):
+        count = len(self.cache)
+        if count == 0:
+            return False
+        if count >= self.max_records:
+            return True
+        if count * self.record_bytes >= self.max_bytes:
+            return True
+        oldest = self.cache.read(0)
+        if now is None:
+            now = time.time()
+        return oldest is None or now - oldest[0] >= self.max_age
+
+    def flush(self, weiter=None):
+        # Cache in Nachrichten aufgeteilt senden; gibt Anzahl gesendeter Datensätze zurück.
+        # weiter() wird vor jeder Nachricht gefragt, False hebt den Rest für später auf
+        sent = 0
+        while len(self.cache) and (weiter is None or weiter()):
+            # Defekte Sätze am Anfang verwerfen, damit keine leere Nachricht entsteht
+            if self.cache.read(0) is None:
+                self.cache.drop(1)
+                continue
+            compress = self.compress_min and len(self.cache) >= self.compress_min
+            reader = CacheReader(self.cache, Message(self.fmt, compress), self.max_message)
+            if not self.send(reader) or not reader.records:
+                break
+            self.cache.drop(reader.slots)
+            sent += reader.records
+            self.record_bytes = reader.size // reader.records
+        return sent
@@ -0,0 +1,281 @@
+import io
+try:
+    from ubinascii import b2a_base64
+except ImportError:
+    from binascii import b2a_base64
+
+try:
+    import deflate  # MicroPython >= 1.21
+    zlib = None
+except ImportError:
+    deflate = None
+    try:
+        import zlib
+    except ImportError:
+        zlib = None
+
+COMPRESSION = deflate is not None or zlib is not None
+
+# ===============================
+# Übertragungsformate
+# ===============================
+# Jedes Format kodiert die Datensätze aus dem Cache (ts, mid, temperatur, feuchte,
+# druck, gas, flags) Zeile für Zeile, damit der CacheReader sie direkt in den
+# Socket streamen kann:
+#   begin()      Anfang der Nutzlast (setzt den Zustand zurück)
+#   row(record)  ein Datensatz
+#   end()        Abschluss der Nutzlast
+#   binary       Nutzlast ist kein Text
+#   reserve      höchstens so viele Bytes kosten row() + end() zusammen
+#
+# Message legt die Übertragung darum: Text geht unverändert, Binärdaten als Base64.
+# Mit compress wird die Nutzlast vorher mit deflate (zlib-Format) gepackt und als
+# application/zlib in Base64 gesendet; das lohnt sich bei großen Rückständen.
+# Der Packer darf Ausgabe zurückhalten: held schätzt sie nach oben ab, sync() gibt
+# sie aus, damit der CacheReader die Größe der Nachricht genau messen kann.
+#
+# Version 1: JSON-Liste von Objekten (bisheriges Format)
+# Version 2: JSON, Spalten einmal, Zeitstempel als Basis t0 + Differenz zur
+#            Vorzeile, Messwerte als skalierte Ganzzahlen (x100) und Differenz
+#            zur letzten Zeile desselben Sensors:
+#              {"v":2,"t0":1700000000,"cols":[...],"rows":[[1,0,2137,4550,101325,123456,0],
+#              [2,0,2140,4480,101330,98765,0],
+#              [1,60,2,-10,3,-120,0]]}
+# Version 3: dieselben Zeilen als Binärdaten (zigzag-Varints):
+#              b"WS" 0x03, dann pro Zeile mid, dt, temperatur, feuchte, druck, gas, flags
+#            Die erste Zeile trägt dt relativ zu 0, also den vollen Zeitstempel.
+# Der Server (mail_to_db.py) wählt den Decoder über die Version.
+
+COLUMNS = ("mid", "dt", "temperatur", "feuchte", "druck", "qualitaet", "flags")
+BINARY_MAGIC = b"WS"
+DEFLATE_WBITS = 10  # 1 KB Fenster, reicht für die sich wiederholenden Zeilen
+_B64_BLOCK = 57     # 57 Bytes -> eine Base64-Zeile mit 76 Zeichen
+
+
+def _scaled(record):
+    # Zeile als Ganzzahlen: mid, ts, temperatur*100, feuchte*100, druck Pa, gas, flags
+    ts, mid, temperatur, feuchte, druck, gas, flags = record
+    return (mid, ts, int(round(temperatur * 100)), int(round(feuchte * 100)),
+            int(round(druck * 100)), int(gas), flags)
+
+
+class _Delta:
+    # Differenzen: Zeitstempel zur Vorzeile, Messwerte zur letzten Zeile desselben Sensors
+    def begin(self, t0=0):
+        self._ts = t0
+        self._last = {}
+
+    def delta(self, record):
+        mid, ts, temp, hum, pres, gas, flags = _scaled(record)
+        values = (temp, hum, pres, gas)
+        last = self._last.get(mid)
+        self._last[mid] = values
+        dt = ts - self._ts
+        self._ts = ts
+        if last is None:
+            return mid, dt, temp, hum, pres, gas, flags
+        return (mid, dt, temp - last[0], hum - last[1], pres - last[2],
+                gas - last[3], flags)
+
+
+class JsonV1:
+    binary = False
+    reserve = 256
+
+    def __init__(self, encode):
+        self.encode = encode  # encode(datensatz) -> JSON-Text eines Datensatzes
+
+    def begin(self):
+        self._first = True
+        return b"["
+
+    def row(self, record):
+        part = self.encode(record).encode()
+        if self._first:
+            self._first = False
+            return part
+        return b",\r\n" + part
+
+    def end(self):
+        return b"]"
+
+
+class CompactV2(_Delta):
+    binary = False
+    reserve = 96
+
+    def begin(self):
+        self._first = True
+        return b""
+
+    def row(self, record):
+        if self._first:
+            # Kopf erst mit der ersten Zeile, er braucht deren Zeitstempel als t0
+            self._first = False
+            _Delta.begin(self, record[0])
+            return (self._head(record[0]) + self._format(self.delta(record))).encode()
+        return (",\r\n" + self._format(self.delta(record))).encode()
+
+    @staticmethod
+    def _head(t0):
+        return '{"v":2,"t0":%d,"cols":["%s"],"rows":[' % (t0, '","'.join(COLUMNS))
+
+    @staticmethod
+    def _format(row):
+        return "[%d,%d,%d,%d,%d,%d,%d]" % row
+
+    def end(self):
+        # Ohne Zeilen trotzdem vollständig, mit "cols" wie jede andere Nachricht
+        return b"]}" if not self._first else (self._head(0) + "]}").encode()
+
+
+class BinaryV3(_Delta):
+    binary = True
+    reserve = 64
+
+    def begin(self):
+        _Delta.begin(self)
+        return BINARY_MAGIC + b"\x03"
+
+    def row(self, record):
+        raw = bytearray()
+        mid, dt, temp, hum, pres, gas, flags = self.delta(record)
+        _varint(raw, mid)
+        for value in (dt, temp, hum, pres, gas):
+            _varint(raw, (value << 1) ^ (value >> 63))  # zigzag
+        _varint(raw, flags)
+        return raw
+
+    def end(self):
+        return b""
+
+
+class Message:
+    # Übertragung einer Nutzlast: Text direkt, sonst (optional gepackt) als Base64
+    def __init__(self, fmt, compress=False):
+        self.fmt = fmt
+        self._deflate = _Deflate() if compress and COMPRESSION else None
+        self._base64 = _Base64() if fmt.binary or self._deflate else None
+        if self._deflate:
+            self.headers = "Content-Type: application/zlib\r\nContent-Transfer-Encoding: base64\r\n"
+        elif fmt.binary:
+            self.headers = "Content-Type: application/octet-stream\r\nContent-Transfer-Encoding: base64\r\n"
+        else:
+            self.headers = "Content-Type: application/json\r\n"
+        self.reserve = fmt.reserve * 2 if self._base64 else fmt.reserve
+        self.held = 0  # höchstens so viele Bytes hält der Packer noch zurück
+
+    def begin(self):
+        self.held = 0
+        return self._out(self.fmt.begin())
+
+    def row(self, record):
+        return self._out(self.fmt.row(record))
+
+    def end(self):
+        data = self.fmt.end()
+        if self._deflate:
+            data = self._deflate.compress(data) + self._deflate.flush()
+            self.held = 0
+        if not self._base64:
+            return data
+        return self._base64.feed(data) + self._base64.finish()
+
+    def sync(self):
+        # Zurückgehaltene gepackte Daten ausgeben; danach ist held 0
+        self.held = 0
+        if not self._deflate:
+            return b""
+        return self._base64.feed(self._deflate.sync())
+
+    def _out(self, data):
+        if self._deflate:
+            # Unkomprimierbares wächst um ein paar Bytes je Block, Base64 samt
+            # Zeilenenden um 78/57: das Anderthalbfache reicht als Obergrenze
+            self.held += (len(data) + 8) * 3 // 2
+            data = self._deflate.compress(data)
+        return self._base64.feed(data) if self._base64 else data
+
+
+class _Base64:
+    # Base64 in Zeilen zu 76 Zeichen (SMTP: höchstens 998 Zeichen pro Zeile)
+    def __init__(self):
+        self._raw = bytearray()
+
+    def feed(self, data):
+        self._raw += data
+        return self._lines(len(self._raw) - len(self._raw) % _B64_BLOCK)
+
+    def finish(self):
+        return self._lines(len(self._raw))
+
+    def _lines(self, n):
+        if not n:
+            return b""
+        out = bytearray()
+        for i in range(0, n, _B64_BLOCK):
+            out += b2a_base64(self._raw[i:min(i + _B64_BLOCK, n)])[:-1]
+            out += b"\r\n"
+        self._raw = self._raw[n:]
+        return out
+
+
+class _Sink(io.IOBase):
+    # Nimmt die gepackten Bytes von deflate.DeflateIO entgegen
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, buf):
+        self.data += buf
+        return len(buf)
+
+
+class _Deflate:
+    # deflate.DeflateIO auf der Station, zlib auf dem Host; beide im zlib-Format
+    def __init__(self):
+        if deflate is not None:
+            self._sink = _Sink()
+            self._io = deflate.DeflateIO(self._sink, deflate.ZLIB, DEFLATE_WBITS)
+        else:
+            self._z = zlib.compressobj(9, zlib.DEFLATED, DEFLATE_WBITS)
+
+    def compress(self, data):
+        if deflate is None:
+            return self._z.compress(data)
+        self._io.write(data)
+        return self._take()
+
+    def flush(self):
+        if deflate is None:
+            return self._z.flush()
+        self._io.close()
+        return self._take()
+
+    def sync(self):
+        # Alles bisher Gepackte ausgeben, ohne den Strom zu beenden. DeflateIO gibt
+        # jedes fertige Byte sofort an _Sink weiter, zlib puffert bis zum Z_SYNC_FLUSH
+        if deflate is None:
+            return self._z.flush(zlib.Z_SYNC_FLUSH)
+        return self._take()
+
+    def _take(self):
+        data = self._sink.data
+        self._sink.data = bytearray()
+        return data
+
+
+def _varint(buf, value):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def make_format(version, encode=None):
+    if version == 1:
+        return JsonV1(encode)
+    if version == 2:
+        return CompactV2()
+    if version == 3:
+        return BinaryV3()
+    raise ValueError("unknown wire format %d" % version)
@@ -0,0 +1,146 @@
+# bench_adaptive.py - Host benchmark: adaptive sampling interval on a recorded trace
+# ===================================================================================
+#
+# Replays a trace of one sensor, recorded on the 20 s grid of READ_INTERVAL_MIN, through
+# sampling.py: the sampler reads the trace only in the slots AdaptiveInterval picks.
+# The same trace is sampled on the fixed 60 s grid of READ_INTERVAL for comparison.
+# Both series go through the swinging-door compressor like on the station, and every
+# slot of the trace is rebuilt by linear interpolation (rebuild.reconstruct()).
+# Reports per schedule:
+#   reads      sensor conversions
+#   kept       readings the compressor keeps (sent and cached)
+#   max error  worst distance of the rebuilt series from the trace, per channel
+#   in events  mean distance inside the events (shower, airing, front)
+#
+# Without a trace file a synthetic day is used: a quiet night, a shower, airing at
+# noon, a cold front in the afternoon. A recorded trace is a CSV file with one line
+# per grid slot: temperature,humidity,pressure,gas.
+#
+# The adaptive schedule must replay identically and need no more conversions and no
+# more kept readings than the fixed grid; on the synthetic day its worst temperature
+# and humidity error must not be larger either (pressure only moves slowly, its error
+# is the compression tolerance plus noise on both schedules).
+#
+# Usage (from this folder):
+#   python3 bench_adaptive.py [trace.csv]
+
+import sys
+import math
+import random
+
+import smtp_sim
+from rebuild import reconstruct
+
+smtp_sim.install()  # puts the Base - New firmware on sys.path
+from compressor import Compressor  # noqa: E402
+from sampling import AdaptiveInterval  # noqa: E402
+
+BASE = 20    # s, READ_INTERVAL_MIN
+FIXED = 60   # s, READ_INTERVAL
+MAX = 80     # s, READ_INTERVAL_MAX
+STEP = (0.2, 1.0, 0.2, 10000)        # SAMPLING_STEP
+TOLERANCE = (0.1, 0.5, 0.1, 5000)    # COMPRESS_TOLERANCE
+HEARTBEAT = 900
+CHANNELS = ("temperature", "humidity", "pressure", "gas")
+SHOWER = 7 + 37 / 3600   # h, onsets of the synthetic events, off any sampling grid
+AIRING = 12 + 83 / 3600
+FRONT = 16.0
+EVENTS = ((SHOWER, SHOWER + 1), (AIRING, AIRING + 1), (FRONT - 1, FRONT + 2))
+
+
+def synthetic_day(seed=1):
+    """One value tuple per grid slot of a day, with sensor noise."""
+    rnd = random.Random(seed)
+    trace = []
+    gas = 100000.0
+    for slot in range(86400 // BASE):
+        hour = slot * BASE / 3600
+        temp = 20.5 + 0.6 * math.sin(2 * math.pi * (hour - 10) / 24)
+        hum = 45.0
+        press = 1015.0
+        if hour >= SHOWER:  # humidity up within minutes, slowly back
+            hum += 30 * (1 - math.exp(-(hour - SHOWER) * 20)) * math.exp(-(hour - SHOWER) * 2.5)
+        if AIRING <= hour < AIRING + 0.2:  # window open: cold air
+            temp -= 4 * (1 - math.exp(-(hour - AIRING) * 30))
+            hum -= 10 * (1 - math.exp(-(hour - AIRING) * 30))
+        elif hour >= AIRING + 0.2:  # window closed, room warms up again
+            temp -= 4 * (1 - math.exp(-0.2 * 30)) * math.exp(-(hour - AIRING - 0.2) * 3)
+            hum -= 10 * (1 - math.exp(-0.2 * 30)) * math.exp(-(hour - AIRING - 0.2) * 3)
+        if hour >= FRONT - 1:  # cold front: pressure drops, temperature follows
+            front = 1 / (1 + math.exp(-(hour - FRONT) * 4))
+            press -= 5 * front
+            temp -= 1.5 * front
+        gas += rnd.gauss(0, 150) + (100000 - gas) * 0.001
+        trace.append((temp + rnd.gauss(0, 0.02), hum + rnd.gauss(0, 0.1),
+                      press + rnd.gauss(0, 0.02), int(gas)))
+    return trace
+
+
+def load(path):
+    with open(path) as f:
+        return [tuple(float(v) for v in line.split(",")) for line in f if line.strip()]
+
+
+def adaptive(trace):
+    """Slots read by AdaptiveInterval."""
+    pacer = AdaptiveInterval(BASE, MAX // BASE, STEP)
+    slots = []
+    slot = 0
+    while slot < len(trace):
+        slots.append(slot)
+        pacer.offer(slot * BASE, 1, trace[slot])
+        slot += pacer.next_slots()
+    return slots
+
+
+def replay(name, trace, slots):
+    compressor = Compressor("swing", TOLERANCE, HEARTBEAT)
+    kept = []
+    for slot in slots:
+        for ts, _, values, _ in compressor.offer(slot * BASE, 1, trace[slot]):
+            kept.append((ts, values))
+    worst = [0.0] * len(CHANNELS)
+    event_sum = [0.0] * len(CHANNELS)
+    event_slots = 0
+    for slot, values in enumerate(trace):
+        rebuilt = reconstruct(kept, slot * BASE)
+        if rebuilt is None:
+            continue
+        hour = slot * BASE / 3600
+        in_event = any(a <= hour < b for a, b in EVENTS)
+        event_slots += in_event
+        for i in range(len(CHANNELS)):
+            error = abs(rebuilt[i] - values[i])
+            worst[i] = max(worst[i], error)
+            if in_event:
+                event_sum[i] += error
+    event_mean = [e / max(event_slots, 1) for e in event_sum]
+    print("%-9s %6d %6d   %s   %s" % (
+        name, len(slots), len(kept),
+        " ".join("%6.2f" % e for e in worst[:3]),
+        " ".join("%6.3f" % e for e in event_mean[:3])))
+    return len(kept), worst
+
+
+def main():
+    trace = load(sys.argv[1]) if len(sys.argv) > 1 else synthetic_day()
+    print("%d slots of %d s (%.1f h)" % (len(trace), BASE, len(trace) * BASE / 3600))
+    print("%-9s %6s %6s   %-20s   %-20s" % ("schedule", "reads", "kept",
+                                            "max error t/h/p", "in events t/h/p"))
+    slots = adaptive(trace)
+    assert slots == adaptive(trace), "adaptive schedule not deterministic"
+    fixed = list(range(0, len(trace), FIXED // BASE))
+    kept_fixed, worst_fixed = replay("fixed", trace, fixed)
+    kept_adaptive, worst_adaptive = replay("adaptive", trace, slots)
+
+    assert len(slots) <= len(fixed), "adaptive: %d reads, fixed %d" % (len(slots), len(fixed))
+    assert kept_adaptive <= kept_fixed, "adaptive: %d kept, fixed %d" % (kept_adaptive, kept_fixed)
+    if len(sys.argv) == 1:
+        for i in range(2):
+            assert worst_adaptive[i] <= worst_fixed[i], "%s: off by %.2f, fixed %.2f" % (
+                CHANNELS[i], worst_adaptive[i], worst_fixed[i])
+    print("ok: %d instead of %d reads, %d instead of %d kept" % (
+        len(slots), len(fixed), kept_adaptive, kept_fixed))
+
+
+main()
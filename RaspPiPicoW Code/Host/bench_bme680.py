@@ -0,0 +1,228 @@
+# bench_bme680.py - Host benchmark for the BME680 driver
+# =======================================================
+#
+# Runs the driver against the register emulator in bme680_sim.py and reports per sample:
+#   wall us    real time spent in the driver (conversion waits excluded, see below)
+#   sensor ms  conversion and heater time the driver waited for (virtual clock)
+#   bus tx     bus transactions
+#   bytes      bytes moved over the bus
+#   heap B     heap use: bytes allocated (MicroPython, gc.mem_alloc with GC off) or
+#              the transient tracemalloc peak (CPython)
+#
+# Asserted: a read_all() sample takes 2 bus transactions on I2C and on SPI (one config
+# write that starts the conversion, one status/data read; the SPI page stays selected).
+#
+# Then checks that the read_all() paths allocate flat, asserted:
+#   retained   heap still in use after a collection must not grow with the number of samples
+#              (FLAT_SLACK covers counters of the driver and emulator that grow by a digit)
+#   per sample bytes a sample allocates (result kept, GC off on MicroPython) must not grow
+#              from the first to the second half of the run
+#
+# And that a configuration write that fails on the bus (raised on I2C, swallowed on SPI)
+# leaves no stale shadow copy behind: the next reading must write the changed register.
+#
+# Usage (from this folder):
+#   python3 bench_bme680.py [samples]
+#   micropython bench_bme680.py [samples]
+
+import sys
+import gc
+import time
+
+import bme680_sim
+
+clock = bme680_sim.install()
+import bme680  # noqa: E402
+bme680.time = clock
+
+try:
+    _perf_us = time.ticks_us
+    _perf_diff = time.ticks_diff
+except AttributeError:
+    def _perf_us():
+        return int(time.perf_counter() * 1000000)
+
+    def _perf_diff(a, b):
+        return a - b
+
+READ_ALL_TRANSACTIONS = 2  # config write with the mode, status/data read
+FLAT_SLACK = 128  # bytes
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def _heap_begin():
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        return gc.mem_alloc()
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _heap_end(start):
+    if hasattr(gc, "mem_alloc"):
+        used = gc.mem_alloc() - start
+        gc.enable()
+        return used
+    return tracemalloc.get_traced_memory()[1] - start
+
+
+def _i2c_sensor(**kwargs):
+    sim = bme680_sim.BME680Sim(clock)
+    sim.set_environment(21.5, 45.0, 1013.25, 80000)
+    bus = bme680_sim.FakeI2C({0x77: sim})
+    return bme680.BME680_I2C(bus, refresh_rate=1000, **kwargs), bus
+
+
+def _spi_sensor(**kwargs):
+    sim = bme680_sim.BME680Sim(clock)
+    sim.set_environment(21.5, 45.0, 1013.25, 80000)
+    bus = bme680_sim.FakeSPI(sim)
+    return bme680.BME680_SPI(bus, bus.cs, refresh_rate=1000, **kwargs), bus
+
+
+def _properties(sensor):
+    return (sensor.temperature, sensor.humidity, sensor.pressure, sensor.gas)
+
+
+def _read_all(sensor):
+    return sensor.read_all()
+
+
+def _compensate(sensor):
+    return sensor._make_reading()
+
+
+def run(name, make, sample, samples, **kwargs):
+    """Time ``sample(sensor)``, print one result row and return bus transactions per sample."""
+    sensor, bus = make(**kwargs)
+    sensor.read_all()  # warm up: first config write, caches
+    bus.reset_counters()
+    slept = clock.slept_us
+    wall = heap = 0
+    for _ in range(samples):
+        start = _heap_begin()
+        t0 = _perf_us()
+        sample(sensor)
+        wall += _perf_diff(_perf_us(), t0)
+        heap = max(heap, _heap_end(start))
+    print("{:<30} {:>9.0f} {:>10.1f} {:>7.1f} {:>7.1f} {:>7}".format(
+        name, wall / samples, (clock.slept_us - slept) / samples / 1000,
+        bus.transactions / samples, bus.bytes_moved / samples, heap))
+    return bus.transactions / samples
+
+
+def _retained():
+    gc.collect()
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _allocated(sensor):
+    """Bytes one read_all() allocates, its result included."""
+    if hasattr(gc, "mem_alloc"):
+        gc.disable()
+        start = gc.mem_alloc()
+        reading = sensor.read_all()
+        used = gc.mem_alloc() - start
+        gc.enable()
+    else:
+        start = tracemalloc.get_traced_memory()[0]
+        reading = sensor.read_all()
+        used = tracemalloc.get_traced_memory()[0] - start
+    del reading
+    return used
+
+
+def check_flat(name, make, samples, **kwargs):
+    """Assert that read_all() neither keeps heap nor allocates more per sample over time."""
+    sensor, _ = make(**kwargs)
+    sensor.read_all()
+    first = second = 0
+    start = _retained()
+    for _ in range(samples):
+        first = max(first, _allocated(sensor))
+    middle = _retained()
+    for _ in range(samples):
+        second = max(second, _allocated(sensor))
+    grown = _retained() - middle
+    print("{:<30} {:>9} {:>10} {:>9}".format(name, middle - start, grown, second))
+    assert grown <= FLAT_SLACK, "%s: %d bytes kept over %d samples" % (name, grown, samples)
+    assert second <= first, "%s: %d bytes per sample, first %d" % (name, second, first)
+
+
+def _decimated():
+    sensor, bus = _i2c_sensor(integer_math=True)
+    sensor.gas_every = 10
+    return sensor, bus
+
+
+def check_failed_write(name, make, write):
+    """Fail the bus write that carries a changed CTRL_HUM once, then check the next
+    reading writes it again."""
+    sensor, bus = make()
+    sensor.read_all()
+    sensor.humidity_oversample = 16
+    bus_write = getattr(bus, write)
+
+    def _failing(*args):
+        setattr(bus, write, bus_write)
+        raise OSError(5)  # EIO
+
+    setattr(bus, write, _failing)
+    try:
+        sensor.start_measurement()
+    except OSError:
+        pass
+    assert getattr(bus, write) is bus_write, "%s: the write did not go out" % name
+    sensor.read_all()
+    hum = bus.devices[0x77].mem[0x72] if write == "writeto" else bus.device.mem[0x72]
+    print("{:<30} {:>9}".format(name, "ctrl_hum %d" % hum))
+    assert hum == sensor._humidity_oversample, "%s: CTRL_HUM skipped after a failed write" % name
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    if tracemalloc is not None and not hasattr(gc, "mem_alloc"):
+        tracemalloc.start()
+    print("{:<30} {:>9} {:>10} {:>7} {:>7} {:>7}".format(
+        "path", "wall us", "sensor ms", "bus tx", "bytes", "heap B"))
+    run("i2c properties x4 (float)", _i2c_sensor, _properties, samples)
+    transactions = {
+        "i2c read_all (float)": run("i2c read_all (float)", _i2c_sensor, _read_all, samples),
+        "i2c read_all (int)": run("i2c read_all (int)", _i2c_sensor, _read_all, samples,
+                                  integer_math=True),
+        "i2c read_all (int, gas 1/10)": run("i2c read_all (int, gas 1/10)", _decimated,
+                                            _read_all, samples),
+        "spi read_all (float)": run("spi read_all (float)", _spi_sensor, _read_all, samples),
+        "spi read_all (int)": run("spi read_all (int)", _spi_sensor, _read_all, samples,
+                                  integer_math=True),
+    }
+    run("compensation only (float)", _i2c_sensor, _compensate, samples)
+    run("compensation only (int)", _i2c_sensor, _compensate, samples, integer_math=True)
+    for name, count in transactions.items():
+        assert count == READ_ALL_TRANSACTIONS, "%s: %.2f bus transactions per sample" % (
+            name, count)
+
+    print()
+    print("{:<30} {:>9} {:>10} {:>9}".format("read_all", "kept B", "then B", "sample B"))
+    check_flat("i2c (float)", _i2c_sensor, samples)
+    check_flat("i2c (int)", _i2c_sensor, samples, integer_math=True)
+    check_flat("i2c (int, gas 1/10)", _decimated, samples)
+    check_flat("spi (float)", _spi_sensor, samples)
+    check_flat("spi (int)", _spi_sensor, samples, integer_math=True)
+
+    print()
+    check_failed_write("i2c failed config write", _i2c_sensor, "writeto")
+    check_failed_write("spi failed config write", _spi_sensor, "write")
+    print("ok: read_all() takes %d bus transactions and allocates flat, nothing kept "
+          "per sample; a failed config write is repeated" % READ_ALL_TRANSACTIONS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# bench_bme680_int.py - Host check: the BME680 integer engine against Bosch and the float engine
+# =============================================================================================
+#
+# Three checks of the integer compensation (integer_math=True), all asserted:
+#   vectors    raw ADC values with Bosch's integer results computed with 64 bit arithmetic
+#              (bme680.c); temperature, humidity and pressure must match exactly, gas
+#              within 1 ohm + 1e-4 (the pre-scaled tables round differently)
+#   vs float   a sweep over the sensor's range (-40..85 degrees, 0..100 %RH, 300..1100 hPa,
+#              all 16 gas ranges) comparing both engines of the driver
+#   small int  no value computed while compensating may leave MicroPython's small int
+#              range (+-2**30), or the RP2040 allocates a long per step: on CPython every
+#              intermediate is traced, under MicroPython the heap must not grow
+#
+# The float engine's humidity is a float port of Bosch's integer formula and drifts by up
+# to ~1.2 %RH above 60 degrees; the integer engine stays on Bosch's values there.
+#
+# Usage (from this folder):
+#   python3 bench_bme680_int.py
+#   micropython bench_bme680_int.py
+
+import gc
+
+import bme680_sim
+
+clock = bme680_sim.install()
+import bme680  # noqa: E402
+bme680.time = clock
+
+SMALL_INT = 1 << 30
+
+# (adc_temp, adc_pres, adc_hum, adc_gas, gas_range) -> temperature 1/100 degrees,
+# humidity 1/1000 %RH, pressure Pa, gas ohms; calibration bme680_sim.CALIBRATION
+VECTORS = (
+    ((291226, 742975, 12624, 244, 1), (-4000, 0, 29999, 5000000)),
+    ((291226, 229278, 30468, 481, 13), (-4000, 100000, 109996, 1000)),
+    ((386228, 415800, 19320, 832, 5), (-1000, 29994, 85001, 200015)),
+    ((417888, 326620, 27335, 858, 7), (0, 80002, 101321, 49992)),
+    ((485947, 347583, 21532, 230, 7), (2150, 44994, 101321, 79969)),
+    ((497024, 387242, 23852, 568, 6), (2500, 59982, 94997, 119986)),
+    ((544496, 541330, 16776, 959, 1), (4000, 20001, 69999, 2999440)),
+    ((607778, 362140, 27140, 219, 9), (6000, 90000, 105002, 19998)),
+    ((686863, 674035, 13558, 0, 0), (8500, 5003, 50000, 12946860)),
+    ((686863, 357051, 27680, 1023, 15), (8500, 99956, 109998, 177)),
+)
+
+FLOAT_TOLERANCE = (0.01, 1.5, 0.1)  # degrees, %RH, hPa; gas: 1 ohm + 1e-4 of the value
+GAS_TOLERANCE = 1e-4
+
+# A second part with larger coefficients, for the small int sweep
+CALIBRATION_2 = dict(bme680_sim.CALIBRATION, par_t1=27500, par_t2=27900, par_t3=5,
+                     par_p1=39000, par_p2=-11200, par_p3=95, par_p4=7600, par_p5=-120,
+                     par_p6=40, par_p7=60, par_p8=-3100, par_p9=-2600, par_p10=40,
+                     par_h1=840, par_h2=1080, par_h6=130, par_h7=-110, range_sw_err=-3)
+
+
+def sensors(calibration=None):
+    """An integer and a float driver on the same emulated sensor."""
+    sim = bme680_sim.BME680Sim(clock, calibration)
+    bus = bme680_sim.FakeI2C({0x77: sim})
+    return (sim, bme680.BME680_I2C(bus, refresh_rate=1000, integer_math=True),
+            bme680.BME680_I2C(bus, refresh_rate=1000))
+
+
+def compensate_int(sensor):
+    sensor._perform_reading()
+    return (sensor._calc_temperature_int(), sensor._calc_humidity_int(),
+            sensor._calc_pressure_int(), sensor._calc_gas_int())
+
+
+def check_vectors():
+    sim, sensor, _ = sensors()
+    for adc, expected in VECTORS:
+        sim.set_adc(*adc)
+        got = compensate_int(sensor)
+        assert got[:3] == expected[:3], "adc %r: %r, Bosch %r" % (adc, got, expected)
+        assert abs(got[3] - expected[3]) <= 1 + GAS_TOLERANCE * expected[3], \
+            "adc %r: gas %d, Bosch %d" % (adc, got[3], expected[3])
+    print("vectors:   %d ADC sets match Bosch's integer results" % len(VECTORS))
+
+
+def check_float():
+    sim, int_sensor, float_sensor = sensors()
+    worst = [0.0] * 4
+    count = 0
+    for temperature in range(-40, 86, 5):
+        for humidity in (0, 25, 50, 75, 100):
+            for pressure in range(300, 1101, 100):
+                sim.set_environment(temperature, humidity, pressure, 80000)
+                int_sensor._perform_reading()
+                float_sensor._perform_reading()
+                a = int_sensor._make_reading()
+                b = float_sensor._make_reading()
+                for i in range(3):
+                    worst[i] = max(worst[i], abs(a[i] - b[i]))
+                    assert worst[i] <= FLOAT_TOLERANCE[i], "%r: %r vs float %r" % (
+                        (temperature, humidity, pressure), a, b)
+                count += 1
+    for gas_range in range(16):
+        for adc_gas in range(0, 1024, 3):
+            sim.set_adc(sim.adc_temp, sim.adc_pres, sim.adc_hum, adc_gas, gas_range)
+            int_sensor._perform_reading()
+            float_sensor._perform_reading()
+            a = int_sensor._calc_gas()
+            b = float_sensor._calc_gas()
+            worst[3] = max(worst[3], (abs(a - b) - 1) / b)
+            assert abs(a - b) <= 1 + GAS_TOLERANCE * b, "gas range %d adc %d: %d vs float %d" % (
+                gas_range, adc_gas, a, b)
+            count += 1
+    print("vs float:  %d readings, worst %.4f degrees %.3f %%RH %.4f hPa, gas 1 ohm + %.1e" % (
+        count, worst[0], worst[1], worst[2], worst[3]))
+
+
+def sweep(calibration):
+    """Environments over the sensor's range, and every gas range and ADC value."""
+    sim, sensor, _ = sensors(calibration)
+    for temperature in range(-40, 86, 5):
+        for humidity in (0, 50, 100):
+            for pressure in (300, 500, 700, 900, 1013, 1100):
+                sim.set_environment(temperature, humidity, pressure, 80000)
+                yield sensor
+    for gas_range in range(16):
+        for adc_gas in range(0, 1024, 31):
+            sim.set_adc(sim.adc_temp, sim.adc_pres, sim.adc_hum, adc_gas, gas_range)
+            yield sensor
+
+
+def check_small_int():
+    for name in ("_LOOKUP_TABLE_1_INT", "_LOOKUP_TABLE_2_INT"):
+        assert max(getattr(bme680, name)) < SMALL_INT, name
+    if hasattr(gc, "mem_alloc"):
+        check_heap()
+    else:
+        check_traced()
+
+
+def check_heap():
+    """MicroPython: compensating must not allocate."""
+    for calibration in (None, CALIBRATION_2):
+        for sensor in sweep(calibration):
+            sensor._perform_reading()
+            gc.collect()
+            gc.disable()
+            start = gc.mem_alloc()
+            sensor._t_fine = sensor._calc_t_fine_int()
+            sensor._calc_temperature_int()
+            sensor._calc_humidity_int()
+            sensor._calc_pressure_int()
+            sensor._calc_gas_int()
+            used = gc.mem_alloc() - start
+            gc.enable()
+            assert not used, "compensation allocated %d bytes" % used
+    print("small int: integer compensation allocates nothing")
+
+
+class _Traced(int):
+    """int that records the largest value any arithmetic on it produces."""
+    largest = 0
+
+
+def _traced_op(name):
+    op = getattr(int, name)
+
+    def traced(self, *args):
+        value = op(self, *args)
+        if isinstance(value, int) and not isinstance(value, bool):
+            _Traced.largest = max(_Traced.largest, abs(value))
+            return _Traced(value)
+        return value
+    return traced
+
+
+for _name in ("add", "radd", "sub", "rsub", "mul", "rmul", "floordiv", "rfloordiv", "lshift",
+              "rlshift", "rshift", "rrshift", "and", "rand", "or", "ror", "neg", "abs"):
+    setattr(_Traced, "__%s__" % _name, _traced_op("__%s__" % _name))
+
+
+def check_traced():
+    """CPython: run the compensation on traced ints and look at every intermediate."""
+    for calibration in (None, CALIBRATION_2):
+        for sensor in sweep(calibration):
+            sensor._perform_reading()
+            for name in ("_temp_calibration_int", "_pressure_calibration_int",
+                         "_humidity_calibration_int"):
+                setattr(sensor, name, tuple(_Traced(v) for v in getattr(sensor, name)))
+            for name in ("_adc_temp", "_adc_pres", "_adc_hum", "_adc_gas", "_range_sw_err"):
+                setattr(sensor, name, _Traced(getattr(sensor, name)))
+            sensor._t_fine = sensor._calc_t_fine_int()
+            sensor._calc_temperature_int()
+            sensor._calc_humidity_int()
+            sensor._calc_pressure_int()
+            sensor._calc_gas_int()
+    assert _Traced.largest < SMALL_INT, "intermediate %d beyond +-2**30" % _Traced.largest
+    print("small int: largest intermediate %d (%.2f of 2**30)" % (
+        _Traced.largest, _Traced.largest / SMALL_INT))
+
+
+def main():
+    check_vectors()
+    check_float()
+    check_small_int()
+    print("ok: integer engine matches Bosch, stays within float tolerance and in small ints")
+
+
+main()
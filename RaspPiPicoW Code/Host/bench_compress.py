@@ -0,0 +1,115 @@
+# bench_compress.py - Host benchmark: deadband and swinging-door compression of a day
+# ====================================================================================
+#
+# Feeds a synthetic indoor day (two sensors, one reading a minute: daily temperature
+# swing, heating and airing steps, a shower on the humidity, slow pressure drift, gas
+# wandering with the air) through compressor.py in both modes, stores the kept readings
+# in a RingCache like the station does, and rebuilds every minute of the day from the
+# cache with rebuild.reconstruct(). Reports per mode:
+#   kept       readings stored (and sent) of those taken
+#   cache B    bytes of cache records written
+#   max error  worst distance of a rebuilt value from the reading, per channel
+#   max gap s  longest time between two kept readings of one sensor
+#
+# Every reading must come back within its tolerance (plus the rounding of the cache),
+# no sensor may stay silent longer than the heartbeat, and each mode must keep less
+# than half of the readings.
+#
+# Usage (from this folder):
+#   python3 bench_compress.py [minutes]
+
+import sys
+import os
+import math
+import random
+
+import smtp_sim
+from rebuild import reconstruct
+
+smtp_sim.install()  # puts the Base - New firmware on sys.path
+from compressor import Compressor  # noqa: E402
+import ringcache  # noqa: E402
+
+CACHE_FILE = "/tmp/bench_compress.bin"
+INTERVAL = 60
+TOLERANCE = (0.1, 0.5, 0.1, 5000)  # as in config.py / main.py
+HEARTBEAT = 900
+QUANTUM = (0.005, 0.005, 0.005, 1)  # cache rounding: 1/100 °C, %, hPa and whole Ohms
+CHANNELS = ("temperature", "humidity", "pressure", "gas")
+
+
+def day(minutes, seed=1):
+    """Readings (ts, mid, (temp, hum, press, gas)) of two sensors in one room."""
+    rnd = random.Random(seed)
+    readings = []
+    gas = [90000.0, 120000.0]
+    for m in range(minutes):
+        ts = m * INTERVAL
+        hour = ts / 3600 % 24
+        heating = 1.5 if 6 <= hour < 22 else 0.0
+        airing = -2.0 if 12 <= hour < 12.25 else 0.0
+        shower = 25.0 * math.exp(-(hour - 7) * 3) if hour >= 7 else 0.0
+        for mid in (1, 2):
+            temp = 19.0 + heating + airing + 0.8 * math.sin(2 * math.pi * (hour - 15) / 24)
+            temp += mid * 0.3 + rnd.gauss(0, 0.02)
+            hum = 45.0 + 3 * math.sin(2 * math.pi * hour / 24) + rnd.gauss(0, 0.1)
+            if mid == 2:
+                hum += shower
+            press = 1013.0 + 2.0 * math.sin(2 * math.pi * ts / (3 * 86400)) + rnd.gauss(0, 0.02)
+            gas[mid - 1] += rnd.gauss(0, 400) + (100000 - gas[mid - 1]) * 0.002
+            readings.append((ts, mid, (temp, hum, press, int(gas[mid - 1]))))
+    return readings
+
+
+def run(mode, readings):
+    if os.path.exists(CACHE_FILE):
+        os.remove(CACHE_FILE)
+    cache = ringcache.RingCache(CACHE_FILE, len(readings))
+    compressor = Compressor(mode, TOLERANCE, HEARTBEAT)
+    for ts, mid, values in readings:
+        for kept_ts, kept_mid, (temp, hum, press, gas), flags in compressor.offer(ts, mid, values):
+            cache.append(kept_ts, kept_mid, temp, hum, press, int(gas + 0.5), flags)
+    records = cache.peek(len(cache))
+    cache.close()
+    os.remove(CACHE_FILE)
+    assert len(records) == compressor.kept
+
+    kept = {}
+    for ts, mid, temp, hum, press, gas, flags in records:
+        kept.setdefault(mid, []).append((ts, (temp, hum, press, gas)))
+    worst = [0.0] * len(CHANNELS)
+    for ts, mid, values in readings:
+        if ts > kept[mid][-1][0]:
+            continue  # after the last kept reading: still pending on the station
+        rebuilt = reconstruct(kept[mid], ts, linear=mode == "swing")
+        for i in range(len(CHANNELS)):
+            worst[i] = max(worst[i], abs(rebuilt[i] - values[i]))
+    gap = max(b[0] - a[0] for points in kept.values() for a, b in zip(points, points[1:]))
+
+    print("%-9s %5d/%-5d %5.1f%% %8d   %s %7d" % (
+        mode, compressor.kept, compressor.offered, 100 * compressor.kept / compressor.offered,
+        compressor.kept * ringcache._RECORD_SIZE,
+        " ".join("%8.3f" % e for e in worst), gap))
+    for i, name in enumerate(CHANNELS):
+        assert worst[i] <= TOLERANCE[i] + QUANTUM[i] + 1e-9, \
+            "%s: %s off by %.3f" % (mode, name, worst[i])
+    assert gap <= HEARTBEAT, "%s: silent for %d s" % (mode, gap)
+    assert compressor.kept < compressor.offered / 2, "%s: kept %d of %d" % (
+        mode, compressor.kept, compressor.offered)
+    return compressor.kept
+
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 1440
+    readings = day(minutes)
+    print("%d readings of 2 sensors, tolerance %s, heartbeat %d s" % (
+        len(readings), TOLERANCE, HEARTBEAT))
+    print("%-9s %11s %6s %8s   %8s %8s %8s %8s %7s" % (
+        "mode", "kept", "", "cache B", "temp", "hum", "press", "gas", "gap s"))
+    kept = {mode: run(mode, readings) for mode in ("deadband", "swing")}
+    print("ok: every reading rebuilt within tolerance, %.0f%% (deadband) and %.0f%% "
+          "(swing) of the readings kept" % (100 * kept["deadband"] / len(readings),
+                                           100 * kept["swing"] / len(readings)))
+
+
+main()
@@ -0,0 +1,156 @@
+# bench_drain.py - Host benchmark: draining a backlog end to end, with and without deflate
+# ========================================================================================
+#
+# Drains a 10k-record backlog from a RingCache through UplinkBatcher and umail into the
+# SMTP stand-in, then ingests every accepted message the way mail_to_db.py does
+# (email.message_from_bytes, part_payload, decode_payload), for each wire format with
+# compression off and on. Reports per variant:
+#   wire B     bytes umail wrote to the socket (SMTP commands, headers and body; the TLS
+#              record overhead comes on top)
+#   msgs       emails needed
+#   encode s   host time to encode, compress and send (the Pico is much slower, run
+#              under the MicroPython Unix port for a closer figure)
+#   link s     modelled upload: wire bytes at LINK_RATE plus round trips at LINK_RTT
+#   ingest s   host time for the server side
+#   total s    end to end
+#
+# Every variant must deliver every record unchanged, and no message may carry more than
+# MAX_MESSAGE bytes of payload (with deflate too, where zlib holds output back). A
+# message without rows must decode to no records in every format.
+#
+# Usage (from this folder):
+#   python3 bench_drain.py [records] [link bytes/s] [rtt ms]
+
+import sys
+import os
+import json
+import time
+import email
+
+import smtp_sim
+
+server = smtp_sim.install(pipelining=True)
+import umail  # noqa: E402
+import mail_to_db  # noqa: E402
+from ringcache import RingCache  # noqa: E402
+from uplink import UplinkBatcher  # noqa: E402
+from wire import make_format, COLUMNS  # noqa: E402
+umail.socket = server.socket_module()
+umail.ssl_wrap_socket = server.wrap_socket
+
+CACHE_FILE = "/tmp/bench_drain.bin"
+LINK_RATE = 50000   # bytes/s the Pico W gets through TLS over Wi-Fi
+LINK_RTT = 0.05     # s
+MAX_MESSAGE = 20000  # payload bytes per email, small enough that every variant splits
+
+
+def encode(record):
+    # Same shape as record_to_dict() in main.py
+    ts, mid, temperatur, feuchte, druck, gas, flags = record
+    return json.dumps({
+        "mid": mid,
+        "temperatur": temperatur,
+        "feuchte": feuchte,
+        "druck": druck,
+        "qualitaet": gas,
+        "timestamp": ts
+    })
+
+
+def backlog(records):
+    # Two sensors drifting slowly, one reading per sensor and minute
+    rows = []
+    seed = 12345
+    values = {1: [21.37, 45.5, 1013.25, 123456], 2: [19.80, 52.1, 1013.31, 98765]}
+    for i in range(records):
+        mid = 1 + (i & 1)
+        v = values[mid]
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        v[0] = round(v[0] + ((seed >> 4) % 5 - 2) / 100, 2)
+        v[1] = round(v[1] + ((seed >> 8) % 7 - 3) / 100, 2)
+        v[2] = round(v[2] + ((seed >> 12) % 5 - 2) / 100, 2)
+        v[3] = max(0, v[3] + (seed >> 16) % 401 - 200)
+        rows.append((1700000000 + 60 * (i >> 1), mid, v[0], v[1], v[2], v[3], 0))
+    return rows
+
+
+def fill(rows):
+    try:
+        os.remove(CACHE_FILE)
+    except OSError:
+        pass
+    cache = RingCache(CACHE_FILE, len(rows))
+    for row in rows:
+        cache.append(*row)
+    return cache
+
+
+def ingest():
+    data_array = []
+    for envelope, body in server.messages:
+        msg = email.message_from_bytes(body)
+        data_array += mail_to_db.decode_payload(mail_to_db.part_payload(msg))
+    return data_array
+
+
+def run(rows, version, compress, link_rate, link_rtt):
+    cache = fill(rows)
+    smtp = umail.SMTP("sim", 465, ssl=True, username="pico", password="secret", keepalive=True)
+
+    def send(reader):
+        readers.append(reader)
+        smtp.to("station@example.org", mail_from="pico@example.org")
+        smtp.write(("Subject: wetterstation\r\nMIME-Version: 1.0\r\n" + reader.headers + "\r\n").encode())
+        smtp.write_from(reader)
+        return smtp.send()[0] == 250
+
+    readers = []
+    uplink = UplinkBatcher(cache, send, make_format(version, encode), max_message=MAX_MESSAGE,
+                           compress_min=1 if compress else 0)
+    server.reset_counters()
+    server.messages = []
+    start = time.time()
+    sent = uplink.flush()
+    encode_s = time.time() - start
+    smtp.quit()
+    link_s = server.bytes_sent / link_rate + server.round_trips * link_rtt
+
+    start = time.time()
+    data_array = ingest()
+    ingest_s = time.time() - start
+    cache.close()
+
+    expected = [json.loads(encode(row)) for row in rows]
+    assert sent == len(rows) and data_array == expected, "v%d compress=%s: records differ" % (version, compress)
+    biggest = max(reader.size for reader in readers)
+    assert biggest <= MAX_MESSAGE, "v%d compress=%s: a message carries %d bytes" % (version, compress, biggest)
+    print("%-4s %-8s %10d %5d %9.2f %7.2f %9.2f %8.2f" % (
+        "v%d" % version, "deflate" if compress else "-", server.bytes_sent, len(server.messages),
+        encode_s, link_s, ingest_s, encode_s + link_s + ingest_s))
+
+
+def empty_messages():
+    # A message without rows must still be complete and decode to no records
+    for version in (1, 2, 3):
+        fmt = make_format(version, encode)
+        payload = fmt.begin() + fmt.end()
+        assert mail_to_db.decode_payload(payload) == [], "v%d: empty message" % version
+        if version == 2:
+            assert json.loads(payload)["cols"] == list(COLUMNS), "v2: empty message without cols"
+
+
+def main():
+    empty_messages()
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    link_rate = int(sys.argv[2]) if len(sys.argv) > 2 else LINK_RATE
+    link_rtt = int(sys.argv[3]) / 1000 if len(sys.argv) > 3 else LINK_RTT
+    rows = backlog(records)
+    print("%d records, link %d B/s, rtt %d ms" % (records, link_rate, link_rtt * 1000))
+    print("%-4s %-8s %10s %5s %9s %7s %9s %8s" % (
+        "fmt", "compress", "wire B", "msgs", "encode s", "link s", "ingest s", "total s"))
+    for version in (1, 2, 3):
+        for compress in (False, True):
+            run(rows, version, compress, link_rate, link_rtt)
+
+
+main()
@@ -0,0 +1,153 @@
+# bench_loop.py - Host check: the Base - New main loop keeps its grid while the network stalls
+# ============================================================================================
+#
+# Runs the blocking main loop of Base - New/main.py for DURATION seconds against the stub
+# modules of station_sim.py, on a READ_INTERVAL s grid with one email per reading:
+#   - the WiFi link is down from OUTAGE[0] to OUTAGE[1] seconds; the loop only starts a
+#     join (connect_wlan(timeout=0)) and must not wait for it
+#   - every SMTP session stalls STALL_MS in the TLS handshake; past SMTP_TIMEOUT it
+#     times out
+# and reports:
+#   samples    readings taken
+#   missed     slots the loop skipped (ausgelassen)
+#   lag ms     worst delay of a reading behind its slot
+#   emails     messages the SMTP stand-in accepted
+#   cache      records still in cache.bin at the end
+#
+# Fails if a reading lags more than MAX_LAG_MS, if a slot is skipped, if the timestamps
+# leave the grid, or if readings get lost: with a stall shorter than SMTP_TIMEOUT the
+# cache must be drained (the last reading may still be waiting), with a longer one no
+# email can go out and the cache must hold every reading.
+#
+# Usage (from this folder):
+#   python3 bench_loop.py [stall ms]      (default 300; e.g. 3000 is longer than the grid)
+
+import os
+import re
+import sys
+import threading
+import time
+
+import station_sim
+
+STALL_MS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+READ_INTERVAL = 2
+DURATION = 10 * READ_INTERVAL + READ_INTERVAL // 2
+OUTAGE = (5, 11)
+MAX_LAG_MS = 250
+SMTP_TIMEOUT = 0.5  # s; two of them (a stalled step and QUIT) fit in a gap
+WORK_DIR = "/tmp/bench_loop"
+
+station = station_sim.install(pipelining=True)
+sys.path.remove(station_sim.FIRMWARE_DIR)
+sys.path.insert(0, station_sim.smtp_sim.DRIVER_DIR)
+import clock  # noqa: E402
+import umail  # noqa: E402
+import ringcache  # noqa: E402
+
+clock.NTP_TIMEOUT = 0.2
+clock.HTTP_TIMEOUT = 0.5
+clock.socket = station.http_socket_module()
+umail.socket = station.smtp.socket_module()
+
+# Settings of main.py for the bench, replacing its "NAME = value" lines
+SETTINGS = {
+    "MESS_INTERVALL": READ_INTERVAL,
+    "ADAPTIV": False,
+    "WLAN_PRUEFEN": 1,
+    "KOMPRESSION": None,
+    "UPLINK_MAX_RECORDS": 1,
+    "UPLINK_COMPRESS_MIN": 0,
+    "GESUNDHEIT_INTERVALL": 0,
+    "SMTP_TIMEOUT": SMTP_TIMEOUT,
+}
+
+
+class _Done(Exception):
+    pass
+
+
+def _stalled_wrap(sock, **kwargs):
+    if sock.timeout is not None and STALL_MS > sock.timeout * 1000:
+        time.sleep(sock.timeout)
+        raise OSError(110)  # ETIMEDOUT
+    time.sleep(STALL_MS / 1000)
+    return station.smtp.wrap_socket(sock, **kwargs)
+
+
+umail.ssl_wrap_socket = _stalled_wrap
+
+reads = []  # (ticks_ms, timestamp) of each record the loop stores
+_append = ringcache.RingCache.append
+
+
+def _record_append(self, ts, *args):
+    reads.append((time.ticks_ms(), ts))
+    return _append(self, ts, *args)
+
+
+ringcache.RingCache.append = _record_append
+
+
+def main_():
+    try:
+        os.mkdir(WORK_DIR)
+    except OSError:
+        pass
+    os.chdir(WORK_DIR)
+    for name in os.listdir("."):
+        os.remove(name)
+
+    with open(station_sim.smtp_sim.DRIVER_DIR + "/main.py", encoding="utf-8") as f:
+        source = f.read()
+    for name, value in SETTINGS.items():
+        source, n = re.subn(r"(?m)^%s = [^#\r\n]*" % name, "%s = %r  " % (name, value), source)
+        assert n == 1, "no setting %s in main.py" % name
+
+    # The loop sleeps once per pass with time.sleep_ms(): stop it there DURATION s
+    # after the first reading
+    sleep_ms = time.sleep_ms
+
+    def _sleep_ms(ms):
+        if reads and time.ticks_diff(time.ticks_ms(), reads[0][0]) >= DURATION * 1000:
+            raise _Done
+        sleep_ms(ms)
+
+    time.sleep_ms = _sleep_ms
+    loop = {"__name__": "main"}
+    threading.Timer(OUTAGE[0], station.wifi_down).start()
+    threading.Timer(OUTAGE[1], station.wifi_up).start()
+    try:
+        exec(compile(source, "main.py", "exec"), loop)
+    except _Done:
+        pass
+    finally:
+        time.sleep_ms = sleep_ms
+
+    first = reads[0][0]
+    lag = max(time.ticks_diff(t, time.ticks_add(first, i * READ_INTERVAL * 1000))
+              for i, (t, ts) in enumerate(reads))
+    left = len(loop["cache"])
+    print()
+    print("%-8s %7s %7s %7s %7s" % ("samples", "missed", "lag ms", "emails", "cache"))
+    print("%-8d %7d %7d %7d %7d" % (len(reads), loop["ausgelassen"], lag,
+                                    station.smtp.accepted, left))
+
+    steps = [b[1] - a[1] for a, b in zip(reads, reads[1:])]
+    assert steps == [READ_INTERVAL] * len(steps), "timestamps off the grid: %r" % steps
+    assert len(reads) == DURATION // READ_INTERVAL + 1, "sample count drifted: %d" % len(reads)
+    assert not loop["ausgelassen"], "slots skipped: %d" % loop["ausgelassen"]
+    assert lag <= MAX_LAG_MS, "a reading lagged %d ms behind its slot" % lag
+    timed_out = STALL_MS > SMTP_TIMEOUT * 1000
+    if timed_out:
+        assert not station.smtp.accepted and left == len(reads), \
+            "readings lost: %d taken, %d in the cache" % (len(reads), left)
+    else:
+        assert station.smtp.accepted and left <= 1, "cache not drained: %d left" % left
+    print("ok: %d samples on a %d s grid through a %d s WiFi outage and %d ms SMTP stalls%s" % (
+        len(reads), READ_INTERVAL, OUTAGE[1] - OUTAGE[0], STALL_MS,
+        " (timed out)" if timed_out else ""))
+
+
+if __name__ == "__main__":
+    main_()
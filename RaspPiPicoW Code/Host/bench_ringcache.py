@@ -0,0 +1,148 @@
+# bench_ringcache.py - Host check: RingCache after a power loss and after a format change
+# ==========================================================================================
+#
+# Cuts the power (on the host: stops writing) at the points ringcache.py is built for and
+# reopens the file like the station does after a reboot. All asserted:
+#   torn record      the record at head is half written, the header still old
+#   no header        the record at head is complete, the header not yet updated
+#   torn header      the newest header copy is corrupt, the older copy is used
+#   capacity         the file was written with another CACHE_CAPACITY
+#   no header at all both header copies are corrupt
+# After each reopen the readings must come back in order, the cache must accept new
+# ones, and every file the cache opened must be closed again. With a changed capacity
+# or without any header the file is rebuilt and the readable records carried over.
+#
+# Usage (from this folder):
+#   python3 bench_ringcache.py
+
+import os
+
+import smtp_sim
+
+smtp_sim.install()  # puts the Base - New firmware on sys.path
+import ringcache  # noqa: E402
+
+CACHE_FILE = "/tmp/bench_ringcache.bin"
+CAPACITY = 50
+FILLED = 80  # readings appended before the power loss: the ring has wrapped
+
+opened = []
+
+
+def _open(path, mode):
+    f = open(path, mode)
+    opened.append(f)
+    return f
+
+
+ringcache.open = _open  # the module's open(), to find handles left open
+
+
+def reading(n):
+    return (1700000000 + 60 * n, 1 + n % 2, 20 + n / 100, 45 + n / 100, 1013 + n / 100, 80000 + n, 0)
+
+
+def fresh(count=FILLED, capacity=CAPACITY):
+    if os.path.exists(CACHE_FILE):
+        os.remove(CACHE_FILE)
+    cache = ringcache.RingCache(CACHE_FILE, capacity)
+    for n in range(count):
+        cache.append(*reading(n))
+    return cache
+
+
+def reopen(capacity=CAPACITY):
+    """Open the file like after a reboot; check its readings and that it takes a new one."""
+    del opened[:]
+    cache = ringcache.RingCache(CACHE_FILE, capacity)
+    records = cache.peek(len(cache))
+    first = (records[0][0] - reading(0)[0]) // 60 if records else 0
+    assert records == [reading(n) for n in range(first, first + len(records))], \
+        "readings out of order or changed"
+    count = len(records)
+    cache.append(*reading(first + count))
+    cache.close()
+    cache = ringcache.RingCache(CACHE_FILE, capacity)
+    assert cache.peek(len(cache))[-1] == reading(first + count), "new reading lost"
+    cache.close()
+    assert all(f.closed for f in opened), "file handle left open"
+    return count, first + count
+
+
+def newest_header_offset():
+    with open(CACHE_FILE, "rb") as f:
+        data = f.read(2 * ringcache._HEADER_SIZE)
+    gen = [int.from_bytes(data[i + 4:i + 8], "little")
+           for i in (0, ringcache._HEADER_SIZE)]
+    return 0 if gen[0] > gen[1] else ringcache._HEADER_SIZE
+
+
+def corrupt(offset, length=4):
+    with open(CACHE_FILE, "r+b") as f:
+        f.seek(offset)
+        data = bytearray(f.read(length))
+        f.seek(offset)
+        f.write(bytes(b ^ 0x5A for b in data))
+
+
+def check(name, count, last, want_count, want_last):
+    assert (count, last) == (want_count, want_last), "%s: %d readings up to %d, want %d up to %d" % (
+        name, count, last, want_count, want_last)
+    print("%-17s %3d readings, newest %d" % (name, count, last - 1))
+
+
+def torn_record():
+    cache = fresh()
+    cache._write_header = lambda: None  # power lost before the header
+    cache.append(*reading(FILLED))
+    offset = cache._offset(FILLED)
+    cache.close()
+    corrupt(offset + ringcache._RECORD_SIZE // 2, ringcache._RECORD_SIZE // 2)
+    # the ring is full: the torn record took the slot of the oldest reading
+    check("torn record", *reopen(), CAPACITY - 1, FILLED)
+
+
+def no_header():
+    cache = fresh()
+    cache._write_header = lambda: None
+    cache.append(*reading(FILLED))
+    cache.close()
+    check("no header", *reopen(), CAPACITY, FILLED + 1)
+
+
+def torn_header():
+    fresh().close()
+    corrupt(newest_header_offset())
+    # the older copy lacks the newest reading, which is complete and taken up again
+    check("torn header", *reopen(), CAPACITY, FILLED)
+
+
+def capacity():
+    fresh().close()
+    check("capacity smaller", *reopen(CAPACITY // 2), CAPACITY // 2, FILLED)
+    fresh().close()
+    check("capacity larger", *reopen(2 * CAPACITY), CAPACITY, FILLED)
+    cache = fresh()
+    cache.drop(len(cache) - 10)  # sent readings must not come back
+    cache.close()
+    check("capacity, sent", *reopen(2 * CAPACITY), 10, FILLED)
+
+
+def no_header_at_all():
+    fresh().close()
+    corrupt(0)
+    corrupt(ringcache._HEADER_SIZE)
+    check("no header at all", *reopen(), CAPACITY, FILLED)
+
+
+def main():
+    torn_record()
+    no_header()
+    torn_header()
+    capacity()
+    no_header_at_all()
+    os.remove(CACHE_FILE)
+    print("ok: readings survive power loss and format changes, no file left open")
+
+
+main()
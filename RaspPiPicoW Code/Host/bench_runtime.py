@@ -0,0 +1,226 @@
+# bench_runtime.py - Host run of the Old firmware's uasyncio runtime (station_sim.py)
+# ===================================================================================
+#
+# Runs the firmware's tasks (sampler, WiFi supervisor, email uplink, MQTT) in real time
+# for DURATION seconds against the stub modules while the network misbehaves:
+#   - every SMTP session stalls STALL_MS in the TLS handshake, blocking like on the Pico;
+#     past SMTP_TIMEOUT the handshake times out
+#   - the WiFi link is down from OUTAGE[0] to OUTAGE[1] seconds, so readings are saved
+#     to unsent_readings/ and drained once the supervisor has reconnected
+#   - NTP time is station_sim.NTP_OFFSET seconds ahead of the local clock, and the first
+#     reading is taken before the clock is synced
+# and reports:
+#   samples    readings taken, and the slots the sampler had to skip
+#   lag ms     worst delay of a reading behind its slot
+#   emails     messages the SMTP stand-in accepted
+#   saved      readings saved locally during the outage, and how many are left
+#   mqtt       publishes the broker received, and (re)connects
+#   packed     readings delivered in packed MQTT messages (QoS 1 outbox)
+#   health     health records (profiler.py) emailed or saved every HEALTH_INTERVAL s
+#
+# Fails if a timestamp leaves the READ_INTERVAL grid, if a slot is skipped, if a reading
+# is taken more than MAX_LAG_MS after its slot, if the number of samples drifts from the
+# elapsed time, if saved readings are not drained or
+# if no health record with stage timings went out, if a reading did not reach the
+# broker exactly in order despite the outage, if an MQTT connect or QoS 1 publish runs
+# without a socket timeout, if a dropped MQTT client leaves its socket open, if saved
+# files of the older firmware (dates in their names) do not sort by time among the
+# epoch-named ones, or if a reading reaches the mail server
+# or the broker with any other time than its slot in NTP epoch seconds.
+# With "core1" the sampler runs in its own thread (SAMPLER_CORE1) and hands readings
+# over through the shared ring. With "nontp" NTP is blocked, and the clock must be set
+# from the HTTP Date header after NTP_FALLBACK_AFTER failed syncs.
+#
+# A number sets STALL_MS (default 1500). In the task runtime a stalled handshake
+# blocks the sampler too, so the firmware only opens a session where SMTP_TIMEOUT
+# still fits before the next slot (sampler_gap()). A stall longer than SMTP_TIMEOUT
+# (e.g. 3000, longer than the grid) times out: then no email can go out, and instead
+# every reading must be kept in unsent_readings/ and still reach the broker, with the
+# sampler on its grid all the same.
+#
+# Usage (from this folder):
+#   python3 bench_runtime.py [core1] [nontp] [stall_ms]
+#   micropython bench_runtime.py [core1] [nontp] [stall_ms]
+
+import json
+import os
+import struct
+import sys
+import time
+
+import station_sim
+
+station = station_sim.install(starttls=True, pipelining=True)
+import config  # noqa: E402
+
+READ_INTERVAL = 2
+DURATION = 11 * READ_INTERVAL + READ_INTERVAL // 2
+OUTAGE = (5, 11)
+HEALTH_INTERVAL = 7  # records saved during the outage, one sent after it
+STALL_MS = ([int(a) for a in sys.argv[1:] if a.isdigit()] or [1500])[0]
+MAX_LAG_MS = 250
+WORK_DIR = "/tmp/bench_runtime"
+
+config.READ_INTERVAL = READ_INTERVAL
+config.SMTP_TIMEOUT = 0.8 * READ_INTERVAL
+config.MQTT_TIMEOUT = 0.2  # the stand-in broker answers at once
+config.EMAIL_INTERVAL = 1
+config.UNSENT_DRAIN_MS = 500  # well below the grid, like 2 s against READ_INTERVAL_MIN
+config.WIFI_CHECK_INTERVAL = 1
+config.WIFI_RETRY_MAX = 2
+config.MQTT_RETRY_INTERVAL = 2
+config.HEALTH_INTERVAL = HEALTH_INTERVAL
+config.DEBUG = False
+config.SAMPLER_CORE1 = "core1" in sys.argv[1:]
+config.COMPRESS_MODE = None  # every reading, so the stamps can be compared one to one
+config.ADAPTIVE_SAMPLING = False  # fixed grid of READ_INTERVAL
+config.NTP_FALLBACK_AFTER = 2
+NO_NTP = "nontp" in sys.argv[1:]
+if NO_NTP:
+    station.block_ntp()
+
+import main  # noqa: E402
+asyncio = main.asyncio
+sys.modules["clock"].socket = station.http_socket_module()
+
+
+def _stalled_wrap(sock, **kwargs):
+    if sock.timeout is not None and STALL_MS > sock.timeout * 1000:
+        time.sleep_ms(int(sock.timeout * 1000))
+        raise OSError(110)  # ETIMEDOUT
+    time.sleep_ms(STALL_MS)
+    return station.smtp.wrap_socket(sock, **kwargs)
+
+
+main.umail.socket = station.smtp.socket_module()
+main.umail.ssl_wrap_socket = _stalled_wrap
+
+stamps = []  # local time of each reading's slot
+saved = []
+health = []
+_hand_over = main.hand_over
+_save_email_locally = main.save_email_locally
+
+
+def _record_stamp(local, readings, queue):
+    # Called once per slot (per reading on core 1), in either sampler
+    stamps.extend(local for _ in readings)
+    return _hand_over(local, readings, queue)
+
+
+def _record_save(subject, body, data):
+    (health if "health" in data else saved).append(data["timestamp"])
+    return _save_email_locally(subject, body, data)
+
+
+main.hand_over = _record_stamp
+main.save_email_locally = _record_save
+
+
+def _clean(path):
+    try:
+        for name in os.listdir(path):
+            os.remove(path + "/" + name)
+    except OSError:
+        pass
+
+
+async def scenario(sensors):
+    start = time.ticks_ms()
+
+    async def until(seconds):
+        # From the start, not from the last wake-up: SMTP stalls block this task too
+        await asyncio.sleep_ms(time.ticks_diff(time.ticks_add(start, seconds * 1000), time.ticks_ms()))
+
+    runtime = asyncio.create_task(main.run(sensors))
+    await until(OUTAGE[0])
+    station.wifi_down()
+    await until(OUTAGE[1])
+    station.wifi_up()
+    await until(DURATION)
+    runtime.cancel()
+
+
+def check_unsent_order():
+    # Files saved by the firmware before epoch timestamps go out first, by their date
+    names = ["unsent_1_1792000000.json", "unsent_1_2026-01-28_10-14-30.json",
+             "unsent_health_1791999000.json", "unsent_1_2026-01-28_09-05-00.json",
+             "unsent_1_0000000120_b3.json"]
+    assert sorted(names, key=main.unsent_order) == [
+        names[4], names[3], names[1], names[2], names[0]], "unsent files out of order"
+
+
+def main_():
+    check_unsent_order()
+    try:
+        os.mkdir(WORK_DIR)
+    except OSError:
+        pass
+    os.chdir(WORK_DIR)
+    _clean("unsent_readings")
+    try:
+        os.remove(config.MQTT_OUTBOX_FILE)
+    except OSError:
+        pass
+
+    sensors = main.init_sensor()
+    main.init_wlan()
+    try:
+        asyncio.run(scenario(sensors))
+    except asyncio.CancelledError:
+        pass
+    asyncio.new_event_loop()
+
+    left = len([f for f in os.listdir("unsent_readings") if f.endswith(".json")])
+    packed = []
+    for topic, msg in station.published:
+        if topic == main.MQTT_TOPIC_PACKED:
+            packed.extend(struct.unpack_from(main.RECORD, msg, i)[0]
+                          for i in range(0, len(msg), main.RECORD_SIZE))
+    sent = [body for _, body in station.smtp.messages if b"Subject: wetterstation health" in body]
+    mailed = []
+    for _, body in station.smtp.messages:
+        data = json.loads(body.split(b"\r\n\r\n", 1)[1])
+        mailed += [d for d in (data if isinstance(data, list) else [data]) if "health" not in d]
+    print()
+    print("%-8s %7s %7s %7s %7s %7s %7s %8s %7s %7s" % (
+        "samples", "missed", "lag ms", "emails", "saved", "left", "mqtt", "connects", "packed",
+        "health"))
+    print("%-8d %7d %7d %7d %7d %7d %7d %8d %7d %7d" % (
+        len(stamps), main.samples_missed, main.sampler_max_lag, station.smtp.accepted,
+        len(saved), left, len(station.published), station.mqtt_connects, len(packed),
+        len(sent) + len(health)))
+    if sent:
+        print(sent[-1].split(b"\r\n\r\n", 1)[1].decode())
+
+    steps = [b - a for a, b in zip(stamps, stamps[1:])]
+    assert steps == [READ_INTERVAL] * len(steps), "timestamps off the grid: %r" % steps
+    assert main.samples_missed == 0, "sampler skipped %d slots" % main.samples_missed
+    assert main.sampler_max_lag <= MAX_LAG_MS, "sampler %d ms behind its slot" % main.sampler_max_lag
+    assert len(stamps) == DURATION // READ_INTERVAL + 1, "sample count drifted: %d" % len(stamps)
+    timed_out = STALL_MS > config.SMTP_TIMEOUT * 1000
+    if timed_out:
+        # the last reading may still be on its way to unsent_readings/
+        assert not station.smtp.accepted, "email accepted despite the timeout"
+        assert len(saved) >= len(stamps) - 1 and left == len(saved) + len(health), \
+            "readings lost: %d taken, %d saved, %d left" % (len(stamps), len(saved), left)
+    else:
+        assert saved and not left, "saved readings not drained"
+    epochs = [local + main.clock.offset for local in stamps]
+    assert main.clock.synced and abs(main.clock.offset - station_sim.NTP_OFFSET) <= 1, "clock not synced"
+    assert bool(station.http_queries) == NO_NTP, "HTTP time queried %d times" % station.http_queries
+    assert packed == epochs, "MQTT readings lost, out of order or not in epoch time: %r" % packed
+    assert not station.mqtt_untimed, "%d MQTT calls without a socket timeout" % station.mqtt_untimed
+    assert station.mqtt_open <= 1, "%d MQTT sockets left open" % station.mqtt_open
+    if not timed_out:
+        # One session per gap: the last reading may still wait for its turn
+        got = sorted(d["timestamp"] for d in mailed)
+        assert got in (epochs, epochs[:-1]) and not any(
+            "unsynced" in d for d in mailed), "emailed readings lost or not in epoch time"
+        assert sent and b'"tls"' in sent[-1] and b'"read"' in sent[-1], "no health record sent"
+    print("ok (%s%s): %d samples on a %d s grid through a %d s WiFi outage and %d ms SMTP stalls%s" % (
+        "core 1" if config.SAMPLER_CORE1 else "task", ", no NTP" if NO_NTP else "", len(stamps),
+        READ_INTERVAL, OUTAGE[1] - OUTAGE[0], STALL_MS, " (timed out)" if timed_out else ""))
+
+
+main_()
@@ -0,0 +1,152 @@
+# bench_sharedring.py - Concurrency check of Old/sharedring.py under host threads
+# ================================================================================
+#
+# One producer thread (the core 1 sampler) puts numbered readings into a SharedRing
+# while a consumer thread (core 0) takes them, with the interpreter switching threads
+# as often as it allows. Every reading carries its number in all fields, so a reading
+# torn between a reader and a writer shows up as inconsistent fields.
+#
+# A single pack is atomic under the host's interpreter lock, so the "widened" runs copy
+# each reading in two halves with a thread switch in between, like a copy the other
+# core can interleave with; only the ring's lock keeps those readings whole.
+#
+# Reports per copy mode and ring size:
+#   put        readings the producer wrote
+#   taken      readings the consumer got, dropped = overwritten while the ring was full
+#   torn       readings whose fields do not belong together
+#   order      readings that arrived out of sequence
+#   us/op      wall time per reading (put and get)
+#
+# Fails on any torn or out-of-order reading or if taken + dropped != put.
+#
+# Usage (from this folder):
+#   python3 bench_sharedring.py [readings]
+#   micropython bench_sharedring.py [readings]
+
+import sys
+import time
+import _thread
+try:
+    import struct
+except ImportError:
+    import ustruct as struct
+
+try:
+    FIRMWARE_DIR = __file__.rsplit("/", 1)[0] + "/../Old" if "/" in __file__ else "../Old"
+except NameError:
+    FIRMWARE_DIR = "../Old"
+sys.path.insert(0, FIRMWARE_DIR)
+import sharedring  # noqa: E402
+
+try:
+    _now_us = time.ticks_us
+    _diff = time.ticks_diff
+except AttributeError:
+    def _now_us():
+        return int(time.perf_counter() * 1000000)
+
+    def _diff(a, b):
+        return a - b
+
+
+def _yield():
+    if hasattr(time, "sleep_ms"):
+        time.sleep_ms(0)
+    else:
+        time.sleep(0)
+
+
+class _WidenedStruct:
+    """struct for sharedring that gives up the CPU halfway through every copy."""
+    calcsize = staticmethod(struct.calcsize)
+
+    @staticmethod
+    def pack_into(fmt, buf, offset, *values):
+        data = struct.pack(fmt, *values)
+        half = len(data) // 2
+        buf[offset:offset + half] = data[:half]
+        _yield()
+        buf[offset + half:offset + len(data)] = data[half:]
+
+    @staticmethod
+    def unpack_from(fmt, buf, offset):
+        size = struct.calcsize(fmt)
+        first = bytes(buf[offset:offset + size // 2])
+        _yield()
+        return struct.unpack(fmt, first + bytes(buf[offset + size // 2:offset + size]))
+
+
+def _reading(n):
+    # All fields derived from n; each stays exact through the ring's scaling
+    return (1700000000 + n, n % 60000, (n % 8000 - 4000) / 100, (n % 10000) / 100,
+            (n % 100000 + 50000) / 100, n * 7 % 4000000000, n & 1)
+
+
+def _check(reading):
+    ts, mid, temp, hum, press, gas, flags = reading
+    n = ts - 1700000000
+    expect = _reading(n)
+    return n, (mid, round(temp * 100), round(hum * 100), round(press * 100), gas, flags) == (
+        expect[1], round(expect[2] * 100), round(expect[3] * 100), round(expect[4] * 100),
+        expect[5], expect[6])
+
+
+def run(capacity, count):
+    ring = sharedring.SharedRing(capacity)
+    state = {"done": False, "taken": 0, "torn": 0, "order": 0}
+    finished = _thread.allocate_lock()
+    finished.acquire()
+
+    def consumer():
+        last = -1
+        while True:
+            reading = ring.get()
+            if reading is None:
+                if state["done"] and not len(ring):
+                    break
+                continue
+            n, whole = _check(reading)
+            state["taken"] += 1
+            if not whole:
+                state["torn"] += 1
+            if n <= last:
+                state["order"] += 1
+            last = n
+        finished.release()
+
+    start = _now_us()
+    _thread.start_new_thread(consumer, ())
+    for n in range(count):
+        ring.put(*_reading(n))
+        if capacity > 8 and n % 64 == 0:
+            _yield()  # let the consumer catch up
+    state["done"] = True
+    finished.acquire()
+    return ring, state, _diff(_now_us(), start)
+
+
+def check(widened, capacity, count):
+    ring, state, elapsed = run(capacity, count)
+    print("%-9s %6d %8d %8d %8d %6d %6d %7.2f" % (
+        "widened" if widened else "atomic", capacity, count, state["taken"], ring.dropped,
+        state["torn"], state["order"], elapsed / count))
+    assert not state["torn"], "torn readings"
+    assert not state["order"], "readings out of order"
+    assert state["taken"] + ring.dropped == count, "readings lost"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    if hasattr(sys, "setswitchinterval"):
+        sys.setswitchinterval(1e-6)  # switch threads as often as CPython allows
+    print("%-9s %6s %8s %8s %8s %6s %6s %7s" % (
+        "copy", "ring", "put", "taken", "dropped", "torn", "order", "us/op"))
+    for widened in (False, True):
+        sharedring.struct = _WidenedStruct if widened else struct
+        for capacity in (4, 64, 1024):
+            check(widened, capacity, count if not widened else count // 10)
+    sharedring.struct = struct
+    print("ok: no torn, reordered or lost readings")
+
+
+main()
@@ -0,0 +1,98 @@
+# bench_umail.py - Host benchmark for umail sessions against smtp_sim.py
+# =====================================================================
+#
+# Sends a backlog of messages the way the firmware does, with the server offering
+# PIPELINING or not, and reports per scenario:
+#   connects   TCP connections opened (each one a TLS handshake on the Pico)
+#   auths      AUTH exchanges
+#   round trips  waits for a server reply
+#   reads/writes socket calls made by umail
+#   sent       messages the server accepted
+#
+# Fails if umail waits for the server more often than the session needs (EHLO, EHLO and
+# AUTH per connection, MAIL, RCPT, DATA and the end of data per message, or one wait
+# for all of them with PIPELINING, RSET between reused messages, QUIT), or if it makes
+# more than one socket read per wait (plus the greeting): replies are read through a
+# buffer, not byte by byte.
+#
+# Usage (from this folder):
+#   python3 bench_umail.py [messages]
+#   micropython bench_umail.py [messages]
+
+import sys
+
+import smtp_sim
+
+server = smtp_sim.install()
+import umail  # noqa: E402
+umail.socket = server.socket_module()
+umail.ssl_wrap_socket = server.wrap_socket
+
+BODY = "Subject: wetterstation\r\nContent-Type: application/json\r\n\r\n" + "[" + ",".join(["{}"] * 60) + "]"
+
+
+def _send(smtp):
+    smtp.to("station@example.org", mail_from="pico@example.org")
+    code, resp = smtp.send(BODY)
+    assert code == 250, resp
+
+
+def fresh_session(count):
+    # One connection per message, as before
+    for _ in range(count):
+        smtp = umail.SMTP("sim", 465, ssl=True, username="pico", password="secret")
+        _send(smtp)
+        smtp.quit()
+
+
+def keepalive(count):
+    smtp = umail.SMTP("sim", 465, ssl=True, username="pico", password="secret", keepalive=True)
+    for _ in range(count):
+        _send(smtp)
+    smtp.quit()
+
+
+def keepalive_dropped(count):
+    # The server ends the idle session halfway (closed socket, then a 421)
+    smtp = umail.SMTP("sim", 465, ssl=True, username="pico", password="secret", keepalive=True)
+    for i in range(count):
+        if i == count // 2:
+            server.drop()
+        if i == count * 3 // 4:
+            server.drop(reply_421=True)
+        _send(smtp)
+    alive = smtp.noop()
+    smtp.quit()
+    assert alive and not smtp.noop()
+
+
+def run(name, scenario, count, pipelining, round_trips=None):
+    server.pipelining = pipelining
+    server.reset_counters()
+    server.messages = []
+    scenario(count)
+    print("%-20s %10s %8d %6d %11d %6d %6d %6d" % (
+        name, "yes" if pipelining else "no", server.connects, server.auths,
+        server.round_trips, server.reads, server.writes, len(server.messages)))
+    assert len(server.messages) == count, "messages lost"
+    assert round_trips is None or server.round_trips == round_trips, \
+        "%d round trips instead of %d" % (server.round_trips, round_trips)
+    assert server.reads == server.round_trips + server.connects, \
+        "%d socket reads for %d replies" % (server.reads, server.round_trips + server.connects)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    print("%d messages" % count)
+    print("%-20s %10s %8s %6s %11s %6s %6s %6s" % (
+        "scenario", "pipelining", "connects", "auths", "round trips", "reads", "writes", "sent"))
+    for pipelining in (False, True):
+        message = 2 if pipelining else 4  # waits for one message on an open session
+        run("fresh session", fresh_session, count, pipelining, count * (3 + message + 1))
+        run("keepalive", keepalive, count, pipelining,
+            3 + count * message + (0 if pipelining else count - 1) + 1)
+        run("keepalive, dropped", keepalive_dropped, count, pipelining)
+    print("ok: one socket read per server reply")
+
+
+main()
@@ -0,0 +1,138 @@
+# bench_uplink.py - Host check for the streaming uplink against smtp_sim.py
+# =========================================================================
+#
+# Fills a RingCache on disk with a multi-megabyte backlog (as JSON) of slowly drifting
+# readings from two sensors, drains it through UplinkBatcher and umail into the SMTP
+# stand-in in each wire format (wire.py) and reports:
+#   records    readings sent
+#   body B     message body bytes, B/rec per reading
+#   messages   emails needed for the drain
+#   peak B     heap in use while draining, above the level before the flush:
+#              tracemalloc peak (CPython) or the largest gc.mem_alloc() after a
+#              collection per buffer fill (MicroPython)
+#
+# The drain fails the check if the peak exceeds PEAK_LIMIT, if a record is lost or if
+# a body line is longer than SMTP allows. Runs with the firmware's message size and
+# with the whole backlog in one message: the peak must not follow either.
+#
+# Usage (from this folder):
+#   python3 bench_uplink.py [records]
+#   micropython bench_uplink.py [records]
+
+import sys
+import gc
+import json
+
+import smtp_sim
+
+server = smtp_sim.install(pipelining=True, keep_bodies=False)
+import umail  # noqa: E402
+from ringcache import RingCache  # noqa: E402
+from uplink import UplinkBatcher  # noqa: E402
+from wire import make_format  # noqa: E402
+umail.socket = server.socket_module()
+umail.ssl_wrap_socket = server.wrap_socket
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+CACHE_FILE = "/tmp/bench_uplink.bin"
+PEAK_LIMIT = 16 * 1024
+MAX_LINE = 998
+
+
+def encode(record):
+    # Same shape as record_to_dict() in main.py
+    ts, mid, temperatur, feuchte, druck, gas, flags = record
+    return json.dumps({
+        "mid": mid,
+        "temperatur": temperatur,
+        "feuchte": feuchte,
+        "druck": druck,
+        "qualitaet": gas,
+        "timestamp": ts
+    })
+
+
+class _Sampler:
+    # Wraps a CacheReader; on MicroPython samples the live heap at every buffer fill
+    def __init__(self, reader, state):
+        self.reader = reader
+        self.state = state
+
+    def readinto(self, buf):
+        n = self.reader.readinto(buf)
+        if tracemalloc is None:
+            gc.collect()
+            self.state["peak"] = max(self.state["peak"], gc.mem_alloc() - self.state["base"])
+        return n
+
+
+def fill(records):
+    try:
+        import os
+        os.remove(CACHE_FILE)
+    except OSError:
+        pass
+    cache = RingCache(CACHE_FILE, records)
+    seed = 12345
+    values = {1: [21.37, 45.5, 1013.25, 123456], 2: [19.80, 52.1, 1013.31, 98765]}
+    for i in range(records):
+        mid = 1 + (i & 1)
+        v = values[mid]
+        # Random walk with small steps (LCG, same sequence on MicroPython)
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        v[0] += ((seed >> 4) % 5 - 2) / 100
+        v[1] += ((seed >> 8) % 7 - 3) / 100
+        v[2] += ((seed >> 12) % 5 - 2) / 100
+        v[3] = max(0, v[3] + (seed >> 16) % 401 - 200)
+        cache.append(1700000000 + 60 * (i >> 1), mid, v[0], v[1], v[2], v[3], 0)
+    return cache
+
+
+def drain(cache, fmt, max_message):
+    smtp = umail.SMTP("sim", 465, ssl=True, username="pico", password="secret", keepalive=True)
+    state = {"peak": 0, "base": 0}
+
+    def send(reader):
+        smtp.to("station@example.org", mail_from="pico@example.org")
+        smtp.write(b"Subject: wetterstation\r\nContent-Type: application/json\r\n\r\n")
+        smtp.write_from(_Sampler(reader, state))
+        return smtp.send()[0] == 250
+
+    uplink = UplinkBatcher(cache, send, fmt, max_message=max_message)
+    server.accepted = server.body_bytes = server.longest_line = 0
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+    else:
+        state["base"] = gc.mem_alloc()
+    sent = uplink.flush()
+    if tracemalloc is not None:
+        state["peak"] = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+    smtp.quit()
+    return sent, state["peak"]
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    print("%-7s %-14s %8s %10s %6s %8s %8s" % (
+        "format", "max message", "records", "body B", "B/rec", "messages", "peak B"))
+    for version, max_message in ((1, 100000), (1, 1 << 30), (2, 100000), (3, 100000), (3, 1 << 30)):
+        cache = fill(records)
+        sent, peak = drain(cache, make_format(version, encode), max_message)
+        print("%-7s %-14s %8d %10d %6.1f %8d %8d" % (
+            "v%d" % version, "whole backlog" if max_message == 1 << 30 else max_message,
+            sent, server.body_bytes, server.body_bytes / sent, server.accepted, peak))
+        assert sent == records and len(cache) == 0, "records lost"
+        assert server.longest_line <= MAX_LINE, "body line too long for SMTP: %d" % server.longest_line
+        assert peak <= PEAK_LIMIT, "peak heap %d above %d" % (peak, PEAK_LIMIT)
+        cache.close()
+    print("ok: peak heap bounded by %d B independent of backlog and message size" % PEAK_LIMIT)
+
+
+main()
@@ -0,0 +1,367 @@
+# bme680_sim.py - BME680 register emulator for running the driver without hardware
+# ==================================================================================
+#
+# Runs on CPython and on the MicroPython Unix port. The emulated sensor holds the
+# BME680 register map (chip id, calibration blocks, heater set-points, control and
+# data registers) and turns chosen physical values into ADC frames using Bosch's
+# floating point reference formulas, which none of the driver's engines share.
+#
+#   import bme680_sim
+#   clock = bme680_sim.install()       # host shims + virtual clock, before importing bme680
+#   import bme680
+#   bme680.time = clock
+#   sim = bme680_sim.BME680Sim(clock)
+#   sim.set_environment(21.5, 45.0, 1013.25, 80000)
+#   sensor = bme680.BME680_I2C(bme680_sim.FakeI2C({0x77: sim}))
+
+import sys
+try:
+    import struct
+except ImportError:
+    import ustruct as struct
+
+try:
+    DRIVER_DIR = __file__.rsplit("/", 1)[0] + "/../Base - New" if "/" in __file__ else "../Base - New"
+except NameError:
+    DRIVER_DIR = "../Base - New"
+
+_COEFF_FORMAT = '<hbBHhbBhhbbHhhBBBHbbbBbHhbb'
+
+# Calibration as read from a BME680 breakout, in Bosch's naming
+CALIBRATION = {
+    "par_t1": 26118, "par_t2": 26497, "par_t3": 3,
+    "par_p1": 36136, "par_p2": -10396, "par_p3": 88, "par_p4": 6990, "par_p5": -98,
+    "par_p6": 30, "par_p7": 45, "par_p8": -2810, "par_p9": -2366, "par_p10": 30,
+    "par_h1": 789, "par_h2": 1008, "par_h3": 0, "par_h4": 45, "par_h5": 20,
+    "par_h6": 120, "par_h7": -100,
+    "par_gh1": -30, "par_gh2": -5969, "par_gh3": 18,
+    "res_heat_range": 1, "res_heat_val": 46, "range_sw_err": 0,
+}
+
+_K1_RANGE = (0.0, 0.0, 0.0, 0.0, 0.0, -1.0, 0.0, -0.8, 0.0, 0.0, -0.2, -0.5, 0.0, -1.0, 0.0, 0.0)
+_K2_RANGE = (0.0, 0.0, 0.0, 0.0, 0.1, 0.7, 0.0, -0.8, -0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+_SAMPLES = (0, 1, 2, 4, 8, 16)
+
+
+# --- HOST SHIMS ---
+class SimClock:
+    """Virtual stand-in for the ``time`` functions the driver uses. Sleeping advances the
+    clock instantly, so conversions cost no real time on the host."""
+
+    def __init__(self):
+        self.us = 0
+        self.slept_us = 0
+
+    def ticks_us(self):
+        return self.us
+
+    def ticks_ms(self):
+        return self.us // 1000
+
+    def ticks_diff(self, a, b):
+        return a - b
+
+    def ticks_add(self, a, b):
+        return a + b
+
+    def sleep_us(self, us):
+        if us > 0:
+            self.us += int(us)
+            self.slept_us += int(us)
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms * 1000)
+
+    def sleep(self, seconds):
+        self.sleep_us(seconds * 1000000)
+
+    def time(self):
+        return self.us // 1000000
+
+
+def install():
+    """Provide the MicroPython-only modules the driver imports when running on CPython, put
+    the driver directory on the import path and return a fresh ``SimClock``."""
+    if "micropython" not in sys.modules:
+        try:
+            import micropython  # noqa: F401
+        except ImportError:
+            class _MicroPython:
+                @staticmethod
+                def const(value):
+                    return value
+            sys.modules["micropython"] = _MicroPython()
+    try:
+        import ubinascii  # noqa: F401
+    except ImportError:
+        import binascii
+        sys.modules["ubinascii"] = binascii
+    if DRIVER_DIR not in sys.path:
+        sys.path.append(DRIVER_DIR)
+    return SimClock()
+
+
+# --- REGISTER MODEL ---
+class BME680Sim:
+    """One emulated BME680.
+
+    :param clock: ``SimClock`` (or the ``time`` module) the conversion time is measured with.
+    :param dict calibration: Coefficients in Bosch's naming, defaults to ``CALIBRATION``.
+    :param conversion_ms: Fixed delay before the new-data bit is set. By default it is
+      computed from the oversampling and heater registers like on the real sensor.
+    """
+
+    def __init__(self, clock, calibration=None, conversion_ms=None):
+        self.clock = clock
+        self.cal = calibration or CALIBRATION
+        self.conversion_ms = conversion_ms
+        self.mem = bytearray(256)
+        self.spi_page = 0
+        self.conversions = 0
+        self.heater_cycles = 0
+        self._busy_until = None
+        self._gas_run = False
+        self._load_calibration()
+        self.set_environment(21.0, 45.0, 1013.25, 50000)
+
+    def _load_calibration(self):
+        c = self.cal
+        e1 = (c["par_h2"] >> 4) & 0xFF
+        e2 = ((c["par_h2"] & 0x0F) << 4) | (c["par_h1"] & 0x0F)
+        e3 = (c["par_h1"] >> 4) & 0xFF
+        blob = struct.pack(_COEFF_FORMAT, c["par_t2"], c["par_t3"], 0, c["par_p1"], c["par_p2"],
+                           c["par_p3"], 0, c["par_p4"], c["par_p5"], c["par_p7"], c["par_p6"], 0,
+                           c["par_p8"], c["par_p9"], c["par_p10"], 0, e1, (e3 << 8) | e2,
+                           c["par_h3"], c["par_h4"], c["par_h5"], c["par_h6"], c["par_h7"],
+                           c["par_t1"], c["par_gh2"], c["par_gh1"], c["par_gh3"])
+        self.mem[0x8A:0x8A + 24] = blob[:24]
+        self.mem[0xE1:0xE1 + len(blob) - 24] = blob[24:]
+        self.mem[0xD0] = 0x61
+        self.mem[0x00] = c["res_heat_val"] & 0xFF
+        self.mem[0x02] = (c["res_heat_range"] & 0x03) << 4
+        self.mem[0x04] = (c["range_sw_err"] & 0x0F) << 4
+
+    # --- physical values -> ADC ---
+    def set_environment(self, temperature, humidity, pressure, gas):
+        """Choose what the next conversions measure: degrees celsius, % RH, hPa and ohms."""
+        self.adc_temp = _bisect(lambda adc: self._temperature(adc)[0], temperature, 0, 0xFFFFF)
+        t_fine = self._temperature(self.adc_temp)[1]
+        self.adc_pres = _bisect(lambda adc: -self._pressure(adc, t_fine), -pressure * 100, 0, 0xFFFFF)
+        self.adc_hum = _bisect(lambda adc: self._humidity(adc, t_fine), humidity, 0, 0xFFFF)
+        self.adc_gas, self.gas_range = self._gas_adc(gas)
+
+    def set_adc(self, temp, pres, hum, gas, gas_range):
+        """Choose raw ADC values for the next conversions instead of physical ones."""
+        self.adc_temp, self.adc_pres, self.adc_hum = temp, pres, hum
+        self.adc_gas, self.gas_range = gas, gas_range
+
+    def _temperature(self, adc):
+        c = self.cal
+        var1 = ((adc / 16384.0) - (c["par_t1"] / 1024.0)) * c["par_t2"]
+        var2 = (adc / 131072.0) - (c["par_t1"] / 8192.0)
+        var2 = var2 * var2 * (c["par_t3"] * 16.0)
+        t_fine = var1 + var2
+        return t_fine / 5120.0, t_fine
+
+    def _pressure(self, adc, t_fine):
+        c = self.cal
+        var1 = (t_fine / 2.0) - 64000.0
+        var2 = var1 * var1 * (c["par_p6"] / 131072.0)
+        var2 = var2 + (var1 * c["par_p5"] * 2.0)
+        var2 = (var2 / 4.0) + (c["par_p4"] * 65536.0)
+        var1 = (((c["par_p3"] * var1 * var1) / 16384.0) + (c["par_p2"] * var1)) / 524288.0
+        var1 = (1.0 + (var1 / 32768.0)) * c["par_p1"]
+        pres = 1048576.0 - adc
+        pres = ((pres - (var2 / 4096.0)) * 6250.0) / var1
+        var1 = (c["par_p9"] * pres * pres) / 2147483648.0
+        var2 = pres * (c["par_p8"] / 32768.0)
+        var3 = (pres / 256.0) ** 3 * (c["par_p10"] / 131072.0)
+        return pres + (var1 + var2 + var3 + (c["par_p7"] * 128.0)) / 16.0
+
+    def _humidity(self, adc, t_fine):
+        c = self.cal
+        temp = t_fine / 5120.0
+        var1 = adc - ((c["par_h1"] * 16.0) + ((c["par_h3"] / 2.0) * temp))
+        var2 = var1 * ((c["par_h2"] / 262144.0) * (1.0 + ((c["par_h4"] / 16384.0) * temp) +
+                                                  ((c["par_h5"] / 1048576.0) * temp * temp)))
+        var3 = c["par_h6"] / 16384.0
+        var4 = c["par_h7"] / 2097152.0
+        return var2 + ((var3 + (var4 * temp)) * var2 * var2)
+
+    def _gas_adc(self, ohms):
+        var1 = 1340.0 + (5.0 * self.cal["range_sw_err"])
+        for gas_range in range(16):
+            var2 = var1 * (1.0 + _K1_RANGE[gas_range] / 100.0)
+            var3 = 1.0 + (_K2_RANGE[gas_range] / 100.0)
+            adc = 512.0 + var2 * (1.0 / (ohms * var3 * 0.000000125 * (1 << gas_range)) - 1.0)
+            if adc < 1024:
+                return max(0, int(adc + 0.5)), gas_range
+        return 1023, 15
+
+    # --- bus side ---
+    def read(self, register, buf):
+        self._update()
+        for i in range(len(buf)):
+            buf[i] = self.mem[(register + i) & 0xFF]
+
+    def write(self, register, value):
+        self._update()
+        if register == 0xE0:
+            if value == 0xB6:
+                for reg in range(0x1D, 0x76):
+                    self.mem[reg] = 0
+                self.spi_page = 0
+                self._busy_until = None
+            return
+        self.mem[register] = value
+        if register == 0x73:
+            self.spi_page = (value >> 4) & 1
+        elif register == 0x74 and value & 0x03 == 0x01:
+            self._start()
+
+    def _start(self):
+        self.conversions += 1
+        self._gas_run = bool(self.mem[0x71] & 0x10)
+        if self._gas_run:
+            self.heater_cycles += 1
+        duration = self.conversion_ms
+        if duration is None:
+            duration = self._conversion_ms()
+        self._busy_until = self.clock.ticks_ms() + duration
+        self.mem[0x1D] = 0x20 | (0x40 if self._gas_run else 0)
+
+    def _conversion_ms(self):
+        ctrl_meas = self.mem[0x74]
+        cycles = (_SAMPLES[ctrl_meas >> 5] + _SAMPLES[(ctrl_meas >> 2) & 0x07] +
+                  _SAMPLES[self.mem[0x72] & 0x07])
+        duration = (cycles * 1963 + 477 * 4 + 477 * 5 + 1000 + 999) // 1000
+        if self._gas_run:
+            gas_wait = self.mem[0x64 + (self.mem[0x71] & 0x0F)]
+            duration += (gas_wait & 0x3F) << (2 * (gas_wait >> 6))
+        return duration
+
+    def _update(self):
+        if self._busy_until is None or self.clock.ticks_ms() < self._busy_until:
+            return
+        self._busy_until = None
+        m = self.mem
+        m[0x74] &= 0xFC  # back to sleep mode
+        m[0x1D] = 0x80
+        m[0x1F] = (self.adc_pres >> 12) & 0xFF
+        m[0x20] = (self.adc_pres >> 4) & 0xFF
+        m[0x21] = (self.adc_pres & 0x0F) << 4
+        m[0x22] = (self.adc_temp >> 12) & 0xFF
+        m[0x23] = (self.adc_temp >> 4) & 0xFF
+        m[0x24] = (self.adc_temp & 0x0F) << 4
+        m[0x25] = self.adc_hum >> 8
+        m[0x26] = self.adc_hum & 0xFF
+        if self._gas_run:
+            m[0x2A] = self.adc_gas >> 2
+            m[0x2B] = ((self.adc_gas & 0x03) << 6) | 0x30 | self.gas_range
+
+
+def _bisect(func, target, low, high):
+    """Smallest int in low..high where the increasing ``func`` reaches ``target``."""
+    while low < high:
+        mid = (low + high) // 2
+        if func(mid) < target:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+# --- BUSES ---
+class _Bus:
+    def __init__(self):
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @property
+    def bytes_moved(self):
+        return self.bytes_read + self.bytes_written
+
+
+class FakeI2C(_Bus):
+    """Stand-in for ``machine.I2C`` with emulated BME680s by address. Counts transactions and
+    payload bytes."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        super().__init__()
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def _device(self, address):
+        if address not in self.devices:
+            raise OSError(19)  # ENODEV, like a missing ACK
+        return self.devices[address]
+
+    def readfrom_mem_into(self, address, register, buf):
+        self._device(address).read(register, buf)
+        self.transactions += 1
+        self.bytes_read += len(buf)
+
+    def readfrom_mem(self, address, register, length):
+        buf = bytearray(length)
+        self.readfrom_mem_into(address, register, buf)
+        return buf
+
+    def writeto_mem(self, address, register, buf):
+        device = self._device(address)
+        for i in range(len(buf)):
+            device.write(register + i, buf[i])
+        self.transactions += 1
+        self.bytes_written += len(buf)
+
+    def writeto(self, address, buf):
+        # The BME680 takes register address/value pairs in one write
+        device = self._device(address)
+        for i in range(0, len(buf) - 1, 2):
+            device.write(buf[i], buf[i + 1])
+        self.transactions += 1
+        self.bytes_written += len(buf)
+
+
+class FakeSPI(_Bus):
+    """Stand-in for ``machine.SPI`` wired to one emulated BME680. Use ``cs`` as the chip select
+    pin. A transaction is one chip select assertion."""
+
+    def __init__(self, device):
+        self.device = device
+        self._selected = False
+        self._read_register = None
+        super().__init__()
+
+    def cs(self, value=None):
+        if value is None:
+            return 0 if self._selected else 1
+        selected = not value
+        if selected and not self._selected:
+            self.transactions += 1
+            self._read_register = None
+        self._selected = selected
+
+    def _address(self, spi_address):
+        # Page 0 holds registers 0x80..0xFF, page 1 holds 0x00..0x7F
+        return (spi_address & 0x7F) | (0x80 if self.device.spi_page == 0 else 0)
+
+    def write(self, buf):
+        self.bytes_written += len(buf)
+        if buf[0] & 0x80:
+            self._read_register = self._address(buf[0])
+            return
+        for i in range(0, len(buf) - 1, 2):
+            register = buf[i] & 0x7F
+            # The page select register answers on both pages
+            self.device.write(0x73 if register == 0x73 else self._address(register), buf[i + 1])
+
+    def readinto(self, buf):
+        self.device.read(self._read_register, buf)
+        self._read_register += len(buf)
+        self.bytes_read += len(buf)
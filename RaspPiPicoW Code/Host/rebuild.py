@@ -0,0 +1,32 @@
+# rebuild.py - Rebuild a compressed series from the readings the station kept
+# ============================================================================
+#
+# With COMPRESS_MODE / KOMPRESSION the station only sends the readings compressor.py
+# keeps, and the database stores just those. Filling in the readings between them is
+# left to whoever reads the database; this is the reference the benches check the
+# tolerance against: with "deadband" the last kept value holds, with "swing" the
+# value is interpolated linearly between the neighbours.
+#
+#   from rebuild import reconstruct
+#   values = reconstruct(kept, ts, linear=True)   # kept: [(ts, values), ...] ascending
+
+
+def reconstruct(kept, ts, linear=True):
+    """Values of one sensor at ts from its kept readings [(ts, values), ...] in
+    ascending order; None before the first and after the last."""
+    if not kept or not kept[0][0] <= ts <= kept[-1][0]:
+        return None
+    lo, hi = 0, len(kept) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if kept[mid][0] <= ts:
+            lo = mid
+        else:
+            hi = mid
+    (t0, a), (t1, b) = kept[lo], kept[hi]
+    if ts >= t1:
+        return b
+    if not linear or t1 == t0:
+        return a
+    f = (ts - t0) / (t1 - t0)
+    return tuple(x + (y - x) * f for x, y in zip(a, b))
@@ -0,0 +1,268 @@
+# smtp_sim.py - In-process SMTP server stand-in for running umail without a network
+# ===================================================================================
+#
+# Runs on CPython and on the MicroPython Unix port. The fake socket module hands umail
+# a socket wired straight to an SMTP state machine, so sessions, TLS upgrades, AUTH,
+# RSET/NOOP and dropped idle sessions can be exercised and counted on the host.
+#
+#   import smtp_sim
+#   server = smtp_sim.install()        # host shims, before importing umail
+#   import umail
+#   umail.socket = server.socket_module()
+#   umail.ssl_wrap_socket = server.wrap_socket
+#   smtp = umail.SMTP("sim", 465, ssl=True, username="u", password="p", keepalive=True)
+#
+# Counters on the server: connects, tls, auths, commands, reads, writes, bytes_sent
+# (by the client), round_trips (a client read that follows a client write, i.e. one
+# wait for the server) and the accepted messages. reads counts socket reads the way
+# MicroPython makes them: its socket readline() is unbuffered, one read per byte.
+
+import sys
+
+try:
+    DRIVER_DIR = __file__.rsplit("/", 1)[0] + "/../Base - New" if "/" in __file__ else "../Base - New"
+except NameError:
+    DRIVER_DIR = "../Base - New"
+
+
+def install(**options):
+    """Provide the MicroPython-only modules umail imports when running on CPython, put the
+    firmware directory on the import path and return a fresh ``SMTPSim``."""
+    try:
+        import ubinascii  # noqa: F401
+    except ImportError:
+        import binascii
+
+        class _UBinascii:
+            hexlify = staticmethod(binascii.hexlify)
+
+            # MicroPython also accepts str here
+            @staticmethod
+            def b2a_base64(data):
+                return binascii.b2a_base64(data.encode() if isinstance(data, str) else data)
+        sys.modules["ubinascii"] = _UBinascii()
+    try:
+        from ssl import wrap_socket  # noqa: F401
+    except ImportError:
+        class _SSL:
+            @staticmethod
+            def wrap_socket(sock, **kwargs):
+                raise OSError("no TLS on the host, use SMTPSim.wrap_socket")
+        sys.modules["ssl"] = _SSL()
+    if DRIVER_DIR not in sys.path:
+        sys.path.append(DRIVER_DIR)
+    return SMTPSim(**options)
+
+
+# --- SERVER ---
+class SMTPSim:
+    """SMTP server state machine. ``starttls`` advertises STARTTLS on plain connections,
+    ``pipelining`` advertises the PIPELINING extension. Accepted messages are kept as
+    (envelope, body); with ``keep_bodies=False`` only ``accepted``, ``body_bytes`` and
+    ``longest_line`` are counted, so large transfers do not grow the host's heap."""
+
+    def __init__(self, starttls=False, pipelining=False, keep_bodies=True):
+        self.starttls = starttls
+        self.pipelining = pipelining
+        self.keep_bodies = keep_bodies
+        self.messages = []
+        self._sockets = []
+        self.reset_counters()
+        self.accepted = 0
+        self.body_bytes = 0
+        self.longest_line = 0
+
+    def reset_counters(self):
+        self.connects = 0
+        self.tls = 0
+        self.auths = 0
+        self.commands = 0
+        self.reads = 0
+        self.writes = 0
+        self.bytes_sent = 0
+        self.round_trips = 0
+
+    def socket_module(self):
+        return _SocketModule(self)
+
+    def wrap_socket(self, sock, **kwargs):
+        self.tls += 1
+        sock.tls = True
+        return sock
+
+    def drop(self, reply_421=False):
+        """Let the server end every open session, like an idle timeout. With ``reply_421``
+        the next command is answered with 421 before the connection closes."""
+        for sock in self._sockets:
+            if reply_421:
+                sock.timed_out = True
+            else:
+                sock.closed = True
+        self._sockets = []
+
+    def _ehlo(self, sock):
+        lines = ["sim.local", "AUTH PLAIN LOGIN", "8BITMIME"]
+        if self.pipelining:
+            lines.append("PIPELINING")
+        if self.starttls and not sock.tls:
+            lines.append("STARTTLS")
+        return "".join("250%s%s\r\n" % ("-" if i < len(lines) - 1 else " ", line)
+                       for i, line in enumerate(lines))
+
+    def _command(self, sock, line):
+        self.commands += 1
+        if sock.timed_out:
+            sock.closed_after_reply = True
+            return "421 idle timeout\r\n"
+        if sock.auth_step:
+            sock.auth_step -= 1
+            if sock.auth_step:
+                return "334 UGFzc3dvcmQ6\r\n"
+            self.auths += 1
+            return "235 accepted\r\n"
+        verb = line.split(" ", 1)[0].upper()
+        if verb in ("EHLO", "HELO"):
+            return self._ehlo(sock)
+        if verb == "STARTTLS":
+            return "220 go ahead\r\n"
+        if verb == "AUTH":
+            if line.upper().startswith("AUTH LOGIN"):
+                sock.auth_step = 2
+                return "334 UGFzc3dvcmQ6\r\n"
+            self.auths += 1
+            return "235 accepted\r\n"
+        if verb == "MAIL":
+            if sock.envelope is not None:
+                return "503 nested MAIL\r\n"
+            sock.envelope = {"from": line, "to": []}
+            return "250 sender ok\r\n"
+        if verb == "RCPT":
+            if sock.envelope is None:
+                return "503 need MAIL\r\n"
+            sock.envelope["to"].append(line)
+            return "250 recipient ok\r\n"
+        if verb == "DATA":
+            if sock.envelope is None or not sock.envelope["to"]:
+                return "503 need RCPT\r\n"
+            sock.data = [] if self.keep_bodies else [0, 0]
+            return "354 end with .\r\n"
+        if verb == "RSET":
+            sock.envelope = None
+            return "250 reset\r\n"
+        if verb == "NOOP":
+            return "250 ok\r\n"
+        if verb == "QUIT":
+            sock.closed_after_reply = True
+            return "221 bye\r\n"
+        return "500 unknown\r\n"
+
+    def _feed(self, sock):
+        # Handle every complete line the client has written so far
+        while True:
+            end = sock.inbox.find(b"\r\n")
+            if end < 0:
+                return
+            line = bytes(sock.inbox[:end])
+            del sock.inbox[:end + 2]
+            if sock.data is not None:
+                if line == b".":
+                    self.accepted += 1
+                    if self.keep_bodies:
+                        self.messages.append((sock.envelope, b"\r\n".join(sock.data)))
+                    else:
+                        self.body_bytes += sock.data[0]
+                        self.longest_line = max(self.longest_line, sock.data[1])
+                    sock.envelope = None
+                    sock.data = None
+                    sock.outbox += b"250 queued\r\n"
+                elif self.keep_bodies:
+                    sock.data.append(line)
+                else:
+                    sock.data[0] += len(line) + 2
+                    sock.data[1] = max(sock.data[1], len(line))
+                continue
+            sock.outbox += self._command(sock, line.decode()).encode()
+
+
+# --- SOCKETS ---
+class _SocketModule:
+    """Stand-in for the ``socket`` module as umail uses it."""
+    AF_INET = 2
+    SOCK_STREAM = 1
+
+    def __init__(self, server):
+        self.server = server
+
+    def getaddrinfo(self, host, port):
+        return [(self.AF_INET, self.SOCK_STREAM, 0, "", (host, port))]
+
+    def socket(self, family=AF_INET, kind=SOCK_STREAM):
+        return _Socket(self.server)
+
+
+class _Socket:
+    def __init__(self, server):
+        self.server = server
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.tls = False
+        self.closed = False
+        self.timed_out = False
+        self.timeout = None
+        self.closed_after_reply = False
+        self.envelope = None
+        self.data = None
+        self.auth_step = 0
+        self._wrote = False
+
+    def settimeout(self, seconds):
+        self.timeout = seconds
+
+    def connect(self, addr):
+        self.server.connects += 1
+        self.server._sockets.append(self)
+        self.outbox += b"220 sim.local ESMTP\r\n"
+
+    def write(self, data):
+        if self.closed:
+            raise OSError(104)  # ECONNRESET
+        if isinstance(data, str):
+            data = data.encode()
+        self.server.writes += 1
+        self.server.bytes_sent += len(data)
+        self._wrote = True
+        self.inbox += data
+        self.server._feed(self)
+        return len(data)
+
+    def _take(self, n):
+        self.server.reads += 1
+        if self._wrote:
+            self.server.round_trips += 1
+            self._wrote = False
+        if self.closed:
+            return b""
+        out = bytes(self.outbox[:n])
+        del self.outbox[:n]
+        if not self.outbox and self.closed_after_reply:
+            self.closed = True
+        return out
+
+    def read(self, n=-1):
+        return self._take(len(self.outbox) if n < 0 else n)
+
+    def readinto(self, buf):
+        data = self._take(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        end = self.outbox.find(b"\n")
+        line = self._take(len(self.outbox) if end < 0 else end + 1)
+        self.server.reads += max(len(line) - 1, 0)  # one read per byte on MicroPython
+        return line
+
+    def close(self):
+        self.closed = True
+        if self in self.server._sockets:
+            self.server._sockets.remove(self)
@@ -0,0 +1,281 @@
+# station_sim.py - Stub machine, network and umqtt modules for running the firmware
+# ==================================================================================
+#
+# Runs on CPython and on the MicroPython Unix port. install() registers stand-ins for
+# the Pico-only modules the Old firmware imports, so its uasyncio runtime runs in real
+# time on the host:
+#   machine   Pin, and I2C buses with emulated BME680s (bme680_sim.py) on bus 0
+#   network   WLAN whose link can be taken down and brought back (wifi_down/wifi_up)
+#   umqtt     MQTTClient that records publishes while the link is up
+#   ntptime   time() answering while the link is up, NTP_OFFSET s ahead of the host clock
+#             (block_ntp() makes it time out like on a network that blocks UDP port 123)
+# and wires umail to the SMTP stand-in (smtp_sim.py). station.http_socket_module() is a
+# socket module for clock.sync_http(): a web server whose Date header is in NTP time.
+#
+#   import station_sim
+#   station = station_sim.install(pipelining=True)   # before importing config / main
+#   import config                                    # override settings here
+#   import main
+#   main.umail.socket = station.smtp.socket_module()
+#   main.umail.ssl_wrap_socket = station.smtp.wrap_socket
+#   sys.modules["clock"].socket = station.http_socket_module()
+#
+# On CPython the MicroPython additions to time (ticks_ms, sleep_ms, ...) and
+# asyncio.sleep_ms are provided as well.
+
+import sys
+import time
+
+import bme680_sim
+import smtp_sim
+
+try:
+    FIRMWARE_DIR = __file__.rsplit("/", 1)[0] + "/../Old" if "/" in __file__ else "../Old"
+except NameError:
+    FIRMWARE_DIR = "../Old"
+
+JOIN_MS = 300  # time from wlan.connect() until the link is up
+NTP_OFFSET = 150000000  # s the NTP time is ahead of the local clock (Pico RTC starts in 2021)
+
+
+def install(sensors=(0x77,), **smtp_options):
+    """Register the stub modules, put the Old firmware first on the import path and return
+    a ``Station`` that controls them. ``sensors`` are the BME680 addresses on bus 0."""
+    _time_shims()
+    smtp = smtp_sim.install(**smtp_options)  # first: its ubinascii also takes str
+    bme680_sim.install()
+    station = Station(smtp, sensors)
+    sys.modules["machine"] = _Machine(station)
+    sys.modules["network"] = _Network(station)
+    umqtt = _Module()
+    umqtt.simple = _Module()
+    umqtt.simple.MQTTClient = lambda *args, **kwargs: _MQTTClient(station, *args, **kwargs)
+    sys.modules["umqtt"] = umqtt
+    sys.modules["umqtt.simple"] = umqtt.simple
+    ntptime = _Module()
+    ntptime.time = station.ntp_time
+    sys.modules["ntptime"] = ntptime
+    if FIRMWARE_DIR in sys.path:
+        sys.path.remove(FIRMWARE_DIR)
+    sys.path.insert(0, FIRMWARE_DIR)
+    return station
+
+
+def _time_shims():
+    if hasattr(time, "ticks_ms"):
+        return
+
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_us():
+        return int(time.monotonic() * 1000000)
+
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_add = lambda a, b: a + b
+    time.ticks_diff = lambda a, b: a - b
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+    import asyncio
+    if not hasattr(asyncio, "sleep_ms"):
+        asyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+
+
+# --- STATION ---
+class Station:
+    """What the stubs share: the WiFi link, the sensors, the SMTP server and the MQTT
+    broker's log of (topic, payload) publishes."""
+
+    def __init__(self, smtp, sensors):
+        self.smtp = smtp
+        self.sims = {address: bme680_sim.BME680Sim(time) for address in sensors}
+        self.link = True
+        self.joins = 0
+        self.published = []
+        self.mqtt_connects = 0
+        self.mqtt_untimed = 0  # connects and publishes that could block without a timeout
+        self.mqtt_open = 0  # MQTT sockets not closed yet
+        self.ntp_queries = 0
+        self.ntp_blocked = False
+        self.http_queries = 0
+
+    def wifi_down(self):
+        """Lose the access point: the connection drops and joins fail until wifi_up()."""
+        self.link = False
+
+    def wifi_up(self):
+        self.link = True
+
+    def block_ntp(self):
+        """NTP queries time out from now on; HTTP still answers."""
+        self.ntp_blocked = True
+
+    def ntp_time(self):
+        self.ntp_queries += 1
+        if not self.link or self.ntp_blocked:
+            raise OSError(110)  # ETIMEDOUT
+        return int(time.time()) + NTP_OFFSET
+
+    def http_socket_module(self):
+        module = _Module()
+        module.getaddrinfo = lambda host, port: [(2, 1, 0, "", (host, port))]
+        module.socket = lambda *args: _HTTPSocket(self)
+        return module
+
+
+# --- web server for clock.sync_http() ---
+_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+class _HTTPSocket:
+    def __init__(self, station):
+        self._station = station
+        self._lines = []
+
+    def settimeout(self, value):
+        pass
+
+    def connect(self, addr):
+        if not self._station.link:
+            raise OSError(113)  # EHOSTUNREACH
+
+    def write(self, data):
+        assert data.startswith(b"HEAD / HTTP/1.0\r\n"), data
+        self._station.http_queries += 1
+        t = time.gmtime(int(time.time()) + NTP_OFFSET)
+        date = "%s, %02d %s %d %02d:%02d:%02d GMT" % (
+            _DAYS[t[6]], t[2], _MONTHS[t[1] - 1], t[0], t[3], t[4], t[5])
+        self._lines = [b"HTTP/1.0 301 Moved Permanently\r\n",
+                       b"Location: http://www.example.com/\r\n",
+                       b"Date: " + date.encode() + b"\r\n", b"\r\n"]
+
+    def readline(self):
+        return self._lines.pop(0) if self._lines else b""
+
+    def close(self):
+        pass
+
+
+# --- machine ---
+class _Pin:
+    def __init__(self, pin, *args, **kwargs):
+        self.pin = pin
+
+
+class _Machine:
+    Pin = _Pin
+
+    def __init__(self, station):
+        self._station = station
+
+    def I2C(self, bus, scl=None, sda=None, freq=None):
+        return bme680_sim.FakeI2C(self._station.sims if bus == 0 else {})
+
+
+# --- network ---
+class _WLAN:
+    def __init__(self, station):
+        self._station = station
+        self._active = False
+        self._joined = None  # ticks_ms when the link comes up, None = not joined
+
+    def active(self, on=None):
+        if on is not None:
+            self._active = on
+        return self._active
+
+    def connect(self, ssid, password):
+        if self._active and self._station.link:
+            self._station.joins += 1
+            self._joined = time.ticks_add(time.ticks_ms(), JOIN_MS)
+
+    def disconnect(self):
+        self._joined = None
+
+    def isconnected(self):
+        if not self._station.link:
+            self._joined = None
+        return self._joined is not None and time.ticks_diff(time.ticks_ms(), self._joined) >= 0
+
+    def ifconfig(self):
+        return ("192.168.4.2", "255.255.255.0", "192.168.4.1", "192.168.4.1")
+
+
+class _Network:
+    STA_IF = 0
+    AP_IF = 1
+
+    def __init__(self, station):
+        self._station = station
+        self._wlan = None
+
+    def WLAN(self, interface=0):
+        # One radio: every WLAN() is the same interface
+        if self._wlan is None:
+            self._wlan = _WLAN(self._station)
+        return self._wlan
+
+
+# --- umqtt ---
+class _MQTTSocket:
+    def __init__(self, station):
+        self._station = station
+        self.timeout = None
+        self.closed = False
+        station.mqtt_open += 1
+
+    def settimeout(self, value):
+        self.timeout = value
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._station.mqtt_open -= 1
+
+
+class _MQTTClient:
+    def __init__(self, station, client_id, server, port=0, user=None, password=None,
+                 keepalive=0, ssl=False):
+        self._station = station
+        self._connected = False
+        self.sock = None
+
+    def _check(self):
+        if not (self._connected and self._station.link):
+            raise OSError(104)  # ECONNRESET
+
+    def connect(self, clean_session=True, timeout=None):
+        self.sock = _MQTTSocket(self._station)
+        self.sock.settimeout(timeout)
+        if timeout is None:
+            self._station.mqtt_untimed += 1
+        if not self._station.link:
+            raise OSError(113)  # EHOSTUNREACH
+        self._connected = True
+        self._station.mqtt_connects += 1
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._check()
+        if qos and self.sock.timeout is None:
+            self._station.mqtt_untimed += 1  # would wait for the PUBACK forever
+        self._station.published.append((topic, msg))
+        if qos:
+            self.sock.setblocking(True)  # as umqtt's wait_msg() does
+
+    def ping(self):
+        self._check()
+
+    def disconnect(self):
+        self._check()  # umqtt writes DISCONNECT first, that fails on a lost link
+        self._connected = False
+        self.sock.close()
+
+
+class _Module:
+    """Attribute holder standing in for a module."""
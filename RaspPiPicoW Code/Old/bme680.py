@@ -42,6 +42,14 @@ try:
     import struct
 except ImportError:
     import ustruct as struct
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 
 #    I2C ADDRESS/BITS/SETTINGS
 #    -----------------------------------------------------------------------
@@ -80,25 +88,75 @@ _LOOKUP_TABLE_2 = (4096000000.0, 2048000000.0, 1024000000.0, 512000000.0, 255744
                    64000000.0, 32258064.0, 16016016.0, 8000000.0, 4000000.0, 2000000.0, 1000000.0,
                    500000.0, 250000.0, 125000.0)
 
+# Bosch's integer gas tables pre-scaled into MicroPython's small int range (+-2**30): table 1
+# shifted right by 12, table 2 by 3. Neither loses more than a few parts in a million.
+_LOOKUP_TABLE_1_INT = (524287, 524287, 524287, 524287, 524287, 519045, 524287, 520093, 524287,
+                       524287, 523239, 521666, 524287, 519045, 524287, 524287)
+
+_LOOKUP_TABLE_2_INT = (512000000, 256000000, 128000000, 64000000, 31968031, 15888778, 8000000,
+                       4032258, 2002002, 1000000, 500000, 250000, 125000, 62500, 31250, 15625)
+
+
+BME680Reading = namedtuple('BME680Reading',
+                           ('temperature', 'humidity', 'pressure', 'gas', 'gas_carried'))
+"""One compensated sample: temperature in degrees celsius, relative humidity in %, pressure in
+   hectoPascals and gas resistance in ohms, all taken from the same conversion. ``gas_carried``
+   is True when the heater was skipped and ``gas`` repeats the last gas measurement."""
+
+
+def _cdiv(num, den):
+    """Integer division truncating towards zero, like C. Python's ``//`` floors instead, which
+       differs from Bosch's reference code for negative intermediates."""
+    quot = abs(num) // abs(den)
+    return -quot if (num < 0) != (den < 0) else quot
+
+
+def _mul_shr(a, b, shift):
+    """``(a * b) >> shift`` exactly, without the full product: ``a`` is split into 14 bit
+       limbs, so with ``|b| < 2**16`` no step is larger than the result times 2**14 (or the
+       result itself for shifts below 14). Keeps the integer engine in small ints."""
+    hi = a >> 14
+    lo = a & 0x3FFF
+    if shift >= 14:
+        return (hi * b + ((lo * b) >> 14)) >> (shift - 14)
+    return ((hi * b) << (14 - shift)) + ((lo * b) >> shift)
 
-def _read24(arr):
-    """Parse an unsigned 24-bit value as a floating point and return it."""
-    ret = 0.0
-    #print([hex(i) for i in arr])
-    for b in arr:
-        ret *= 256.0
-        ret += float(b & 0xFF)
-    return ret
+
+def _calc_gas_wait(duration):
+    """Encode a heater duration in milliseconds as a GAS_WAIT register value: 6 bits of value
+       and a 2 bit multiplier of 1, 4, 16 or 64."""
+    if duration >= 0xFC0:
+        return 0xFF
+    factor = 0
+    while duration > 0x3F:
+        duration //= 4
+        factor += 1
+    return duration + (factor << 6)
 
 
 class Adafruit_BME680:
     """Driver from BME680 air quality sensor
 
        :param int refresh_rate: Maximum number of readings per second. Faster property reads
-         will be from the previous reading."""
-    def __init__(self, *, refresh_rate=10):
+         will be from the previous reading.
+       :param bool integer_math: Use Bosch's integer-only compensation formulas instead of the
+         floating point ones. Much cheaper on MCUs without an FPU, such as the RP2040."""
+    def __init__(self, *, refresh_rate=10, integer_math=False):
         """Check the BME680 was found, read the coefficients and enable the sensor for continuous
            reads."""
+        self.bus_transactions = 0
+        """Number of bus transactions so far. May be reset by the caller."""
+        self.sample_transactions = 0
+        """Number of bus transactions the last reading took."""
+
+        self._shadow = {}  # last value written to each configuration register
+
+        # Preallocated buffers, so a reading does not touch the heap for bus traffic
+        self._data = bytearray(15)
+        self._pairs = bytearray(8)
+        pairs = memoryview(self._pairs)
+        self._pair_views = (pairs[:2], pairs[:4], pairs[:6], pairs[:8])
+
         self._write(_BME680_REG_SOFTRESET, [0xB6])
         time.sleep(0.005)
 
@@ -107,15 +165,29 @@ class Adafruit_BME680:
         if chip_id != _BME680_CHIPID:
             raise RuntimeError('Failed to find BME680! Chip ID 0x%x' % chip_id)
 
+        self._integer_math = integer_math
         self._read_calibration()
 
-        # set up heater
-        self._write(_BME680_BME680_RES_HEAT_0, [0x73])
-        self._write(_BME680_BME680_GAS_WAIT_0, [0x65])
+        # set up heater: profile 0 keeps the fixed register values this driver always used
+        self._write_pairs(bytes((_BME680_BME680_RES_HEAT_0, 0x73, _BME680_BME680_GAS_WAIT_0, 0x65)))
+        self._heater_durations = [(0x65 & 0x3F) << (2 * (0x65 >> 6))]  # 37 * 4 ms
+        self._heater_profiles = {}
+        self._heater_profile = 0
 
         self.sea_level_pressure = 1013.25
         """Pressure in hectoPascals at sea level. Used to calibrate ``altitude``."""
 
+        self.gas_every = 1
+        """Measure gas on every Nth reading only; the readings in between skip the heater and
+           carry the last gas value forward. 0 disables this count."""
+        self.gas_interval = 0
+        """Measure gas once at least this many seconds have passed since the last gas
+           measurement, even if ``gas_every`` has not been reached yet. 0 disables it."""
+        self._readings_since_gas = 0
+        self._last_gas = time.ticks_ms()
+        self._run_gas = True
+        self._gas_measured = False
+
         # Default oversampling and filter register values.
         self._pressure_oversample = 0b011
         self._temp_oversample = 0b100
@@ -128,6 +200,7 @@ class Adafruit_BME680:
         self._adc_gas = None
         self._gas_range = None
         self._t_fine = None
+        self._sample_start_transactions = 0
 
         self._last_reading = time.ticks_ms()
         self._min_refresh_time = 1000 // refresh_rate
@@ -180,17 +253,111 @@ class Adafruit_BME680:
         else:
             raise RuntimeError("Invalid size")
 
+    @property
+    def heater_profile(self):
+        """The heater profile used for gas readings: 0 for the default one, or a number returned
+           by ``add_heater_profile()``. Switching costs no extra bus transaction, as the new
+           value goes out with the next reading's configuration write."""
+        return self._heater_profile
+
+    @heater_profile.setter
+    def heater_profile(self, profile):
+        if 0 <= profile < len(self._heater_durations):
+            self._heater_profile = profile
+        else:
+            raise RuntimeError("Invalid heater profile")
+
+    def add_heater_profile(self, temperature, duration, ambient_temperature=25):
+        """Compute the heater register values for a target temperature and store them in the
+           next of the sensor's 10 heater set-points. The values are computed once from the
+           calibration data; adding the same profile again returns the cached one.
+
+           :param int temperature: Target heater temperature in degrees celsius, 200 to 400.
+           :param int duration: Heating time in milliseconds, up to 4032.
+           :param int ambient_temperature: Ambient temperature in degrees celsius.
+           :return: The profile number to assign to ``heater_profile``."""
+        key = (temperature, duration, ambient_temperature)
+        if key in self._heater_profiles:
+            return self._heater_profiles[key]
+        profile = len(self._heater_durations)
+        if profile >= 10:
+            raise RuntimeError("No free heater profile")
+
+        res_heat = self._calc_res_heat(temperature, ambient_temperature)
+        gas_wait = _calc_gas_wait(duration)
+        self._write_pairs(bytes((_BME680_BME680_RES_HEAT_0 + profile, res_heat,
+                                 _BME680_BME680_GAS_WAIT_0 + profile, gas_wait)))
+        self._heater_durations.append((gas_wait & 0x3F) << (2 * (gas_wait >> 6)))
+        self._heater_profiles[key] = profile
+        return profile
+
+    def _calc_res_heat(self, temperature, ambient_temperature):
+        """Heater resistance register value for a target temperature, following Bosch's
+           calc_heater_res()"""
+        par_gh1, par_gh2, par_gh3 = self._gas_calibration_int
+        temperature = min(temperature, 400)
+        var1 = _cdiv(ambient_temperature * par_gh3, 1000) * 256
+        var2 = (par_gh1 + 784) * _cdiv(_cdiv((par_gh2 + 154009) * temperature * 5, 100) + 3276800, 10)
+        var3 = var1 + _cdiv(var2, 2)
+        var4 = _cdiv(var3, self._res_heat_range + 4)
+        var5 = (131 * self._res_heat_val) + 65536
+        res_heat_x100 = (_cdiv(var4, var5) - 250) * 34
+        return _cdiv(res_heat_x100 + 50, 100) & 0xFF
+
     @property
     def temperature(self):
         """The compensated temperature in degrees celsius."""
         self._perform_reading()
-        calc_temp = (((self._t_fine * 5) + 128) / 256)
-        return calc_temp / 100
+        return self._calc_temperature()
 
     @property
     def pressure(self):
         """The barometric pressure in hectoPascals"""
         self._perform_reading()
+        return self._calc_pressure()
+
+    @property
+    def humidity(self):
+        """The relative humidity in RH %"""
+        self._perform_reading()
+        return self._calc_humidity()
+
+    @property
+    def altitude(self):
+        """The altitude based on current ``pressure`` vs the sea level pressure
+           (``sea_level_pressure``) - which you must enter ahead of time)"""
+        pressure = self.pressure # in Si units for hPascal
+        return 44330.77 * (1.0 - math.pow(pressure / self.sea_level_pressure, 0.1902632))
+
+    @property
+    def gas(self):
+        """The gas resistance in ohms"""
+        self._perform_reading()
+        return self._calc_gas()
+
+    def read_all(self):
+        """Perform a single reading and return temperature, humidity, pressure and gas as one
+           ``BME680Reading``. Unlike reading the four properties one after another, this costs
+           one conversion and heater cycle, and all values come from the same moment."""
+        self._perform_reading()
+        return self._make_reading()
+
+    def _make_reading(self):
+        """Compensate all four channels of the last reading into a ``BME680Reading``"""
+        return BME680Reading(self._calc_temperature(), self._calc_humidity(),
+                             self._calc_pressure(), self._calc_gas(), not self._run_gas)
+
+    def _calc_temperature(self):
+        """Compensated temperature in degrees celsius from the last reading."""
+        if self._integer_math:
+            return self._calc_temperature_int() / 100
+        calc_temp = (((self._t_fine * 5) + 128) / 256)
+        return calc_temp / 100
+
+    def _calc_pressure(self):
+        """Compensated pressure in hectoPascals from the last reading."""
+        if self._integer_math:
+            return self._calc_pressure_int() / 100
         var1 = (self._t_fine / 2) - 64000
         var2 = ((var1 / 4) * (var1 / 4)) / 2048
         var2 = (var2 * self._pressure_calibration[5]) / 4
@@ -210,10 +377,10 @@ class Adafruit_BME680:
         calc_pres += ((var1 + var2 + var3 + (self._pressure_calibration[6] * 128)) / 16)
         return calc_pres/100
 
-    @property
-    def humidity(self):
-        """The relative humidity in RH %"""
-        self._perform_reading()
+    def _calc_humidity(self):
+        """Compensated relative humidity in RH % from the last reading."""
+        if self._integer_math:
+            return self._calc_humidity_int() / 1000
         temp_scaled = ((self._t_fine * 5) + 128) / 256
         var1 = ((self._adc_hum - (self._humidity_calibration[0] * 16)) -
                 ((temp_scaled * self._humidity_calibration[2]) / 200))
@@ -235,23 +402,90 @@ class Adafruit_BME680:
             calc_hum = 0
         return calc_hum
 
-    @property
-    def altitude(self):
-        """The altitude based on current ``pressure`` vs the sea level pressure
-           (``sea_level_pressure``) - which you must enter ahead of time)"""
-        pressure = self.pressure # in Si units for hPascal
-        return 44330.77 * (1.0 - math.pow(pressure / self.sea_level_pressure, 0.1902632))
-
-    @property
-    def gas(self):
-        """The gas resistance in ohms"""
-        self._perform_reading()
+    def _calc_gas(self):
+        """Compensated gas resistance in ohms from the last reading."""
+        if self._integer_math:
+            return self._calc_gas_int()
         var1 = ((1340 + (5 * self._sw_err)) * (_LOOKUP_TABLE_1[self._gas_range])) / 65536
         var2 = ((self._adc_gas * 32768) - 16777216) + var1
         var3 = (_LOOKUP_TABLE_2[self._gas_range] * var1) / 512
         calc_gas_res = (var3 + (var2 / 2)) / var2
         return int(calc_gas_res)
 
+    # Integer compensation, following Bosch's BME680 reference driver (bme680.c). Every
+    # intermediate stays an int; only the caller scales the final value to physical units.
+    # Where Bosch relies on 32 or 64 bit arithmetic the steps are rearranged (_mul_shr,
+    # quotient and remainder) so that every value stays a MicroPython small int (+-2**30)
+    # over the sensor's range (-40..85 degrees, 300..1100 hPa); reading allocates no longs.
+
+    def _calc_t_fine_int(self):
+        """Integer t_fine from the last temperature ADC value."""
+        par_t1, par_t2, par_t3 = self._temp_calibration_int
+        var1 = (self._adc_temp >> 3) - (par_t1 << 1)
+        var2 = (var1 * par_t2) >> 11
+        var3 = ((var1 >> 1) * (var1 >> 1)) >> 12
+        var3 = (var3 * (par_t3 << 4)) >> 14
+        return var2 + var3
+
+    def _calc_temperature_int(self):
+        """Compensated temperature in 1/100 degrees celsius."""
+        return ((self._t_fine * 5) + 128) >> 8
+
+    def _calc_pressure_int(self):
+        """Compensated pressure in Pascal."""
+        par = self._pressure_calibration_int
+        var1 = (self._t_fine >> 1) - 64000
+        square = _mul_shr(var1 >> 2, var1 >> 2, 11)  # ((var1 >> 2) * (var1 >> 2)) >> 11
+        var2 = (square * par[5]) >> 2
+        var2 = var2 + ((var1 * par[4]) << 1)
+        var2 = (var2 >> 2) + (par[3] << 16)
+        # (((square >> 2) * (par[2] << 5)) >> 3) + ((par[1] * var1) >> 1), then >> 18; halved
+        # before the sum, the first term being even
+        var1 = ((((square >> 2) * par[2]) << 1) + _mul_shr(var1, par[1], 2)) >> 17
+        var1 = _mul_shr(32768 + var1, par[0], 15)
+        calc_pres = 1048576 - self._adc_pres - (var2 >> 12)
+        # Bosch multiplies by 3125 first; quotient and remainder keep the dividend small
+        quot = calc_pres // var1
+        rem = calc_pres - quot * var1
+        if calc_pres >= 343598:  # calc_pres * 3125 >= 0x40000000
+            calc_pres = (quot * 3125 + (rem * 3125) // var1) << 1
+        else:
+            calc_pres = quot * 6250 + (rem * 6250) // var1
+        var1 = (par[8] * (((calc_pres >> 3) * (calc_pres >> 3)) >> 13)) >> 12
+        var2 = ((calc_pres >> 2) * par[7]) >> 13
+        cube = (calc_pres >> 8) * (calc_pres >> 8) * (calc_pres >> 8)
+        var3 = _mul_shr(cube, par[9], 17)
+        return calc_pres + ((var1 + var2 + var3 + (par[6] << 7)) >> 4)
+
+    def _calc_humidity_int(self):
+        """Compensated relative humidity in 1/1000 RH %, clamped to 0..100000."""
+        par = self._humidity_calibration_int
+        temp_scaled = ((self._t_fine * 5) + 128) >> 8
+        var1 = (self._adc_hum - (par[0] * 16)) - (_cdiv(temp_scaled * par[2], 100) >> 1)
+        var2 = (par[1] * (_cdiv(temp_scaled * par[3], 100) +
+                          _cdiv((temp_scaled * _cdiv(temp_scaled * par[4], 100)) >> 6, 100) +
+                          (1 << 14))) >> 10
+        var3 = var1 * var2
+        var4 = par[5] << 7
+        var4 = (var4 + _cdiv(temp_scaled * par[6], 100)) >> 4
+        var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
+        var6 = (var4 * var5) >> 1
+        calc_hum = (((var3 + var6) >> 10) * 1000) >> 12
+        if calc_hum > 100000:
+            calc_hum = 100000
+        elif calc_hum < 0:
+            calc_hum = 0
+        return calc_hum
+
+    def _calc_gas_int(self):
+        """Compensated gas resistance in ohms."""
+        # Bosch's var1 and var2 divided by 1024, from the pre-scaled tables
+        var1 = ((1340 + (5 * self._range_sw_err)) * _LOOKUP_TABLE_1_INT[self._gas_range]) >> 14
+        var2 = (self._adc_gas << 5) - 16384 + var1
+        # Bosch: (((table2 * var1) >> 9) + (var2 >> 1)) // var2, via var1 / var2 in Q14
+        ratio = ((var1 << 14) + (var2 >> 1)) // var2
+        return (_mul_shr(_LOOKUP_TABLE_2_INT[self._gas_range], ratio, 19) + 1) >> 1
+
     def _perform_reading(self):
         """Perform a single-shot reading from the sensor and fill internal data structure for
            calculations"""
@@ -259,31 +493,84 @@ class Adafruit_BME680:
         if 0 <= expired < self._min_refresh_time:
             time.sleep_ms(self._min_refresh_time - expired)
 
-        # set filter
-        self._write(_BME680_REG_CONFIG, [self._filter << 2])
-        # turn on temp oversample & pressure oversample
-        self._write(_BME680_REG_CTRL_MEAS,
-                    [(self._temp_oversample << 5)|(self._pressure_oversample << 2)])
-        # turn on humidity oversample
-        self._write(_BME680_REG_CTRL_HUM, [self._humidity_oversample])
-        # gas measurements enabled
-        self._write(_BME680_REG_CTRL_GAS, [_BME680_RUNGAS])
-
-        ctrl = self._read_byte(_BME680_REG_CTRL_MEAS)
-        ctrl = (ctrl & 0xFC) | 0x01  # enable single shot!
-        self._write(_BME680_REG_CTRL_MEAS, [ctrl])
-        new_data = False
-        while not new_data:
-            data = self._read(_BME680_REG_MEAS_STATUS, 15)
-            new_data = data[0] & 0x80 != 0
+        time.sleep_ms(self.start_measurement())
+        while not self._poll():
             time.sleep(0.005)
+
+    def start_measurement(self):
+        """Start a single-shot conversion and return at once, without waiting for it to finish.
+
+           :return: The expected conversion time in milliseconds. Sleep that long (or do other
+             work), then fetch the result with ``poll_result()``."""
+        self._sample_start_transactions = self.bus_transactions
+        self._run_gas = self._gas_due()
+        self._write_config(0x01)  # enable single shot!
+        return self.measurement_time_ms
+
+    def _gas_due(self):
+        """Whether the next reading should run the gas heater, according to ``gas_every`` and
+           ``gas_interval``"""
+        if not self._gas_measured:
+            return True
+        if self.gas_every and self._readings_since_gas + 1 >= self.gas_every:
+            return True
+        return bool(self.gas_interval and
+                    time.ticks_diff(time.ticks_ms(), self._last_gas) >= self.gas_interval * 1000)
+
+    def poll_result(self):
+        """Check once whether the conversion started by ``start_measurement()`` is done.
+
+           :return: A ``BME680Reading``, or None while the sensor is still busy."""
+        if not self._poll():
+            return None
+        return self._make_reading()
+
+    async def read_async(self):
+        """Awaitable version of ``read_all()`` for uasyncio: other tasks keep running while the
+           sensor converts and heats."""
+        await asyncio.sleep(self.start_measurement() / 1000)
+        while not self._poll():
+            await asyncio.sleep(0.005)
+        return self._make_reading()
+
+    @property
+    def measurement_time_ms(self):
+        """Expected duration of one forced-mode conversion in milliseconds, computed from the
+           oversampling settings and the gas heater duration like Bosch's bme680_get_profile_dur()"""
+        meas_cycles = (_BME680_SAMPLERATES[self._temp_oversample] +
+                       _BME680_SAMPLERATES[self._pressure_oversample] +
+                       _BME680_SAMPLERATES[self._humidity_oversample])
+        # TPH conversion, TPH switching, gas measurement and 1 ms wake up, all in us
+        meas_us = meas_cycles * 1963 + 477 * 4 + 477 * 5 + 1000
+        if not self._run_gas:
+            return (meas_us + 999) // 1000
+        return (meas_us + 999) // 1000 + self._heater_durations[self._heater_profile]
+
+    def _poll(self):
+        """Read the status and data registers once. If new data is there, fill the internal data
+           structure for calculations and return True."""
+        data = self._data
+        self._read_into(_BME680_REG_MEAS_STATUS, data)
+        if not data[0] & 0x80:
+            return False
         self._last_reading = time.ticks_ms()
+        self.sample_transactions = self.bus_transactions - self._sample_start_transactions
+
+        self._adc_pres = (data[2] << 12) | (data[3] << 4) | (data[4] >> 4)
+        self._adc_temp = (data[5] << 12) | (data[6] << 4) | (data[7] >> 4)
+        self._adc_hum = (data[8] << 8) | data[9]
+        if self._run_gas:
+            self._adc_gas = (data[13] << 2) | (data[14] >> 6)
+            self._gas_range = data[14] & 0x0F
+            self._readings_since_gas = 0
+            self._last_gas = self._last_reading
+            self._gas_measured = True
+        else:
+            self._readings_since_gas += 1
 
-        self._adc_pres = _read24(data[2:5]) / 16
-        self._adc_temp = _read24(data[5:8]) / 16
-        self._adc_hum = struct.unpack('>H', bytes(data[8:10]))[0]
-        self._adc_gas = int(struct.unpack('>H', bytes(data[13:15]))[0] / 64)
-        self._gas_range = data[14] & 0x0F
+        if self._integer_math:
+            self._t_fine = self._calc_t_fine_int()
+            return True
 
         var1 = (self._adc_temp / 8) - (self._temp_calibration[0] * 2)
         var2 = (var1 * self._temp_calibration[1]) / 2048
@@ -291,6 +578,7 @@ class Adafruit_BME680:
         var3 = (var3 * self._temp_calibration[2] * 16) / 16384
 
         self._t_fine = int(var2 + var3)
+        return True
 
     def _read_calibration(self):
         """Read & save the calibration coefficients"""
@@ -299,6 +587,11 @@ class Adafruit_BME680:
 
         coeff = list(struct.unpack('<hbBHhbBhhbbHhhBBBHbbbBbHhbb', bytes(coeff[1:39])))
         # print("\n\n",coeff)
+        # Heater range, heater resistance and switching error, each read once for both engines
+        heat_range = (self._read_byte(0x02) & 0x30) >> 4
+        heat_val = self._read_byte(0x00)
+        sw_err = self._read_byte(0x04) >> 4
+        self._read_calibration_int(coeff, heat_range, heat_val, sw_err)
         coeff = [float(i) for i in coeff]
         self._temp_calibration = [coeff[x] for x in [23, 0, 1]]
         self._pressure_calibration = [coeff[x] for x in [3, 4, 5, 7, 8, 10, 9, 12, 13, 14]]
@@ -310,18 +603,80 @@ class Adafruit_BME680:
         self._humidity_calibration[1] += self._humidity_calibration[0] % 16
         self._humidity_calibration[0] /= 16
 
-        self._heat_range = (self._read_byte(0x02) & 0x30) / 16
-        self._heat_val = self._read_byte(0x00)
-        self._sw_err = (self._read_byte(0x04) & 0xF0) / 16
+        self._heat_range = float(heat_range)
+        self._heat_val = float(heat_val)
+        self._sw_err = float(sw_err)
+
+    def _read_calibration_int(self, coeff, heat_range, heat_val, sw_err):
+        """Save the unpacked calibration coefficients and the raw heater registers as ints,
+           split and sign-extended the way Bosch does"""
+        self._temp_calibration_int = [coeff[x] for x in [23, 0, 1]]
+        self._pressure_calibration_int = [coeff[x] for x in [3, 4, 5, 7, 8, 10, 9, 12, 13, 14]]
+        self._gas_calibration_int = [coeff[x] for x in [25, 24, 26]]
+
+        # H1 and H2 share the nibbles of register 0xE2
+        e2 = coeff[17] & 0xFF
+        par_h1 = ((coeff[17] >> 8) << 4) | (e2 & 0x0F)
+        par_h2 = (coeff[16] << 4) | (e2 >> 4)
+        self._humidity_calibration_int = [par_h1, par_h2] + [coeff[x] for x in [18, 19, 20, 21, 22]]
+
+        self._res_heat_range = heat_range
+        self._res_heat_val = heat_val - 256 if heat_val > 127 else heat_val
+        self._range_sw_err = sw_err - 16 if sw_err > 7 else sw_err
+
+    def _write_config(self, mode):
+        """Write filter, oversampling and gas settings together with ``mode`` in one bus
+           transaction. Registers whose shadow copy already holds the wanted value are skipped;
+           CTRL_MEAS goes last as it starts the conversion and latches CTRL_HUM. A failed
+           write forgets all shadow copies, so the next call writes every register again."""
+        pairs = self._pairs
+        count = self._queue_changed(_BME680_REG_CONFIG, self._filter << 2, 0)
+        count = self._queue_changed(_BME680_REG_CTRL_HUM, self._humidity_oversample, count)
+        ctrl_gas = self._heater_profile | (_BME680_RUNGAS if self._run_gas else 0)
+        count = self._queue_changed(_BME680_REG_CTRL_GAS, ctrl_gas, count)
+        pairs[count] = _BME680_REG_CTRL_MEAS
+        pairs[count + 1] = (self._temp_oversample << 5) | (self._pressure_oversample << 2) | mode
+        for i in range(0, count, 2):
+            self._shadow[pairs[i]] = pairs[i + 1]
+        try:
+            self._write_pairs(self._pair_views[count // 2])
+        except Exception:
+            self._shadow.clear()
+            raise
+
+    def _queue_changed(self, register, value, count):
+        """Append 'register' and 'value' to the pending pairs at 'count' unless the shadow
+           copy already holds 'value'. Returns the new number of pending bytes."""
+        if self._shadow.get(register) == value:
+            return count
+        self._pairs[count] = register
+        self._pairs[count + 1] = value
+        return count + 2
 
     def _read_byte(self, register):
         """Read a byte register value and return it"""
         return self._read(register, 1)[0]
 
     def _read(self, register, length):
+        """Returns a new array of 'length' bytes from the 'register'"""
+        result = bytearray(length)
+        self._read_into(register, result)
+        return result
+
+    def _read_into(self, register, buf):
+        """Fills 'buf' with bytes read from the 'register'"""
         raise NotImplementedError()
 
     def _write(self, register, values):
+        """Writes an array of bytes to consecutive registers starting at 'register'"""
+        pairs = bytearray(2 * len(values))
+        for i, value in enumerate(values):
+            pairs[2 * i] = register + i
+            pairs[2 * i + 1] = value & 0xFF
+        self._write_pairs(pairs)
+
+    def _write_pairs(self, pairs):
+        """Writes register address/value pairs in a single bus transaction"""
         raise NotImplementedError()
 
 class BME680_I2C(Adafruit_BME680):
@@ -331,29 +686,28 @@ class BME680_I2C(Adafruit_BME680):
         :param int address: I2C device address
         :param bool debug: Print debug statements when True.
         :param int refresh_rate: Maximum number of readings per second. Faster property reads
-          will be from the previous reading."""
-    def __init__(self, i2c, address=0x77, debug=False, *, refresh_rate=10):
+          will be from the previous reading.
+        :param bool integer_math: Use the integer-only compensation engine."""
+    def __init__(self, i2c, address=0x77, debug=False, *, refresh_rate=10, integer_math=False):
         """Initialize the I2C device at the 'address' given"""
         self._i2c = i2c
         self._address = address
         self._debug = debug
-        super().__init__(refresh_rate=refresh_rate)
+        super().__init__(refresh_rate=refresh_rate, integer_math=integer_math)
 
-    def _read(self, register, length):
-        """Returns an array of 'length' bytes from the 'register'"""
-        result = bytearray(length)
-        self._i2c.readfrom_mem_into(self._address, register & 0xff, result)
+    def _read_into(self, register, buf):
+        """Fills 'buf' with bytes read from the 'register'"""
+        self._i2c.readfrom_mem_into(self._address, register & 0xff, buf)
+        self.bus_transactions += 1
         if self._debug:
-            print("\t${:x} read ".format(register), " ".join(["{:02x}".format(i) for i in result]))
-        return result
+            print("\t${:x} read ".format(register), " ".join(["{:02x}".format(i) for i in buf]))
 
-    def _write(self, register, values):
-        """Writes an array of 'length' bytes to the 'register'"""
+    def _write_pairs(self, pairs):
+        """Writes address/value pairs; the BME680 takes any number of them in one I2C write"""
         if self._debug:
-            print("\t${:x} write".format(register), " ".join(["{:02x}".format(i) for i in values]))
-        for value in values:
-            self._i2c.writeto_mem(self._address, register, bytearray([value & 0xFF]))
-            register += 1
+            print("\twrite", " ".join(["{:02x}".format(i) for i in pairs]))
+        self._i2c.writeto(self._address, pairs)
+        self.bus_transactions += 1
 
 
 class BME680_SPI(Adafruit_BME680):
@@ -364,16 +718,23 @@ class BME680_SPI(Adafruit_BME680):
         :param bool debug: Print debug statements when True.
         :param int refresh_rate: Maximum number of readings per second. Faster property reads
           will be from the previous reading.
+        :param bool integer_math: Use the integer-only compensation engine.
       """
 
-    def __init__(self, spi, cs, debug=False, *, refresh_rate=10):
+    def __init__(self, spi, cs, debug=False, *, refresh_rate=10, integer_math=False):
         self._spi = spi
         self._cs = cs
         self._debug = debug
+        self._cmd = bytearray(1)
+        self._page_cmd = bytearray(2)
+        self._spi_mem_page = None  # unknown until first selected
+        self._buffer = bytearray(8)
+        buffer = memoryview(self._buffer)
+        self._buffer_views = (buffer[:2], buffer[:4], buffer[:6], buffer[:8])
         self._cs(1)
-        super().__init__(refresh_rate=refresh_rate)
+        super().__init__(refresh_rate=refresh_rate, integer_math=integer_math)
 
-    def _read(self, register, length):
+    def _read_into(self, register, buf):
         if register != _BME680_REG_PAGE_SELECT:
             # _BME680_REG_PAGE_SELECT exists in both SPI memory pages
             # For all other registers, we must set the correct memory page
@@ -382,35 +743,40 @@ class BME680_SPI(Adafruit_BME680):
 
         try:
             self._cs(0)
-            self._spi.write(bytearray([register]))  # pylint: disable=no-member
-            result = bytearray(length)
-            self._spi.readinto(result)  # pylint: disable=no-member
+            self._cmd[0] = register
+            self._spi.write(self._cmd)  # pylint: disable=no-member
+            self._spi.readinto(buf)  # pylint: disable=no-member
+            self.bus_transactions += 1
             if self._debug:
-                print("\t${:x} read ".format(register), " ".join(["{:02x}".format(i) for i in result]))
+                print("\t${:x} read ".format(register), " ".join(["{:02x}".format(i) for i in buf]))
         except Exception as e:
             print (e)
-            result = None
         finally:
             self._cs(1)
-        return result
 
-    def _write(self, register, values):
-        if register != _BME680_REG_PAGE_SELECT:
+    def _write_pairs(self, pairs):
+        # All registers of one write must sit on the same memory page
+        if pairs[0] != _BME680_REG_PAGE_SELECT:
             # _BME680_REG_PAGE_SELECT exists in both SPI memory pages
             # For all other registers, we must set the correct memory page
-            self._set_spi_mem_page(register)
-        register &= 0x7F  # Write, bit 7 low.
+            self._set_spi_mem_page(pairs[0])
         try:
             self._cs(0)
-            buffer = bytearray(2 * len(values))
-            for i, value in enumerate(values):
-                buffer[2 * i] = register + i
-                buffer[2 * i + 1] = value & 0xFF
+            count = len(pairs)
+            buffer = self._buffer_views[count // 2 - 1] if count <= 8 else bytearray(count)
+            for i in range(0, count, 2):
+                buffer[i] = pairs[i] & 0x7F  # Write, bit 7 low.
+                buffer[i + 1] = pairs[i + 1]
             self._spi.write(buffer)  # pylint: disable=no-member
+            self.bus_transactions += 1
+            if pairs[0] == _BME680_REG_SOFTRESET:
+                self._spi_mem_page = None
             if self._debug:
-                print("\t${:x} write".format(register), " ".join(["{:02x}".format(i) for i in values]))
+                print("\twrite", " ".join(["{:02x}".format(i) for i in pairs]))
         except Exception as e:
             print (e)
+            self._spi_mem_page = None  # the page select may not have arrived
+            self._shadow.clear()  # nor the register values
         finally:
             self._cs(1)
 
@@ -418,4 +784,71 @@ class BME680_SPI(Adafruit_BME680):
         spi_mem_page = 0x00
         if register < 0x80:
             spi_mem_page = 0x10
-        self._write(_BME680_REG_PAGE_SELECT, [spi_mem_page])
+        if spi_mem_page == self._spi_mem_page:
+            return  # already selected, save the transaction
+        self._page_cmd[0] = _BME680_REG_PAGE_SELECT
+        self._page_cmd[1] = spi_mem_page
+        self._spi_mem_page = spi_mem_page
+        self._write_pairs(self._page_cmd)
+
+
+class BME680Bus:
+    """Drives several I2C connected BME680s, e.g. one on each address or one per I2C controller.
+       Conversions are triggered on all sensors back-to-back and collected afterwards, so a
+       cycle takes about one conversion time instead of one per sensor.
+
+        :param list i2c_buses: I2C device objects to scan.
+        :param dict ids: Sensor id per ``(bus index, address)``. Sensors found at other positions
+          get the next free ids, counting up from 1.
+        :param addresses: The I2C addresses a BME680 can have.
+
+       Any other keyword arguments are passed on to ``BME680_I2C``."""
+    def __init__(self, i2c_buses, ids=None, addresses=(0x77, 0x76), **kwargs):
+        self._buses = i2c_buses
+        self._ids = ids or {}
+        self._addresses = addresses
+        self._kwargs = kwargs
+        self.sensors = []
+        """Registered ``(sensor id, BME680_I2C)`` pairs."""
+
+    def scan(self):
+        """Register every BME680 found on the buses and return the number of sensors."""
+        for bus_index, i2c in enumerate(self._buses):
+            found = i2c.scan()
+            for address in self._addresses:
+                if address not in found:
+                    continue
+                try:
+                    sensor = BME680_I2C(i2c, address, **self._kwargs)
+                except (OSError, RuntimeError):
+                    continue  # some other device lives on this address
+                sensor_id = self._ids.get((bus_index, address))
+                if sensor_id is None:
+                    sensor_id = self._free_id()
+                self.sensors.append((sensor_id, sensor))
+        return len(self.sensors)
+
+    def _free_id(self):
+        taken = set(self._ids.values())
+        taken.update(sensor_id for sensor_id, _ in self.sensors)
+        sensor_id = 1
+        while sensor_id in taken:
+            sensor_id += 1
+        return sensor_id
+
+    def read_all(self):
+        """Read all sensors in one cycle.
+
+           :return: A list of ``(sensor id, BME680Reading)`` pairs."""
+        wait = 0
+        for _, sensor in self.sensors:
+            wait = max(wait, sensor.start_measurement())
+        time.sleep_ms(wait)
+        readings = []
+        for sensor_id, sensor in self.sensors:
+            reading = sensor.poll_result()
+            while reading is None:
+                time.sleep_ms(5)
+                reading = sensor.poll_result()
+            readings.append((sensor_id, reading))
+        return readings
@@ -4,13 +4,37 @@
 # --- WLAN ---
 WIFI_SSID = "dd-wrt"
 WIFI_PASSWORD = "54tzck23"
+WIFI_CHECK_INTERVAL = 10  # seconds between WiFi checks
+WIFI_RETRY_MAX = 300      # max seconds between reconnect attempts (backoff doubles)
+
+
+
+# --- CLOCK ---
+NTP_INTERVAL = 3600        # seconds between NTP syncs (first one as soon as WiFi is up)
+CLOCK_FILE = "clock.json"  # boot counter and measured drift of the local clock
+NTP_FALLBACK_AFTER = 3     # failed NTP syncs in a row before the time comes from HTTP
+TIME_HTTP_HOST = "google.com"  # its HTTP Date header is the fallback when NTP is blocked
 
 
 
 # --- SENSOR ---
 SENSOR_I2C_SDA = 4
 SENSOR_I2C_SCL = 5
-READ_INTERVAL = 60  # seconds between readings
+SENSOR_I2C1 = None  # (SDA, SCL) pins of a second I2C controller, e.g. (2, 3)
+READ_INTERVAL = 60  # seconds between readings (fixed grid, without ADAPTIVE_SAMPLING)
+ADAPTIVE_SAMPLING = True  # read more often while readings change quickly, less when stable
+READ_INTERVAL_MIN = 20    # seconds, grid of the adaptive sampler (shortest interval)
+READ_INTERVAL_MAX = 80    # seconds, longest interval when all is stable (multiple of MIN)
+SAMPLING_STEP = (0.2, 1.0, 0.2, 10000)  # change per reading to resolve: °C, %, hPa, Ohms (None = ignore)
+GAS_EVERY = 1       # run the gas heater every N readings, reuse last value in between
+SAMPLER_CORE1 = False  # read the sensors on the second core (_thread), networking stays on core 0
+RING_SIZE = 64         # readings buffered between the cores (packed, 19 bytes each)
+RING_POLL_MS = 100     # how often core 0 checks the ring for new readings
+
+# Only readings that carry news are sent (email and MQTT), see compressor.py
+COMPRESS_MODE = "swing"  # "deadband", "swing" (swinging door) or None to send every reading
+COMPRESS_TOLERANCE = (0.1, 0.5, 0.1, 5000)  # max error per channel: °C, %, hPa, Ohms
+COMPRESS_HEARTBEAT = 900  # seconds, a reading is sent at least this often per sensor
 
 
 
@@ -23,7 +47,13 @@ MQTT_PASSWORD = b"54tzck23"            # MQTT broker password
 MQTT_CLIENT_ID = b"pico-weatherstation-1"
 MQTT_SSL = False
 MQTT_KEEPALIVE = 60
+MQTT_TIMEOUT = 5                       # s a connect, publish or PUBACK may block before giving up
 MQTT_TOPIC_PREFIX = b"weatherstation"  # Base topic
+MQTT_RETRY_INTERVAL = 600              # min seconds between reconnect attempts
+MQTT_BATCH = 32                        # max packed readings per message (<topic>/packed)
+MQTT_FIELD_TOPICS = True               # also publish the newest values retained per field
+MQTT_OUTBOX_FILE = "mqtt_outbox.bin"   # readings kept on flash until the broker acknowledged them
+MQTT_OUTBOX_SIZE = 1440                # max readings in the outbox (1 day at 1/min), oldest overwritten
 
 
 
@@ -35,7 +65,11 @@ EMAIL_RECIPIENTS = [
     "jazz.kiewicz@gmail.com",
 ]
 
-EMAIL_INTERVAL = 5  # Send email every N readings
+EMAIL_INTERVAL = 5  # Send email every N readings (with COMPRESS_MODE: every kept reading)
+
+# Backlog drain of unsent_readings/: many saved readings per email, bounded per cycle
+UNSENT_DRAIN_MS = 2000      # max time per cycle spent sending saved readings (well below READ_INTERVAL_MIN)
+UNSENT_DRAIN_BYTES = 40000  # max bytes of saved files drained per cycle (one email)
 
 
 # --- GMAIL SMTP ---
@@ -44,12 +78,25 @@ SMTP_PORT = 587
 SMTP_USER = "jazz.kiewicz@gmail.com"
 SMTP_PASS = "muurnoakhmehjhuj"
 SMTP_FROM = "jazz.kiewicz@gmail.com"
+SMTP_TIMEOUT = 5  # seconds one SMTP step (connect, TLS, a reply) may block, well below READ_INTERVAL_MIN
+
+
+
+# --- TASKS ---
+QUEUE_SIZE = 16  # readings buffered per network task (email, MQTT), oldest dropped when full
+HEALTH_INTERVAL = 3600  # seconds between health records (stage timings, heap) by email, 0 = off
 
 
 
 # --- DEVICE ID ---
 MID = 1  # Measurement/Device ID
 
+# IDs per (I2C bus, address) when more than one BME680 is connected
+SENSOR_MIDS = {
+    (0, 0x77): MID,
+    (0, 0x76): MID + 1,
+}
+
 
 
 # --- DEBUG ---
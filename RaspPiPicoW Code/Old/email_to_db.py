@@ -2,6 +2,7 @@
 # ============================================================
 # Reads sensor data from Gmail and stores it in XAMPP MySQL database
 
+import sys
 import imaplib
 import email
 import json
@@ -56,7 +57,8 @@ def connect_mysql():
             host=DB_HOST,
             user=DB_USER,
             password=DB_PASS,
-            database=DB_NAME
+            database=DB_NAME,
+            time_zone="+00:00"  # the station sends UTC epoch seconds
         )
         print(f"✅ MySQL Connected to {DB_HOST}/{DB_NAME}")
         return conn
@@ -65,8 +67,12 @@ def connect_mysql():
         return None
 
 def parse_email_body(body):
-    """Extract JSON from email body (first JSON object found)."""
+    """Extract JSON from email body: a list of readings (backlog email) or the
+    first JSON object found."""
     try:
+        text = body.strip()
+        if text.startswith("["):
+            return json.loads(text)
         # Find JSON pattern: { ... }
         match = re.search(r'\{.*\}', body, re.DOTALL)
         if match:
@@ -81,6 +87,10 @@ def format_timestamp(ts_str):
     """
     Convert timestamp from Pico format (DD.MM.YYYY HH:MM:SS)
     to MySQL format (YYYY-MM-DD HH:MM:SS)
+    
+    Only readings saved to unsent_readings/ by the firmware before it sent epoch
+    seconds still carry this format. It is the station's local time and is
+    converted to UTC in SQL when stored.
     """
     try:
         # Parse: "28.01.2026 10:14:30" -> datetime object
@@ -103,9 +113,9 @@ def parse_decimal(value_str):
     except:
         return None
 
-def insert_measurement(conn, data):
+def insert_measurement(cursor, data):
     """
-    Insert measurement into messwert table.
+    Insert measurement into messwert table (no commit: one transaction per email).
     
     Expected data dict from Pico:
     {
@@ -115,41 +125,112 @@ def insert_measurement(conn, data):
         "druck": "1013,2",
         "qualitaet": "Good",
         "gas_resistance": 50000,
-        "timestamp": "28.01.2026 10:14:30"
+        "timestamp": 1769595270
     }
+    
+    timestamp is UTC epoch seconds and goes into FROM_UNIXTIME() as is, so
+    zeitpunkt holds UTC (see migrate_to_utc() for older rows); a
+    "DD.MM.YYYY HH:MM:SS" string from the older firmware's backlog is local time,
+    reformatted with format_timestamp() and converted with CONVERT_TZ().
+    Readings marked "unsynced" still carry the station's local time (taken before
+    its first NTP sync, on an earlier boot) and are skipped.
+    
+    Returns False for a reading that is skipped (invalid or unsynced); database
+    errors are raised so the caller can roll the whole email back.
+    """
+    # Extract and convert values
+    mid = data.get("mid")
+    temperatur = parse_decimal(data.get("temperatur"))
+    feuchtigkeit = parse_decimal(data.get("feuchte"))
+    luftdruck = parse_decimal(data.get("druck"))
+    zeitpunkt = data.get("timestamp")
+    sql_zeitpunkt = "FROM_UNIXTIME(%s)"
+    if isinstance(zeitpunkt, str):
+        zeitpunkt = format_timestamp(zeitpunkt)
+        sql_zeitpunkt = "CONVERT_TZ(%s, 'SYSTEM', '+00:00')"
+    
+    if "unsynced" in data:
+        print(f"   ⚠️ Skipped reading without NTP time: {data}")
+        return False
+    
+    # Validate required fields
+    if not all([mid, temperatur is not None, feuchtigkeit, luftdruck, isinstance(zeitpunkt, (int, str))]):
+        print(f"   ⚠️ Skipped reading with missing or invalid fields: {data}")
+        return False
+    feuchtigkeit = int(feuchtigkeit)
+    luftdruck = int(luftdruck)
+    
+    # SQL Insert
+    sql = f"""
+        INSERT INTO {DB_TABLE} (mid, zeitpunkt, temperatur, feuchtigkeit, luftdruck)
+        VALUES (%s, {sql_zeitpunkt}, %s, %s, %s)
     """
+    
+    values = (mid, zeitpunkt, temperatur, feuchtigkeit, luftdruck)
+    cursor.execute(sql, values)
+    
+    print(f"   ✅ Stored: {zeitpunkt} - MID:{mid}, Temp: {temperatur}°C, Humidity: {feuchtigkeit}%, Pressure: {luftdruck}hPa")
+    return True
+
+def store_email(conn, records):
+    """Store all readings of one email in one transaction: either every valid
+    reading is committed or, on a database error, none (rollback). Returns the
+    number of stored and skipped readings; raises on a database error."""
+    cursor = conn.cursor()
+    stored = skipped = 0
     try:
-        cursor = conn.cursor()
-        
-        # Extract and convert values
-        mid = data.get("mid")
-        temperatur = parse_decimal(data.get("temperatur"))
-        feuchtigkeit = int(float(parse_decimal(data.get("feuchte"))))
-        luftdruck = int(float(parse_decimal(data.get("druck"))))
-        zeitpunkt = format_timestamp(data.get("timestamp"))
-        
-        # Validate required fields
-        if not all([mid, temperatur is not None, feuchtigkeit, luftdruck, zeitpunkt]):
-            print(f"⚠️ Missing required fields in data: {data}")
-            return False
-        
-        # SQL Insert
-        sql = f"""
-            INSERT INTO {DB_TABLE} (mid, zeitpunkt, temperatur, feuchtigkeit, luftdruck)
-            VALUES (%s, %s, %s, %s, %s)
-        """
-        
-        values = (mid, zeitpunkt, temperatur, feuchtigkeit, luftdruck)
-        cursor.execute(sql, values)
+        for record in records:
+            if "health" in record:
+                log_health(record)
+            elif insert_measurement(cursor, record):
+                stored += 1
+            else:
+                skipped += 1
         conn.commit()
-        
-        print(f"   ✅ Stored: {zeitpunkt} - MID:{mid}, Temp: {temperatur}°C, Humidity: {feuchtigkeit}%, Pressure: {luftdruck}hPa")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return stored, skipped
+
+def migrate_to_utc(conn, until):
+    """Convert the readings stored before the switch to UTC, once.
+
+    Older versions stored zeitpunkt as the station's wall-clock time (the Pico RTC,
+    set to the PC's local time when it was connected to Thonny); now it holds UTC.
+    Run this once, before the new version stores its first reading, with until as
+    the switch in local time ("YYYY-MM-DD HH:MM:SS"):
+
+        python email_to_db.py --utc "2026-10-17 20:00:00"
+
+    Rows before until are converted from the MySQL server's system time zone, which
+    needs no time zone tables. A second run would shift them again.
+
+    Returns the number of converted rows.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"UPDATE {DB_TABLE} SET zeitpunkt = CONVERT_TZ(zeitpunkt, 'SYSTEM', '+00:00') "
+                       "WHERE zeitpunkt < %s", (until,))
+        conn.commit()
+        return cursor.rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         cursor.close()
-        return True
-        
-    except Exception as e:
-        print(f"   ❌ Database Insert Error: {e}")
-        return False
+
+def log_health(data):
+    """Print a health record of the station (stage timings and heap, see profiler.py).
+    Health records are not measurements and are not stored."""
+    health = data.get("health", {})
+    print(f"   🩺 Health {data.get('timestamp')} - MID:{data.get('mid')}, "
+          f"uptime {health.get('uptime_s')}s, heap free min {health.get('mem_free_min')} B, "
+          f"GC runs {health.get('gc_runs')}, missed samples {health.get('samples_missed')}")
+    for stage, (count, avg_us, max_us) in health.get("stages", {}).items():
+        print(f"      {stage:<7} {count:>5}x  avg {avg_us / 1000:9.1f} ms  max {max_us / 1000:9.1f} ms")
+    return True
 
 def check_and_sync():
     """Check Gmail for new sensor emails and sync to database."""
@@ -219,14 +300,19 @@ def check_and_sync():
                             # Parse JSON from body
                             data = parse_email_body(body)
                             if data:
-                                print(f"   ✅ JSON extracted")
+                                # Backlog emails carry a list of readings
+                                records = data if isinstance(data, list) else [data]
+                                print(f"   ✅ JSON extracted ({len(records)} readings)")
                                 
-                                # Insert into database
-                                if insert_measurement(mysql_conn, data):
+                                # Insert into database, all readings of the email at once
+                                try:
+                                    stored, skipped = store_email(mysql_conn, records)
+                                except Exception as e:
+                                    print(f"   ❌ Database Insert Error, rolled back, email stays unread: {e}")
+                                else:
+                                    print(f"   💾 Stored {stored} readings, skipped {skipped}")
                                     # Mark as read
                                     imap.store(email_id, '+FLAGS', '\\Seen')
-                                else:
-                                    print(f"   ⚠️ Failed to store in database")
                             else:
                                 print(f"   ❌ No valid JSON found in email")
                 else:
@@ -259,4 +345,10 @@ def check_and_sync():
 # ============================================================
 
 if __name__ == "__main__":
-    check_and_sync()
\ No newline at end of file
+    if len(sys.argv) == 3 and sys.argv[1] == "--utc":
+        conn = connect_mysql()
+        if conn:
+            print(f"🕒 Converted {migrate_to_utc(conn, sys.argv[2])} readings to UTC")
+            conn.close()
+    else:
+        check_and_sync()
\ No newline at end of file
@@ -6,8 +6,20 @@ import time
 import network
 import json
 import umail
-from bme680 import BME680_I2C
+from bme680 import BME680Bus
+from sharedring import SharedRing, FLAG_GAS_CARRIED, RECORD, RECORD_SIZE
+from ringcache import RingCache, FLAG_UNSYNCED
+from clock import Clock, NTP_TIMEOUT, HTTP_TIMEOUT
+from compressor import Compressor
+from sampling import AdaptiveInterval
+import profiler
 import os
+import struct
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
 
 from config import *
 
@@ -20,10 +32,30 @@ except ImportError:
     if DEBUG:
         print("⚠️ umqtt.simple not found - MQTT disabled")
 
+# Topics built once, not per publish
+MQTT_TOPIC_PACKED = MQTT_TOPIC_PREFIX + b"/packed"
+MQTT_TOPIC_FIELDS = tuple(MQTT_TOPIC_PREFIX + b"/" + name for name in
+                          (b"temperature", b"humidity", b"pressure", b"quality", b"gas_resistance"))
+
 # --- GLOBAL VARIABLES ---
 wlan = None
 mqtt_client = None
+mqtt_outbox = None  # RingCache of readings not yet acknowledged by the broker
+mqtt_ready = None   # set when the sampler adds to mqtt_outbox
+mqtt_outbox_boot = 0  # first outbox record of this boot
+clock = None          # NTP-disciplined Clock, readings carry its epoch seconds
+compressor = None     # Compressor deciding which readings are sent (COMPRESS_MODE)
+smtp_session = None  # open SMTP session, reused for all emails of one cycle
 readings_since_last_email = 0
+samples_missed = 0    # sampler slots skipped because the loop was blocked past them
+sampler_max_lag = 0   # worst delay (ms) of a reading behind its slot
+sampled = None        # Event set after each reading of sampler_task (None on core 1)
+sampler_next = 0      # ticks_ms of sampler_task's next slot
+sampler_gap_ms = 0    # ms from the last reading to the next slot
+sampler_gap_used = False  # a call longer than the gap already ran after the last reading
+stats = profiler.Profiler()  # stage timings and heap watermarks, sent as health record
+core1_stats = None    # core 1's Profiler (SAMPLER_CORE1), folded into stats by health_task
+core1_lock = None     # guards core1_stats between the cores
 
 # --- STARTUP ---
 print("\n" + "="*50)
@@ -32,25 +64,24 @@ print("="*50)
 
 # --- INITIALIZE SENSOR ---
 def init_sensor():
-    """Initialize BME680 sensor on I2C bus."""
+    """Find all BME680 sensors on the I2C bus(es) (addresses 0x77 and 0x76)."""
     try:
-        i2c = machine.I2C(0, scl=machine.Pin(SENSOR_I2C_SCL), 
-                         sda=machine.Pin(SENSOR_I2C_SDA), freq=100000)
-        sensor = BME680_I2C(i2c=i2c, address=0x77)
-        print("✅ Sensor: BME680 on address 0x77")
-        return sensor
-    except Exception as e:
-        if DEBUG:
-            print(f"⚠️ Address 0x77 failed: {e}")
-        try:
-            i2c = machine.I2C(0, scl=machine.Pin(SENSOR_I2C_SCL), 
-                             sda=machine.Pin(SENSOR_I2C_SDA), freq=100000)
-            sensor = BME680_I2C(i2c=i2c, address=0x76)
-            print("✅ Sensor: BME680 on address 0x76")
-            return sensor
-        except Exception as e2:
-            print(f"❌ Sensor Error: {e2}")
+        buses = [machine.I2C(0, scl=machine.Pin(SENSOR_I2C_SCL),
+                             sda=machine.Pin(SENSOR_I2C_SDA), freq=100000)]
+        if SENSOR_I2C1 is not None:
+            buses.append(machine.I2C(1, sda=machine.Pin(SENSOR_I2C1[0]),
+                                     scl=machine.Pin(SENSOR_I2C1[1]), freq=100000))
+        sensors = BME680Bus(buses, ids=SENSOR_MIDS)
+        if sensors.scan() == 0:
+            print("❌ Sensor Error: no BME680 found")
             return None
+        for mid, sensor in sensors.sensors:
+            sensor.gas_every = GAS_EVERY
+            print(f"✅ Sensor: BME680 found (MID {mid})")
+        return sensors
+    except Exception as e:
+        print(f"❌ Sensor Error: {e}")
+        return None
 
 # --- INITIALIZE WLAN ---
 def wifi_ok():
@@ -65,27 +96,33 @@ def init_wlan():
         print(f"📡 WiFi: Initializing...")
     return wlan
 
-# --- WIFI CONNECTION ---
-def connect_wifi():
-    """Connect to WiFi network."""
-    if wlan.isconnected():
-        if DEBUG:
-            print("✅ WiFi: Already connected")
-        return True
-    
-    print(f"📡 WiFi: Connecting to {WIFI_SSID}...")
-    wlan.connect(WIFI_SSID, WIFI_PASSWORD)
-    
-    for attempt in range(20):
-        if wlan.isconnected():
+# --- WIFI SUPERVISOR ---
+async def wifi_supervisor():
+    """Keep WiFi connected: check every WIFI_CHECK_INTERVAL seconds, reconnect with backoff.
+
+    wlan.connect() returns at once, the attempt is polled without blocking the other tasks.
+    """
+    backoff = WIFI_CHECK_INTERVAL
+    while True:
+        if not wlan.isconnected():
+            print(f"📡 WiFi: Connecting to {WIFI_SSID}...")
+            t = stats.start()
+            wlan.connect(WIFI_SSID, WIFI_PASSWORD)
+            for attempt in range(20):
+                if wlan.isconnected():
+                    break
+                await asyncio.sleep_ms(500)
+            if not wlan.isconnected():
+                print(f"❌ WiFi: Connection failed, retry in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, WIFI_RETRY_MAX)
+                continue
+            stats.stop(profiler.WIFI, t)
             ip_info = wlan.ifconfig()
             print(f"✅ WiFi: Connected!")
             print(f"   IP: {ip_info[0]}")
-            return True
-        time.sleep(0.5)
-    
-    print("❌ WiFi: Connection failed")
-    return False
+            backoff = WIFI_CHECK_INTERVAL
+        await asyncio.sleep(WIFI_CHECK_INTERVAL)
 
 # --- MQTT INITIALIZATION ---
 def init_mqtt():
@@ -111,43 +148,79 @@ def init_mqtt():
             keepalive=MQTT_KEEPALIVE,
             ssl=MQTT_SSL
         )
-        mqtt_client.connect()
+        try:
+            mqtt_client.connect(timeout=MQTT_TIMEOUT)
+        except TypeError:  # umqtt.simple before 1.4: connect() takes no timeout
+            mqtt_client.connect()
         print(f"✅ MQTT: Connected to {MQTT_SERVER.decode()}")
         return mqtt_client
     except Exception as e:
         print(f"❌ MQTT Error: {e}")
+        close_mqtt()
         return None
 
+def close_mqtt():
+    """Drop the MQTT client, closing its socket: a lost session would otherwise keep
+    its socket (and TLS buffers) until the garbage collector finds it."""
+    global mqtt_client
+    if mqtt_client is None:
+        return
+    try:
+        mqtt_client.disconnect()
+    except Exception:
+        # The broker is gone: DISCONNECT cannot be written, close the socket directly
+        try:
+            mqtt_client.sock.close()
+        except Exception:
+            pass
+    mqtt_client = None
+
 # --- MQTT PUBLISH ---
-def publish_mqtt(topic, payload):
-    """Publish message to MQTT broker."""
+def publish_mqtt(topic, payload, retain=False, qos=0):
+    """Publish payload (bytes) to topic (one of the precomputed MQTT_TOPIC_* bytes).
+
+    With qos=1 this returns only after the broker acknowledged the message.
+    """
     global mqtt_client
     
     if not MQTT_ENABLE or mqtt_client is None:
         return False
     
     try:
-        # Construct full topic
-        full_topic = MQTT_TOPIC_PREFIX + b"/" + topic.encode() if isinstance(topic, str) else MQTT_TOPIC_PREFIX + b"/" + topic
-        
-        # Ensure payload is bytes
-        if isinstance(payload, (dict, list)):
-            payload = json.dumps(payload).encode()
-        elif isinstance(payload, str):
-            payload = payload.encode()
-        
-        mqtt_client.publish(full_topic, payload)
+        # umqtt's wait_msg() sets the socket blocking again after every PUBACK, so the
+        # timeout is set per publish: a dead broker raises instead of hanging the loop
+        mqtt_client.sock.settimeout(MQTT_TIMEOUT)
+        mqtt_client.publish(topic, payload, retain, qos)
         if DEBUG:
-            print(f"📤 MQTT: Published to {full_topic.decode()}")
+            print(f"📤 MQTT: Published {len(payload)} bytes to {topic.decode()}")
         return True
     except Exception as e:
         print(f"❌ MQTT Publish Error: {e}")
         return False
 
+def pack_records(records):
+    """Outbox readings -> MQTT payload: the packed readings of sharedring.RECORD
+    (ts, mid, temperature*100, humidity*100, pressure Pa, gas Ohm, flags; little
+    endian, RECORD_SIZE bytes each) back to back, oldest first."""
+    payload = bytearray(len(records) * RECORD_SIZE)
+    for i, (ts, mid, temp, hum, press, gas, flags) in enumerate(records):
+        struct.pack_into(RECORD, payload, i * RECORD_SIZE, ts, mid, int(round(temp * 100)),
+                         int(round(hum * 100)), int(round(press * 100)), gas, flags)
+    return payload
+
+def publish_fields(record):
+    """Publish the values of record (the newest reading) retained to the per-field topics."""
+    ts, mid, temp, hum, press, gas, flags = record
+    values = ("{:.1f}".format(temp).replace(".", ","), "{:.1f}".format(hum).replace(".", ","),
+              "{:.1f}".format(press).replace(".", ","), air_quality(gas), str(gas))
+    for topic, value in zip(MQTT_TOPIC_FIELDS, values):
+        if not publish_mqtt(topic, value.encode(), retain=True):
+            return False
+    return True
+
 # --- MQTT RECONNECT ---
 def reconnect_mqtt():
     """Attempt to reconnect to MQTT broker if disconnected."""
-    global mqtt_client
     
     if not MQTT_ENABLE or not MQTT_AVAILABLE:
         return False
@@ -156,12 +229,13 @@ def reconnect_mqtt():
         return init_mqtt() is not None
     
     try:
+        mqtt_client.sock.settimeout(MQTT_TIMEOUT)
         mqtt_client.ping()
         return True
     except Exception:
         if DEBUG:
             print("⚠️ MQTT: Connection lost, reconnecting...")
-        mqtt_client = None
+        close_mqtt()
         return init_mqtt() is not None
 
 
@@ -178,23 +252,14 @@ def save_email_locally(subject, body, data):
         # Use timestamp from data if available, else current time
         ts = data.get("timestamp", None)
         if ts is None:
-            t = time.localtime()
-            ts = "{:04d}-{:02d}-{:02d}_{:02d}-{:02d}-{:02d}".format(
-                t[0], t[1], t[2], t[3], t[4], t[5]
-            )
-        else:
-            # convert "DD.MM.YYYY HH:MM:SS" -> "YYYY-MM-DD_HH-MM-SS"
-            # safe minimal conversion so filename has no spaces/colons
-            try:
-                day, month, year_time = ts.split(".")
-                year, time_part = year_time.split(" ", 1)
-                time_part = time_part.replace(":", "-")
-                ts = "{}-{}-{}_{}".format(year, month, day, time_part)
-            except:
-                ts = ts.replace(" ", "_").replace(":", "-")
-
-        # Unique filename: mid + timestamp
-        fname = "unsent_{}_{}.json".format(MID, ts)
+            ts = clock.now()
+
+        # Unique filename: mid + timestamp (sensors share the timestamp), zero-padded
+        # so that names sort by time; unsynced times repeat across boots
+        kind = "health" if "health" in data else data.get("mid", MID)
+        fname = "unsent_{}_{:010d}.json".format(kind, ts)
+        if "unsynced" in data:
+            fname = "unsent_{}_{:010d}_b{}.json".format(kind, ts, data["unsynced"])
         path = "{}/{}".format(base_dir, fname)
 
         payload = {
@@ -204,9 +269,11 @@ def save_email_locally(subject, body, data):
         }
 
         # Write JSON string to file
+        t = stats.start()
         json_str = json.dumps(payload)
         with open(path, "w") as f:
             f.write(json_str)
+        stats.stop(profiler.CACHE, t)
 
         if DEBUG:
             print("💾 Saved unsent email to", path)
@@ -216,43 +283,145 @@ def save_email_locally(subject, body, data):
         return False
     
     
-def process_unsent_emails():
-    """Send all unsent emails from unsent_readings/ folder."""
+def unsent_order(fname):
+    """Sort key of a file in unsent_readings/: its time in seconds since the port's epoch.
+
+    Names are unsent_<mid>_<epoch seconds>[_b<boot>].json, or
+    unsent_<mid>_YYYY-MM-DD_HH-MM-SS.json from firmware before epoch timestamps (local
+    time, and older than any epoch-named file).
+    """
+    stamp = fname[:-5].split("_", 2)[-1]
+    try:
+        if "-" not in stamp:
+            return int(stamp.split("_")[0])
+        date, hms = stamp.split("_")[:2]
+        year, month, day = (int(v) for v in date.split("-"))
+        hour, minute, second = (int(v) for v in hms.split("-"))
+        return time.mktime((year, month, day, hour, minute, second, 0, 0, 0))
+    except (ValueError, OverflowError):
+        return 0  # unknown name: first, so it cannot hold up the others
+
+async def process_unsent_emails():
+    """Drain unsent_readings/ in bulk: saved readings go out oldest first, many per email.
+
+    Each call sends at most one email, bounded by UNSENT_DRAIN_BYTES of saved files and
+    UNSENT_DRAIN_MS, and yields to the other tasks after every file, so a long backlog
+    cannot stall the sampler. Files are deleted only after the server accepted the email.
+    """
     base_dir = "unsent_readings"
-    if base_dir not in os.listdir():
+    if not EMAIL_ENABLE or base_dir not in os.listdir():
         return 0  # No folder, nothing to do
-    
-    sent_count = 0
+    if not clock.synced:
+        return 0  # saved readings of this boot still carry local time
+
+    start = time.ticks_ms()
     try:
-        files = os.listdir(base_dir)
-        json_files = [f for f in files if f.endswith('.json')]
-        
-        for fname in json_files:
-            path = f"{base_dir}/{fname}"
-            try:
-                with open(path, "r") as f:
-                    payload = json.loads(f.read())
-                
-                if DEBUG:
-                    print(f"📧 Sending saved email: {fname}")
-                
-                if send_email(payload["subject"], payload["body"], payload["data"]):
-                    os.remove(path)  # Delete if sent successfully
-                    sent_count += 1
-                    if DEBUG:
-                        print(f"✅ Sent & deleted: {fname}")
-                else:
-                    print(f"⚠️ Failed to send saved email: {fname}")
-                    
-            except Exception as e:
-                print(f"❌ Error processing {fname}: {e}")
-        
+        files = [f for f in os.listdir(base_dir) if f.endswith('.json')]
+        files.sort(key=unsent_order)
+
+        # Byte budget by file size (a saved file holds its reading about twice)
+        batch = []
+        budget = UNSENT_DRAIN_BYTES
+        for fname in files:
+            size = os.stat(f"{base_dir}/{fname}")[6]
+            if batch and size > budget:
+                break
+            batch.append(fname)
+            budget -= size
     except Exception as e:
         print(f"❌ Error scanning unsent folder: {e}")
-    
-    if DEBUG and sent_count > 0:
-        print(f"📤 Sent {sent_count} saved emails")
-    return sent_count
+        return 0
+    if not batch:
+        return 0
+
+    try:
+        recipients = EMAIL_RECIPIENTS
+    except NameError:
+        recipients = [EMAIL_TO]
+
+    for addr in recipients:
+        try:
+            await sampler_gap(SMTP_TIMEOUT * 1000)
+            sent = await send_unsent_batch(base_dir, batch, addr)
+        except Exception as e:
+            print("❌ Backlog email error to", addr, ":", e)
+            close_smtp()
+            continue
+        for fname in sent:
+            os.remove(f"{base_dir}/{fname}")
+        if DEBUG:
+            print(f"📤 Sent {len(sent)} saved readings in one email, "
+                  f"{len(files) - len(sent)} left ({time.ticks_diff(time.ticks_ms(), start)} ms)")
+        return len(sent)
+    return 0
+
+
+async def send_unsent_batch(base_dir, batch, addr):
+    """Stream the saved readings in batch to addr as one JSON list.
+
+    Files are read one at a time, so the email never sits in RAM as a whole, and the
+    sampler gets its turn after each one. Stops adding readings once UNSENT_DRAIN_MS
+    of streaming (connect and TLS not counted) are used up. Returns the files that
+    went out; raises if the server did not accept the email.
+    """
+    smtp = get_smtp()
+    t = stats.start()
+    smtp.to(addr)
+    start = time.ticks_ms()
+    smtp.write("From: " + SMTP_FROM + "\r\n")
+    smtp.write("To: " + addr + "\r\n")
+    smtp.write(f"Subject: wetterstation backlog - {len(batch)} readings\r\n")
+    smtp.write("Content-Type: application/json; charset=utf-8\r\n\r\n")
+    smtp.write("[")
+
+    sent = []
+    for fname in batch:
+        if sent and time.ticks_diff(time.ticks_ms(), start) > UNSENT_DRAIN_MS:
+            break
+        path = f"{base_dir}/{fname}"
+        try:
+            with open(path, "r") as f:
+                data = json.loads(f.read())["data"]
+        except (OSError, ValueError, KeyError) as e:
+            # Unreadable file: set it aside instead of retrying it every cycle
+            print(f"❌ Error reading {fname}: {e}")
+            os.rename(path, path + ".bad")
+            continue
+        restamp(data)
+        # One reading per line keeps SMTP lines short
+        smtp.write(("," if sent else "") + "\r\n" + json.dumps(data))
+        sent.append(fname)
+        await asyncio.sleep_ms(0)
+
+    smtp.write("\r\n]")
+    code, resp = smtp.send()
+    stats.stop(profiler.SMTP, t)
+    if code != 250:
+        raise Exception(f"rejected {code} {resp}")
+    return sent
+
+
+def get_smtp():
+    """Return the open SMTP session, connecting and logging in on first use."""
+    global smtp_session
+    if smtp_session is None:
+        t = stats.start()
+        smtp_session = umail.SMTP(SMTP_SERVER, SMTP_PORT, ssl=False, keepalive=True,
+                                  timeout=SMTP_TIMEOUT)
+        smtp_session.login(SMTP_USER, SMTP_PASS)
+        stats.stop(profiler.TLS, t)
+    return smtp_session
+
+
+def close_smtp():
+    """Close the SMTP session after a send cycle (TLS buffers cost a lot of RAM)."""
+    global smtp_session
+    if smtp_session is not None:
+        try:
+            smtp_session.quit()
+        except Exception:
+            pass
+        smtp_session = None
 
 
 def send_email(subject, body, data):
@@ -271,6 +440,13 @@ def send_email(subject, body, data):
         save_email_locally(subject, body, data)
         return False
 
+    # Local time until the first clock sync: keep it until it can be converted
+    if data.get("unsynced") == clock.boot:
+        if DEBUG:
+            print("🕒 Clock not synced yet, saving email locally instead of sending")
+        save_email_locally(subject, body, data)
+        return False
+
     # Make sure we have a list of recipients
     try:
         recipients = EMAIL_RECIPIENTS
@@ -286,10 +462,10 @@ def send_email(subject, body, data):
             if DEBUG:
                 print("📧 Email: Attempting to send to", addr, "...")
 
-            smtp = umail.SMTP(SMTP_SERVER, SMTP_PORT, ssl=False)
-            smtp.cmd("STARTTLS")
-            smtp.login(SMTP_USER, SMTP_PASS)
-
+            # Only the first email of a cycle pays for connect, TLS and AUTH;
+            # umail.SMTP upgrades to TLS itself when the server offers STARTTLS
+            smtp = get_smtp()
+            t = stats.start()
             smtp.to(addr)
             smtp.write("From: " + SMTP_FROM + "\r\n")
             smtp.write("To: " + addr + "\r\n")
@@ -297,8 +473,10 @@ def send_email(subject, body, data):
             smtp.write("Content-Type: text/plain; charset=utf-8\r\n\r\n")
             smtp.write(body)
 
-            smtp.send()
-            smtp.quit()
+            code, resp = smtp.send()
+            stats.stop(profiler.SMTP, t)
+            if code != 250:
+                raise Exception(f"rejected {code} {resp}")
 
             print("✅ Email: Sent successfully to", addr)
             sent_ok = True
@@ -307,6 +485,7 @@ def send_email(subject, body, data):
         except Exception as e:
             last_error = e
             print("❌ Email Error to", addr, ":", e)
+            close_smtp()
             # Try next address in the list
 
     if not sent_ok:
@@ -321,63 +500,124 @@ def send_email(subject, body, data):
 
 
 # --- SENSOR READING ---
-def read_sensor(sensor):
-    """Read data from BME680 sensor and return as JSON dict."""
-    if sensor is None:
+def read_sensors(sensors):
+    """Read all BME680 sensors in one cycle and return a list of (mid, reading) pairs."""
+    if sensors is None:
         return None
     
     try:
-        # READ ACTUAL VALUES FROM SENSOR
-        temp = sensor.temperature
-        hum = sensor.humidity
-        press = sensor.pressure
-        gas = sensor.gas  # Gas resistance in Ohms
-        
-        # Get current time
-        t = time.localtime()
-        timestamp_str = "{:02d}.{:02d}.{:04d} {:02d}:{:02d}:{:02d}".format(
-            t[2], t[1], t[0], t[3], t[4], t[5]
-        )
-        
-        # Print to console
-        if DEBUG:
-            print("="*50)
-            print(f"Temperatur: {temp:.1f} °C")
-            print(f"Feuchte:    {hum:.1f} %")
-            print(f"Druck:      {press:.1f} hPa")
-            print(f"Gas:        {gas} Ohms")
-            print(f"Zeit:       {timestamp_str}")
-            print("="*50)
-        
-        # Calculate air quality from gas resistance
-        # Lower ohms = worse air quality
-        if gas > 100000:
-            quality = "Exzellent"
-        elif gas > 50000:
-            quality = "Gut"
-        elif gas > 25000:
-            quality = "Okay"
-        elif gas > 10000:
-            quality = "Schlecht"
-        else:
-            quality = "Sehr Schlecht"
-        
-        # Create data dictionary with ACTUAL sensor values
-        data = {
-            "mid": MID,
-            "temperatur": "{:.1f}".format(temp).replace(".", ","),
-            "feuchte": "{:.1f}".format(hum).replace(".", ","),
-            "druck": "{:.1f}".format(press).replace(".", ","),
-            "qualitaet": quality,
-            "gas_resistance": gas,
-            "timestamp": timestamp_str
-        }
-        
-        return data
+        # Trigger all sensors back-to-back, one conversion for all four values each
+        t = stats.start()
+        readings = sensors.read_all()
+        stats.stop(profiler.READ, t)
+        return readings
     except Exception as e:
         print(f"❌ Sensor Error: {e}")
         return None
 
+def hand_over(local, readings, queue):
+    """Pass the readings of one slot, taken at local time local, to the network tasks:
+    as JSON dicts to the email queue and packed to the MQTT outbox on flash.
+
+    With COMPRESS_MODE only the readings the compressor keeps are passed on; with
+    "swing" these may include one of the previous slot, with its own time.
+    Before the first clock sync the readings keep local time and are marked unsynced
+    (restamp() converts them later).
+    """
+    if compressor is not None:
+        readings = compress(local, readings)
+        if not readings:
+            return
+    else:
+        # Time of the sampler slot, not of the (possibly delayed) read
+        readings = [(local, mid, reading) for mid, reading in readings]
+    flags = 0 if clock.synced else FLAG_UNSYNCED
+    t = stats.start()
+    for local, mid, reading in readings:
+        data = make_record(mid, reading, clock.epoch(local))
+        if flags:
+            data["unsynced"] = clock.boot
+        queue.put(data)
+    stats.stop(profiler.ENCODE, t)
+
+    if mqtt_outbox is not None:
+        t = stats.start()
+        for local, mid, (temp, hum, press, gas, gas_carried) in readings:
+            mqtt_outbox.append(clock.epoch(local), mid, temp, hum, press, gas,
+                               flags | (FLAG_GAS_CARRIED if gas_carried else 0))
+        stats.stop(profiler.CACHE, t)
+        mqtt_ready.set()
+
+def compress(local, readings):
+    """Offer the readings of one slot to the compressor; returns the kept ones as
+    (local time, mid, reading)."""
+    kept = []
+    for mid, (temp, hum, press, gas, gas_carried) in readings:
+        for ts, mid, values, flags in compressor.offer(
+                local, mid, (temp, hum, press, gas), FLAG_GAS_CARRIED if gas_carried else 0):
+            temp, hum, press, gas = values
+            kept.append((ts, mid, (temp, hum, press, int(gas + 0.5),
+                                   bool(flags & FLAG_GAS_CARRIED))))
+    return kept
+
+def restamp(data):
+    """Convert the local time of a reading (or health record) taken before the first
+    clock sync of this boot to epoch seconds, once the clock is synced.
+
+    Records left unsynced by an earlier boot cannot be converted and stay marked.
+    """
+    if data.get("unsynced") == clock.boot and clock.synced:
+        data["timestamp"] = clock.epoch(data["timestamp"])
+        del data["unsynced"]
+
+def format_timestamp(ts):
+    """Epoch seconds -> "DD.MM.YYYY HH:MM:SS" (UTC) for subjects and the console."""
+    t = time.gmtime(ts)
+    return "{:02d}.{:02d}.{:04d} {:02d}:{:02d}:{:02d}".format(
+        t[2], t[1], t[0], t[3], t[4], t[5]
+    )
+
+def make_record(mid, reading, ts):
+    """Turn one sensor reading into the JSON dict that gets sent."""
+    temp, hum, press, gas, gas_carried = reading  # gas resistance in Ohms
+    
+    # Print to console
+    if DEBUG:
+        print("="*50)
+        print(f"MID:        {mid}")
+        print(f"Temperatur: {temp:.1f} °C")
+        print(f"Feuchte:    {hum:.1f} %")
+        print(f"Druck:      {press:.1f} hPa")
+        print(f"Gas:        {gas} Ohms")
+        print(f"Zeit:       {format_timestamp(ts)}")
+        print("="*50)
+    
+    # Create data dictionary with ACTUAL sensor values
+    data = {
+        "mid": mid,
+        "temperatur": "{:.1f}".format(temp).replace(".", ","),
+        "feuchte": "{:.1f}".format(hum).replace(".", ","),
+        "druck": "{:.1f}".format(press).replace(".", ","),
+        "qualitaet": air_quality(gas),
+        "gas_resistance": gas,
+        "timestamp": ts  # epoch seconds (UTC)
+    }
+    
+    return data
+
+def air_quality(gas):
+    """Calculate air quality from gas resistance (Ohms). Lower ohms = worse air quality"""
+    if gas > 100000:
+        return "Exzellent"
+    elif gas > 50000:
+        return "Gut"
+    elif gas > 25000:
+        return "Okay"
+    elif gas > 10000:
+        return "Schlecht"
+    else:
+        return "Sehr Schlecht"
+
 # --- FORMAT EMAIL BODY (JSON) ---
 def format_email_body(data):
     """Format sensor data as JSON in email body."""
@@ -388,108 +628,380 @@ def format_email_body(data):
     
     return body
 
+# --- TASKS ---
+# The sampler, the WiFi supervisor, the email uplink and MQTT run as separate uasyncio
+# tasks. The sampler hands each reading to the email task through a bounded queue and
+# to the MQTT task through the outbox on flash, and never waits for them, so a slow
+# SMTP send, a WiFi reconnect or a backlog drain cannot shift the measurement grid.
+#
+# umail, ntptime, the HTTP time fallback and umqtt are not asynchronous: while they
+# wait for the network, the whole core waits, sampler included. Each of them is
+# therefore bounded by a socket timeout (SMTP_TIMEOUT, MQTT_TIMEOUT, NTP_TIMEOUT and
+# HTTP_TIMEOUT in clock.py) and only starts once sampler_gap() says that this timeout
+# still fits before the next slot. With SAMPLER_CORE1 the sampler has a core of its
+# own and nothing waits.
+
+class ReadingQueue:
+    """Bounded FIFO from the sampler to one network task.
+
+    put() never waits: when the task falls QUEUE_SIZE readings behind, the oldest one
+    is dropped (and counted), so a stalled task cannot hold up sampling.
+    """
+
+    def __init__(self, size):
+        self.items = []
+        self.size = size
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        if len(self.items) >= self.size:
+            self.items.pop(0)
+            self.dropped += 1
+        self.items.append(item)
+        self._ready.set()
+
+    async def get(self):
+        while not self.items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.items.pop(0)
+
+
+async def sampler_gap(ms):
+    """Wait until a network call that may block for up to ms fits before the next slot
+    of sampler_task. A call longer than half the gap between two readings runs right
+    after a reading, one per gap. Returns at once with SAMPLER_CORE1."""
+    global sampler_gap_used
+    while sampled is not None:
+        left = time.ticks_diff(sampler_next, time.ticks_ms())
+        if left >= ms:
+            return
+        if not sampler_gap_used and left >= sampler_gap_ms // 2:
+            sampler_gap_used = True
+            return
+        sampled.clear()
+        await sampled.wait()
+
+
+def slots_passed(deadline, interval):
+    """Slots to advance from deadline so that the next one still lies ahead (1 if on time)."""
+    return time.ticks_diff(time.ticks_ms(), deadline) // interval + 1
+
+
+def make_pacer():
+    """Grid of the sampler in seconds, and the AdaptiveInterval choosing the slots
+    between readings (None on a fixed grid of READ_INTERVAL)."""
+    if not ADAPTIVE_SAMPLING:
+        return READ_INTERVAL, None
+    return READ_INTERVAL_MIN, AdaptiveInterval(READ_INTERVAL_MIN,
+                                               READ_INTERVAL_MAX // READ_INTERVAL_MIN,
+                                               SAMPLING_STEP)
+
+
+def next_slots(pacer, ts, readings):
+    """Grid slots until the next reading: always 1 on a fixed grid, else as many as
+    the rate of change of the readings allows."""
+    if pacer is None:
+        return 1
+    for mid, reading in readings or ():
+        pacer.offer(ts, mid, (reading.temperature, reading.humidity,
+                              reading.pressure, reading.gas))
+    return pacer.next_slots()
+
+
+async def sampler_task(sensors, queue):
+    """Read all sensors on a grid of READ_INTERVAL seconds (READ_INTERVAL_MIN with
+    ADAPTIVE_SAMPLING, every few slots as make_pacer() decides).
+
+    The next deadline is the previous deadline plus the interval (ticks_ms), not the end
+    of the read plus a sleep, so read time and time spent in other tasks do not add up
+    to drift. Each reading is stamped with its slot on the grid. Slots that passed while
+    the loop was blocked are skipped and counted, never sampled in a burst.
+    """
+    global samples_missed, sampler_max_lag, sampler_next, sampler_gap_ms, sampler_gap_used
+    base, pacer = make_pacer()
+    interval = base * 1000
+    t0 = int(time.time())  # float on the Unix port
+    deadline = time.ticks_ms()
+    slot = 0
+    while True:
+        lag = time.ticks_diff(time.ticks_ms(), deadline)
+        sampler_max_lag = max(sampler_max_lag, lag)
+
+        ts = t0 + slot * base
+        readings = read_sensors(sensors)
+        if readings:
+            hand_over(ts, readings, queue)
+        else:
+            print("⚠️ Sensor read failed, retrying next slot...")
+
+        # Next slot on the grid; skip the ones already past
+        planned = next_slots(pacer, ts, readings)
+        passed = slots_passed(deadline, interval)
+        samples_missed += max(passed - planned, 0)
+        slot += max(planned, passed)
+        deadline = time.ticks_add(deadline, max(planned, passed) * interval)
+        wait = time.ticks_diff(deadline, time.ticks_ms())
+        # Network calls waiting in sampler_gap() may run now
+        sampler_next = deadline
+        sampler_gap_ms = wait
+        sampler_gap_used = False
+        sampled.set()
+        if DEBUG:
+            print(f"⏳ Next reading in {wait} ms (slot #{slot}, late {lag} ms, missed {samples_missed})")
+            if MQTT_ENABLE and mqtt_client is None:
+                print("   ⚠️ MQTT: Not connected (email still working)")
+            print()
+        await asyncio.sleep_ms(wait)
+
+
+def core1_sampler(sensors, ring):
+    """Sampler for the second core (SAMPLER_CORE1): the grid of sampler_task, in its own
+    thread with blocking sleeps, handing packed readings to core 0 through ring.
+
+    Nothing on core 0 (TLS, JSON, flash writes) can delay a conversion here.
+    """
+    global samples_missed, sampler_max_lag
+    base, pacer = make_pacer()
+    interval = base * 1000
+    t0 = int(time.time())  # float on the Unix port
+    deadline = time.ticks_ms()
+    slot = 0
+    while True:
+        sampler_max_lag = max(sampler_max_lag, time.ticks_diff(time.ticks_ms(), deadline))
+        ts = t0 + slot * base
+        readings = None
+        try:
+            t = core1_stats.start()
+            readings = sensors.read_all()
+            with core1_lock:
+                core1_stats.stop(profiler.READ, t)
+            for mid, reading in readings:
+                ring.put(ts, mid, reading.temperature, reading.humidity, reading.pressure,
+                         reading.gas, FLAG_GAS_CARRIED if reading.gas_carried else 0)
+        except Exception as e:
+            print(f"❌ Sensor Error: {e}")
+
+        planned = next_slots(pacer, ts, readings)
+        passed = slots_passed(deadline, interval)
+        samples_missed += max(passed - planned, 0)
+        slot += max(planned, passed)
+        deadline = time.ticks_add(deadline, max(planned, passed) * interval)
+        time.sleep_ms(time.ticks_diff(deadline, time.ticks_ms()))
+
+
+async def ring_task(ring, queue):
+    """Core 0 side of SAMPLER_CORE1: hand readings from core 1 over to the network tasks."""
+    while True:
+        record = ring.get()
+        if record is None:
+            await asyncio.sleep_ms(RING_POLL_MS)
+            continue
+        ts, mid, temp, hum, press, gas, flags = record
+        hand_over(ts, [(mid, (temp, hum, press, gas, bool(flags & FLAG_GAS_CARRIED)))], queue)
+
+
+async def uplink_task(queue):
+    """Email every EMAIL_INTERVAL-th reading (with COMPRESS_MODE every reading the
+    compressor kept) and every health record, then drain unsent_readings/ while idle.
+
+    The drain waits while sending fails, so a server that times out costs one attempt
+    per reading, not one per saved file as well."""
+    global readings_since_last_email
+    uplink_ok = True
+    while True:
+        data = await queue.get()
+        try:
+            restamp(data)
+            if "health" in data:
+                # Health records go out at once and do not count as readings
+                await sampler_gap(SMTP_TIMEOUT * 1000)
+                uplink_ok = send_email(f"wetterstation health - {format_timestamp(data['timestamp'])}",
+                           format_email_body(data), data)
+            else:
+                readings_since_last_email += 1
+                # Compressed readings are the ones needed to rebuild the series:
+                # thinning them out further would break the tolerance
+                if EMAIL_ENABLE and (compressor is not None or
+                                     readings_since_last_email >= EMAIL_INTERVAL):
+                    if DEBUG:
+                        print(f"📧 Email: Sending ({readings_since_last_email} readings since the last)...")
+                    subject = f"wetterstation daten - {format_timestamp(data['timestamp'])}"
+                    t = stats.start()
+                    body = format_email_body(data)
+                    stats.stop(profiler.ENCODE, t)
+                    await sampler_gap(SMTP_TIMEOUT * 1000)
+                    uplink_ok = send_email(subject, body, data)
+                    if uplink_ok:
+                        readings_since_last_email = 0
+                    elif DEBUG:
+                        # Keep trying - will retry on next reading
+                        print("⚠️ Email failed, will retry next cycle")
+
+            # Catch up on saved readings, one bounded batch at a time, while no newer
+            # reading is waiting
+            while uplink_ok and not len(queue) and wifi_ok():
+                sent_count = await process_unsent_emails()
+                if not sent_count:
+                    break
+                print(f"📤 Caught up {sent_count} unsent emails")
+                await asyncio.sleep_ms(0)
+        except Exception as e:
+            print(f"❌ Uplink Error: {e}")
+        if not len(queue):
+            close_smtp()
+
+
+async def health_task(queue):
+    """Every HEALTH_INTERVAL seconds, send the stage timings and heap watermarks of the
+    interval as a health record through the email uplink."""
+    while True:
+        await asyncio.sleep(HEALTH_INTERVAL)
+        if core1_stats is not None:
+            with core1_lock:
+                stats.merge(core1_stats)
+        health = stats.health()
+        health["samples_missed"] = samples_missed
+        health["sampler_max_lag_ms"] = sampler_max_lag
+        health["queue_dropped"] = queue.dropped
+        if mqtt_outbox is not None:
+            health["mqtt_outbox"] = len(mqtt_outbox)
+        if compressor is not None:
+            health["compress_kept"] = [compressor.kept, compressor.offered]
+        if DEBUG:
+            print(f"🩺 Health: {health}")
+        data = {
+            "mid": MID,
+            "health": health,
+            "timestamp": clock.now(),
+        }
+        if not clock.synced:
+            data["unsynced"] = clock.boot
+        queue.put(data)
+
+
+async def clock_task():
+    """Sync the clock over NTP as soon as WiFi is up, then every NTP_INTERVAL seconds.
+
+    After NTP_FALLBACK_AFTER failed syncs in a row (a network blocking UDP port 123)
+    the time is taken from the HTTP Date header of TIME_HTTP_HOST instead, so the
+    readings still go out. The first sync of a boot also converts the readings in the
+    MQTT outbox that were taken before it.
+    """
+    while True:
+        first = not clock.synced
+        synced = False
+        if wifi_ok():
+            await sampler_gap(NTP_TIMEOUT * 1000)
+            synced = clock.sync()
+            if not synced and clock.failures >= NTP_FALLBACK_AFTER:
+                await sampler_gap(HTTP_TIMEOUT * 1000)
+                synced = clock.sync_http(TIME_HTTP_HOST)
+        if not synced:
+            await asyncio.sleep(WIFI_CHECK_INTERVAL)
+            continue
+        if DEBUG:
+            print(f"🕒 Clock: synced, offset {clock.offset} s, drift {clock.drift * 1e6:.1f} ppm")
+        if first and mqtt_outbox is not None:
+            mqtt_outbox.restamp(mqtt_outbox_boot, clock.epoch)
+            mqtt_ready.set()
+        await asyncio.sleep(NTP_INTERVAL)
+
+
+async def mqtt_task():
+    """Publish the readings in mqtt_outbox, oldest first, with QoS 1; reconnect at most
+    every MQTT_RETRY_INTERVAL seconds.
+
+    Up to MQTT_BATCH readings go out packed in one message to MQTT_TOPIC_PACKED and
+    leave the outbox only once the broker acknowledged them, so readings taken while
+    the broker is unreachable are replayed in order after the reconnect. The newest
+    reading is also published retained to the per-field topics (MQTT_FIELD_TOPICS).
+    Nothing goes out before the first clock sync: until then readings have local time.
+    """
+    retry = time.ticks_ms()
+    while True:
+        if not len(mqtt_outbox) or not clock.synced:
+            mqtt_ready.clear()
+            await mqtt_ready.wait()
+            continue
+        if mqtt_client is None:
+            wait = time.ticks_diff(retry, time.ticks_ms())
+            if not wifi_ok() or wait > 0:
+                await asyncio.sleep_ms(max(wait, 1000))
+                continue
+            retry = time.ticks_add(time.ticks_ms(), MQTT_RETRY_INTERVAL * 1000)
+            await sampler_gap(MQTT_TIMEOUT * 1000)
+            if not reconnect_mqtt():
+                continue
+
+        await sampler_gap(MQTT_TIMEOUT * 1000)
+        count = min(len(mqtt_outbox), MQTT_BATCH)
+        records = mqtt_outbox.peek(count)  # damaged records are left out
+        t = stats.start()
+        published = not records or publish_mqtt(MQTT_TOPIC_PACKED, pack_records(records), qos=1)
+        if published:
+            mqtt_outbox.drop(count)
+            if records and MQTT_FIELD_TOPICS and not len(mqtt_outbox):
+                published = publish_fields(records[-1])
+        stats.stop(profiler.MQTT, t)
+        if not published:
+            close_mqtt()
+        await asyncio.sleep_ms(0)
+
+
+async def run(sensors):
+    """Start the network tasks, then sample in this task (or on core 1)."""
+    global mqtt_outbox, mqtt_ready, mqtt_outbox_boot, clock, compressor, sampled
+    global core1_stats, core1_lock
+    clock = Clock(CLOCK_FILE)
+    if COMPRESS_MODE:
+        compressor = Compressor(COMPRESS_MODE, COMPRESS_TOLERANCE, COMPRESS_HEARTBEAT)
+    queue = ReadingQueue(QUEUE_SIZE)
+    asyncio.create_task(wifi_supervisor())
+    asyncio.create_task(clock_task())
+    asyncio.create_task(uplink_task(queue))
+    # MQTT (optional) has its own buffer: a dead broker does not hold up email
+    if MQTT_ENABLE and MQTT_AVAILABLE:
+        mqtt_outbox = RingCache(MQTT_OUTBOX_FILE, MQTT_OUTBOX_SIZE)
+        mqtt_outbox_boot = mqtt_outbox.head
+        mqtt_ready = asyncio.Event()
+        asyncio.create_task(mqtt_task())
+    if HEALTH_INTERVAL:
+        asyncio.create_task(health_task(queue))
+    if SAMPLER_CORE1:
+        import _thread
+        ring = SharedRing(RING_SIZE)
+        core1_stats = profiler.Profiler()
+        core1_lock = _thread.allocate_lock()
+        _thread.start_new_thread(core1_sampler, (sensors, ring))
+        await ring_task(ring, queue)
+    else:
+        sampled = asyncio.Event()
+        await sampler_task(sensors, queue)
+
+
 # --- MAIN EXECUTION ---
 def main():
-    """Main application loop."""
-    global readings_since_last_email, mqtt_client
-    
+    """Set up the hardware and run the tasks."""
     # Initialize hardware
-    sensor = init_sensor()
-    if sensor is None:
+    sensors = init_sensor()
+    if sensors is None:
         print("❌ Cannot continue without sensor!")
         return
-    
-    wlan_obj = init_wlan()
-    
-    # Connect to WiFi
-    if not connect_wifi():
-        print("❌ Cannot continue without WiFi!")
-        return
-    
-    # Initialize MQTT (optional - doesn't block startup)
-    if MQTT_ENABLE:
-        mqtt_client = init_mqtt()
-        if mqtt_client is None and DEBUG:
-            print("⚠️ MQTT not available, but email will still work!")
-    
+
+    # WiFi and MQTT connect in their tasks; readings are saved locally until then
+    init_wlan()
+
     print("\\n" + "="*50)
     print("✅ System ready - starting measurements")
     print("="*50 + "\\n")
-    
-    # Main loop
-    loop_count = 0
-    
+
     try:
-        while True:
-            loop_count += 1
-            
-            # Read sensor with ACTUAL VALUES
-            data = read_sensor(sensor)
-            if data is None:
-                print("⚠️ Sensor read failed, retrying...")
-                time.sleep(READ_INTERVAL)
-                continue
-            
-            # --- PROCESS UNSENT EMAILS (NEW) ---
-            if wifi_ok():
-                sent_count = process_unsent_emails()
-                if sent_count > 0:
-                    print(f"📤 Caught up {sent_count} unsent emails")
-            
-            # --- MQTT Publishing (OPTIONAL) ---
-            # MQTT failures do NOT block email sending
-            mqtt_published = False
-            if MQTT_ENABLE and MQTT_AVAILABLE:
-                # Try reconnect every 10 readings
-                if loop_count % 10 == 0:
-                    if mqtt_client is None:
-                        reconnect_mqtt()
-                
-                # Publish individual readings
-                if mqtt_client is not None:
-                    try:
-                        publish_mqtt("temperature", data['temperatur'])
-                        publish_mqtt("humidity", data['feuchte'])
-                        publish_mqtt("pressure", data['druck'])
-                        publish_mqtt("quality", data['qualitaet'])
-                        publish_mqtt("gas_resistance", str(data['gas_resistance']))
-                        
-                        # Publish complete JSON
-                        publish_mqtt("data", data)
-                        mqtt_published = True
-                    except Exception as e:
-                        if DEBUG:
-                            print(f"⚠️ MQTT publish error: {e}")
-                        mqtt_client = None
-            
-            # --- EMAIL Sending (INDEPENDENT) ---
-            # Emails are sent REGARDLESS of MQTT status
-            readings_since_last_email += 1
-            
-            if EMAIL_ENABLE and readings_since_last_email >= EMAIL_INTERVAL:
-                if DEBUG:
-                    print(f"📧 Email: Sending (every {EMAIL_INTERVAL} readings)...")
-                subject = f"wetterstation daten - {data['timestamp']}"
-                body = format_email_body(data)
-                email_sent = send_email(subject, body, data)
-                
-                # Only reset counter if email succeeded
-                if email_sent:
-                    readings_since_last_email = 0
-                else:
-                    # Keep trying - will retry on next cycle
-                    if DEBUG:
-                        print("⚠️ Email failed, will retry next cycle")
-            
-            # Wait before next reading
-            if DEBUG:
-                print(f"⏳ Next reading in {READ_INTERVAL}s (Loop #{loop_count})")
-                if MQTT_ENABLE and mqtt_client is None:
-                    print("   ⚠️ MQTT: Not connected (email still working)")
-                print()
-            
-            time.sleep(READ_INTERVAL)
-            
+        asyncio.run(run(sensors))
     except KeyboardInterrupt:
         print("\\n⏹️ Stopped by user")
     except Exception as e:
@@ -497,14 +1009,13 @@ def main():
         import sys
         sys.print_exception(e)
     finally:
-        if mqtt_client is not None:
-            try:
-                mqtt_client.disconnect()
-            except:
-                pass
+        close_smtp()
+        if mqtt_outbox is not None:
+            mqtt_outbox.close()
+        close_mqtt()
+        asyncio.new_event_loop()  # clear the task queue for a soft reboot
         print("\\n👋 Shutdown complete")
 
 # --- RUN ---
 if __name__ == "__main__":
     main()
-
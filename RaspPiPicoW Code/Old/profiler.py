@@ -0,0 +1,122 @@
+# profiler.py - Stage timers and heap telemetry for the Pico firmware
+# ====================================================================
+#
+# main.py (Old and New) wraps each stage (sensor read, encode, cache write, WiFi connect, TLS connect,
+# SMTP send, MQTT publish) in start()/stop(). Per stage the count, total and worst
+# time in microseconds go into preallocated arrays, so timing a stage allocates
+# nothing. At the end of each stage the heap is sampled for the lowest free and the
+# highest allocated bytes; a drop of the allocated bytes between two samples counts
+# as a garbage collection (MicroPython keeps no count of its own, so collections that
+# follow each other without a sample in between count once).
+#
+# health() turns the numbers into a dict for the uplink and starts a new interval.
+# A Profiler is not thread-safe: a sampler on the second core keeps its own, and
+# core 0 folds it in with merge() under a lock.
+
+import gc
+import time
+from array import array
+
+READ = 0     # sensors.read_all()
+ENCODE = 1   # reading -> JSON dict / email body
+CACHE = 2    # saving a reading (unsent_readings/ in Old, cache.bin in New)
+WIFI = 3     # wlan.connect() until the link is up
+TLS = 4      # SMTP connect, TLS handshake and AUTH
+SMTP = 5     # one email, MAIL FROM to the server's answer
+MQTT = 6     # publishing one reading
+
+STAGES = ("read", "encode", "cache", "wifi", "tls", "smtp", "mqtt")
+
+try:
+    _mem_free = gc.mem_free
+    _mem_alloc = gc.mem_alloc
+except AttributeError:  # CPython on the host: no heap figures
+    _mem_free = _mem_alloc = None
+
+
+class Profiler:
+    """Per-stage timings and heap watermarks of one reporting interval.
+
+    Totals are 32-bit: one interval may hold up to ~71 minutes of time per stage.
+    """
+
+    def __init__(self):
+        self.count = array("I", [0] * len(STAGES))
+        self.total = array("I", [0] * len(STAGES))  # us
+        self.worst = array("I", [0] * len(STAGES))  # us
+        self.gc_runs = 0
+        self.started = time.time()
+        self._last_alloc = 0
+        self.reset()
+
+    def reset(self):
+        """Start a new interval."""
+        for i in range(len(STAGES)):
+            self.count[i] = self.total[i] = self.worst[i] = 0
+        self.gc_runs = 0
+        self.since = time.ticks_ms()
+        self.mem_free_min = self.mem_alloc_max = 0
+        if _mem_free is not None:
+            self.mem_free_min = _mem_free()
+            self.mem_alloc_max = self._last_alloc = _mem_alloc()
+
+    def start(self):
+        return time.ticks_us()
+
+    def stop(self, stage, t0):
+        """Book the time since t0 (from start()) to stage."""
+        dt = time.ticks_diff(time.ticks_us(), t0)
+        self.count[stage] += 1
+        self.total[stage] += dt
+        if dt > self.worst[stage]:
+            self.worst[stage] = dt
+        self.sample_memory()
+
+    def sample_memory(self):
+        if _mem_free is None:
+            return
+        free = _mem_free()
+        alloc = _mem_alloc()
+        if free < self.mem_free_min:
+            self.mem_free_min = free
+        if alloc > self.mem_alloc_max:
+            self.mem_alloc_max = alloc
+        if alloc < self._last_alloc:
+            self.gc_runs += 1
+        self._last_alloc = alloc
+
+    def merge(self, other):
+        """Add the interval of other (e.g. core 1's Profiler) to this one, then reset other."""
+        for i in range(len(STAGES)):
+            self.count[i] += other.count[i]
+            self.total[i] += other.total[i]
+            if other.worst[i] > self.worst[i]:
+                self.worst[i] = other.worst[i]
+        self.gc_runs += other.gc_runs
+        if other.mem_free_min and other.mem_free_min < self.mem_free_min:
+            self.mem_free_min = other.mem_free_min
+        if other.mem_alloc_max > self.mem_alloc_max:
+            self.mem_alloc_max = other.mem_alloc_max
+        other.reset()
+
+    def health(self):
+        """Numbers of the interval so far as a dict, then reset().
+
+        ``stages`` maps each stage that ran to [count, average us, worst us].
+        """
+        self.sample_memory()
+        stages = {}
+        for i, name in enumerate(STAGES):
+            if self.count[i]:
+                stages[name] = [self.count[i], self.total[i] // self.count[i], self.worst[i]]
+        record = {
+            "uptime_s": int(time.time() - self.started),
+            "interval_s": time.ticks_diff(time.ticks_ms(), self.since) // 1000,
+            "mem_free_min": self.mem_free_min,
+            "mem_alloc_max": self.mem_alloc_max,
+            "mem_free": _mem_free() if _mem_free is not None else 0,
+            "gc_runs": self.gc_runs,
+            "stages": stages,
+        }
+        self.reset()
+        return record
@@ -0,0 +1,217 @@
+import struct
+
+# ===============================
+# Ring buffer cache on flash
+# ===============================
+# Fixed-size records (struct) in one file, plus a header holding the start (tail)
+# and end (head) of the queue. Appending and dropping cost a small constant,
+# however many readings the cache holds.
+#
+# File layout:
+#   [header A][header B][record 0][record 1] ... [record capacity-1]
+#
+# The header is written to A and B in turn (generation counter + checksum), so a
+# power loss in the middle of a write hits one copy at most; on open the valid copy
+# with the highest generation wins. Every record carries its sequence number and a
+# checksum: a half-written record is discarded, a fully written record the header
+# does not know about yet is taken back in on open.
+#
+# If the file does not fit (other capacity, both headers damaged), it is created
+# anew and the records still readable are carried over: the queue tail..head with a
+# valid header, otherwise every record with a valid checksum (records already sent
+# may then go out a second time).
+
+_MAGIC = b"WRC1"
+_HEADER = "<4sIIII"      # magic, generation, tail, head, capacity
+_HEADER_DATA = struct.calcsize(_HEADER)
+_HEADER_SIZE = _HEADER_DATA + 2  # + checksum
+_RECORD = "<IIHhHIIB"    # seq, ts, mid, temp*100, humidity*100, pressure Pa, gas Ohm, flags
+_RECORD_DATA = struct.calcsize(_RECORD)
+_RECORD_SIZE = _RECORD_DATA + 2  # + checksum
+
+FLAG_GAS_CARRIED = 0x01  # gas value carried over from an earlier reading
+FLAG_UNSYNCED = 0x02     # timestamp still local time, before the first NTP sync (clock.py)
+
+
+def _checksum(buf, length):
+    # Fletcher-16, enough to catch half-written records
+    a = b = 0
+    for i in range(length):
+        a = (a + buf[i]) % 255
+        b = (b + a) % 255
+    return (b << 8) | a
+
+
+class RingCache:
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self._buf = bytearray(_RECORD_SIZE)
+        self._hbuf = bytearray(_HEADER_SIZE)
+        self._generation = 0
+        self.tail = 0  # sequence number of the oldest record
+        self.head = 0  # sequence number of the next record
+        try:
+            self._f = open(path, "r+b")
+        except OSError:
+            self._create()  # no file yet
+            return
+        try:
+            self._load()
+        except OSError as e:
+            records = self._salvage()
+            self._f.close()
+            print("⚠️ Cache", path, "recreated:", e, "-", len(records), "records carried over")
+            self._create()
+            for record in records[-capacity:]:
+                self._write_slot(self.head, *record[1:])
+                self.head += 1
+            self._write_header()
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def _create(self):
+        self._f = open(self.path, "w+b")
+        self._write_header()
+        self._write_header()  # create both copies valid
+
+    # ---------- header ----------
+    def _best_header(self):
+        # (generation, tail, head, capacity) of the valid copy with the highest
+        # generation, None if neither is valid
+        best = None
+        for slot in (0, 1):
+            self._f.seek(slot * _HEADER_SIZE)
+            if self._f.readinto(self._hbuf) != _HEADER_SIZE:
+                continue
+            if _checksum(self._hbuf, _HEADER_DATA) != struct.unpack_from("<H", self._hbuf, _HEADER_DATA)[0]:
+                continue
+            magic, gen, tail, head, capacity = struct.unpack_from(_HEADER, self._hbuf)
+            if magic != _MAGIC or not capacity:
+                continue
+            if best is None or gen > best[0]:
+                best = (gen, tail, head, capacity)
+        return best
+
+    def _load(self):
+        best = self._best_header()
+        if best is None:
+            raise OSError("header invalid")
+        if best[3] != self.capacity:
+            raise OSError("capacity %d instead of %d" % (best[3], self.capacity))
+        self._generation, self.tail, self.head, _ = best
+        # Take back records that were fully written before the power loss
+        recovered = False
+        while self._read_slot(self.head) is not None:
+            self.head += 1
+            recovered = True
+        if self.head - self.tail > self.capacity:
+            self.tail = self.head - self.capacity
+        if recovered:
+            self._write_header()
+
+    def _salvage(self):
+        # Readable records of the old file, sorted by sequence number, as
+        # (seq, ts, mid, temperature, humidity, pressure, gas, flags)
+        capacity = self.capacity
+        best = self._best_header()
+        if best is not None:
+            _, tail, head, self.capacity = best
+            seqs = range(max(tail, head - self.capacity), head)
+        else:
+            # no header: every slot of the file, the number is in the record
+            self._f.seek(0, 2)
+            self.capacity = max((self._f.tell() - 2 * _HEADER_SIZE) // _RECORD_SIZE, 1)
+            seqs = None
+        records = []
+        for slot in (range(self.capacity) if seqs is None else seqs):
+            record = self._read_slot(slot, seqs is None)
+            if record is not None:
+                _, ts, mid, temp, hum, pres, gas, flags = record
+                records.append((record[0], ts, mid, temp / 100, hum / 100, pres / 100, gas, flags))
+        self.capacity = capacity
+        records.sort()
+        return records
+
+    def _write_header(self):
+        self._generation += 1
+        struct.pack_into(_HEADER, self._hbuf, 0, _MAGIC, self._generation,
+                         self.tail, self.head, self.capacity)
+        struct.pack_into("<H", self._hbuf, _HEADER_DATA, _checksum(self._hbuf, _HEADER_DATA))
+        self._f.seek((self._generation & 1) * _HEADER_SIZE)
+        self._f.write(self._hbuf)
+        self._f.flush()
+
+    # ---------- records ----------
+    def _offset(self, seq):
+        return 2 * _HEADER_SIZE + (seq % self.capacity) * _RECORD_SIZE
+
+    def _read_slot(self, seq, any_seq=False):
+        # any_seq: read slot seq, whatever number the record carries
+        self._f.seek(self._offset(seq))
+        if self._f.readinto(self._buf) != _RECORD_SIZE:
+            return None
+        if _checksum(self._buf, _RECORD_DATA) != struct.unpack_from("<H", self._buf, _RECORD_DATA)[0]:
+            return None
+        record = struct.unpack_from(_RECORD, self._buf)
+        if record[0] != seq & 0xFFFFFFFF and not any_seq:
+            return None
+        return record
+
+    def _write_slot(self, seq, ts, mid, temperature, humidity, pressure, gas, flags):
+        # pressure in hPa, stored as whole Pascal
+        struct.pack_into(_RECORD, self._buf, 0, seq & 0xFFFFFFFF, ts, mid,
+                         int(round(temperature * 100)), int(round(humidity * 100)),
+                         int(round(pressure * 100)), int(gas), flags)
+        struct.pack_into("<H", self._buf, _RECORD_DATA, _checksum(self._buf, _RECORD_DATA))
+        self._f.seek(self._offset(seq))
+        self._f.write(self._buf)
+        self._f.flush()
+
+    def append(self, ts, mid, temperature, humidity, pressure, gas, flags=0):
+        self._write_slot(self.head, ts, mid, temperature, humidity, pressure, gas, flags)
+        self.head += 1
+        if self.head - self.tail > self.capacity:
+            self.tail += 1  # full: overwrite the oldest record
+        self._write_header()
+
+    def read(self, index):
+        # Record number index from the oldest as
+        # (ts, mid, temperature, humidity, pressure, gas, flags), None if damaged
+        record = self._read_slot(self.tail + index)
+        if record is None:
+            return None
+        _, ts, mid, temp, hum, pres, gas, flags = record
+        return (ts, mid, temp / 100, hum / 100, pres / 100, gas, flags)
+
+    def peek(self, count):
+        # The oldest count records (count <= len); damaged records are left out
+        records = []
+        for index in range(min(count, len(self))):
+            record = self.read(index)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def restamp(self, start, epoch):
+        # Restamp the records from sequence number start that carry FLAG_UNSYNCED to
+        # epoch(ts) (after the first NTP sync); returns how many
+        count = 0
+        for seq in range(max(start, self.tail), self.head):
+            record = self._read_slot(seq)
+            if record is None or not record[7] & FLAG_UNSYNCED:
+                continue
+            _, ts, mid, temp, hum, pres, gas, flags = record
+            self._write_slot(seq, epoch(ts), mid, temp / 100, hum / 100, pres / 100, gas,
+                             flags & ~FLAG_UNSYNCED)
+            count += 1
+        return count
+
+    def drop(self, count):
+        # Release the records read with peek(count) once their delivery is confirmed
+        self.tail = min(self.tail + count, self.head)
+        self._write_header()
+
+    def close(self):
+        self._f.close()
@@ -0,0 +1,51 @@
+# sampling.py - Adaptive sampling interval from the rate of change of the readings
+# =================================================================================
+#
+# The sampler runs on a grid of base seconds (the shortest interval) and asks after
+# each reading how many grid slots to wait before the next one. Per sensor and channel
+# (temperature, humidity, pressure, gas) the rate of change since the previous reading
+# is compared to a step: the change one reading should resolve. The next reading is
+# due when the fastest channel would have moved by its step, between 1 and max_slots
+# slots.
+#
+# Rates are held as a peak that halves with every reading, so the interval drops at
+# once when the weather turns and grows back over a few readings (at most doubling
+# per reading) when it calms down. Everything depends on the readings alone, never on
+# the clock, so a recorded trace replays to the same schedule on the host.
+
+CHANNELS = 4  # temperature, humidity, pressure, gas
+
+
+class AdaptiveInterval:
+    def __init__(self, base, max_slots, steps):
+        self.base = base            # s per grid slot
+        self.max_slots = max_slots  # longest interval in slots
+        self.steps = steps          # change per reading to resolve per channel, None = ignore
+        self.slots = 1              # interval in slots after the last reading
+        self._last = {}             # mid -> (ts, values, peak rates per channel)
+
+    def offer(self, ts, mid, values):
+        """Note one reading (values per channel) of sensor mid, taken at ts (s)."""
+        last = self._last.get(mid)
+        if last is None:
+            self._last[mid] = (ts, values, [0.0] * CHANNELS)
+            return
+        last_ts, last_values, peaks = last
+        dt = ts - last_ts
+        if dt <= 0:
+            return
+        for i in range(CHANNELS):
+            peaks[i] = max(abs(values[i] - last_values[i]) / dt, peaks[i] / 2)
+        self._last[mid] = (ts, values, peaks)
+
+    def next_slots(self):
+        """Slots until the next reading, from all readings offered so far."""
+        wanted = self.max_slots * self.base
+        for _, _, peaks in self._last.values():
+            for i in range(CHANNELS):
+                step = self.steps[i]
+                if step is not None and peaks[i] * wanted > step:
+                    wanted = step / peaks[i]
+        slots = max(1, min(int(wanted // self.base), 2 * self.slots, self.max_slots))
+        self.slots = slots
+        return slots
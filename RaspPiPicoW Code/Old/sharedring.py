@@ -0,0 +1,59 @@
+# sharedring.py - Packed reading ring shared between the two RP2040 cores
+# ========================================================================
+#
+# The core 1 sampler (SAMPLER_CORE1 in config.py) puts readings, the network side on
+# core 0 takes them. Readings are packed into one preallocated bytearray, so passing
+# a reading allocates nothing on the shared heap but the returned tuple, and the lock
+# is held only for one pack or unpack.
+
+import struct
+import _thread
+
+RECORD = "<IHhHIIB"  # ts, mid, temperature*100, humidity*100, pressure Pa, gas Ohm, flags
+RECORD_SIZE = struct.calcsize(RECORD)
+
+FLAG_GAS_CARRIED = 0x01  # gas value repeated from an earlier reading
+
+
+class SharedRing:
+    """Fixed-size FIFO of packed readings, safe between threads.
+
+    put() never waits for the reader: when the ring is full the oldest reading is
+    overwritten and counted in ``dropped``.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = bytearray(capacity * RECORD_SIZE)
+        self._lock = _thread.allocate_lock()
+        self.head = 0  # sequence number of the next reading written
+        self.tail = 0  # sequence number of the oldest reading not yet taken
+        self.dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, ts, mid, temperature, humidity, pressure, gas, flags=0):
+        """Append one reading (pressure in hPa)."""
+        # Scale outside the lock, the other core only waits for the copy
+        temp = int(round(temperature * 100))
+        hum = int(round(humidity * 100))
+        pa = int(round(pressure * 100))
+        with self._lock:
+            if self.head - self.tail == self.capacity:
+                self.tail += 1
+                self.dropped += 1
+            struct.pack_into(RECORD, self._buf, (self.head % self.capacity) * RECORD_SIZE,
+                             ts, mid, temp, hum, pa, int(gas), flags)
+            self.head += 1
+
+    def get(self):
+        """Take the oldest reading as (ts, mid, temperature, humidity, pressure, gas, flags),
+        or None when the ring is empty."""
+        with self._lock:
+            if self.head == self.tail:
+                return None
+            ts, mid, temp, hum, pa, gas, flags = struct.unpack_from(
+                RECORD, self._buf, (self.tail % self.capacity) * RECORD_SIZE)
+            self.tail += 1
+        return ts, mid, temp / 100, hum / 100, pa / 100, gas, flags
@@ -5,53 +5,107 @@ import socket
 from ssl import wrap_socket as ssl_wrap_socket
 
 DEFAULT_TIMEOUT = 10 # sec
+READ_BUFFER = 256 # bytes per socket read of server replies
 LOCAL_DOMAIN = '127.0.0.1'
 CMD_EHLO = 'EHLO'
 CMD_STARTTLS = 'STARTTLS'
 CMD_AUTH = 'AUTH'
 CMD_MAIL = 'MAIL'
+CMD_RSET = 'RSET'
+CMD_NOOP = 'NOOP'
+EXT_PIPELINING = 'PIPELINING'
 AUTH_PLAIN = 'PLAIN'
 AUTH_LOGIN = 'LOGIN'
 
 class SMTP:
     def cmd(self, cmd_str):
-        sock = self._sock;
-        sock.write('%s\r\n' % cmd_str)
+        self._sock.write('%s\r\n' % cmd_str)
+        return self._reply()
+
+    def _readline(self):
+        # MicroPython's socket readline() is unbuffered and reads byte by byte: fill a
+        # fixed bytearray with readinto() instead and cut the lines from what came in,
+        # so a whole reply (with PIPELINING several) usually takes one socket read
+        while True:
+            end = self._rbuf.find(b'\n')
+            if end >= 0:
+                line = self._rbuf[:end + 1]
+                self._rbuf = self._rbuf[end + 1:]
+                return line
+            if self._rchunk is None:
+                self._rchunk = bytearray(READ_BUFFER)
+            n = self._sock.readinto(self._rchunk)
+            if not n:
+                raise OSError('connection closed')
+            self._rbuf += self._rchunk[:n]
+
+    def _reply(self):
+        # One reply: "250-..." lines continue, "250 ..." ends it
         resp = []
-        next = True
-        while next:
-            code = sock.read(3)
-            next = sock.read(1) == b'-'
-            resp.append(sock.readline().strip().decode())
-        return int(code), resp
-
-    def __init__(self, host, port, ssl=False, username=None, password=None):
+        while True:
+            line = self._readline()
+            if len(line) < 5:
+                raise OSError('bad reply %r' % line)
+            resp.append(line[4:].strip().decode())
+            if line[3:4] != b'-':
+                return int(line[:3]), resp
+
+    def _ehlo(self):
+        code, resp = self.cmd(CMD_EHLO + ' ' + LOCAL_DOMAIN)
+        assert code==250, '%d, %s' % (code, resp)
+        self.pipelining = EXT_PIPELINING in resp
+        return resp
+
+    def __init__(self, host, port, ssl=False, username=None, password=None, keepalive=False,
+                 timeout=DEFAULT_TIMEOUT):
+        # keepalive: keep the session open for several messages (RSET between them)
+        # and reconnect + re-authenticate if the server dropped it meanwhile
+        # timeout: seconds any single step (connect, TLS handshake, reply) may block
+        self.host = host
+        self.timeout = timeout
+        self.port = port
+        self.ssl = ssl
         self.username = username
-        addr = socket.getaddrinfo(host, port)[0][-1]
+        self.keepalive = keepalive
+        self._password = password if keepalive else None
+        self._sock = None
+        self._wbuf = None
+        self._rchunk = None
+        self._rbuf = b'' # received, not yet parsed reply bytes
+        self._used = False # a transaction was started on this session
+        self.pipelining = False # server offers PIPELINING (RFC 2920)
+        self.connects = 0
+        self._connect()
+        if username and password:
+            self.login(username, password)
+
+    def _connect(self):
+        ssl = self.ssl
+        addr = socket.getaddrinfo(self.host, self.port)[0][-1]
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(DEFAULT_TIMEOUT)
+        sock.settimeout(self.timeout)
         sock.connect(addr)
         if ssl:
             sock = ssl_wrap_socket(sock)
-        code = int(sock.read(3))
-        sock.readline()
-        assert code==220, 'cant connect to server %d, %s' % (code, resp)
         self._sock = sock
+        self._rbuf = b''
+        code, resp = self._reply()
+        assert code==220, 'cant connect to server %d, %s' % (code, resp)
+        self._used = False
+        self.connects += 1
 
-        code, resp = self.cmd(CMD_EHLO + ' ' + LOCAL_DOMAIN)
-        assert code==250, '%d' % code
+        resp = self._ehlo()
         if not ssl and CMD_STARTTLS in resp:
             code, resp = self.cmd(CMD_STARTTLS)
             assert code==220, 'start tls failed %d, %s' % (code, resp)
             self._sock = ssl_wrap_socket(sock)
-
-        if username and password:
-            self.login(username, password)
+            self._rbuf = b''
 
     def login(self, username, password):
         self.username = username
-        code, resp = self.cmd(CMD_EHLO + ' ' + LOCAL_DOMAIN)
-        assert code==250, '%d, %s' % (code, resp)
+        if self.keepalive:
+            self._password = password
+        resp = self._ehlo()
 
         auths = None
         for feature in resp:
@@ -73,13 +127,46 @@ class SMTP:
         assert code==235 or code==503, 'auth error %d, %s' % (code, resp)
         return code, resp
 
+    def noop(self):
+        # Liveness check: True if the session still answers
+        if self._sock is None:
+            return False
+        try:
+            return self.cmd(CMD_NOOP)[0] == 250
+        except Exception:
+            return False
+
+    def reconnect(self):
+        self.close()
+        self._connect()
+        if self.username and self._password:
+            self.login(self.username, self._password)
+
+    def _reuse(self):
+        # Reset the previous transaction; a closed or timed out session
+        # (no answer, 421) is reopened transparently
+        try:
+            if self._sock is not None and self.cmd(CMD_RSET)[0] == 250:
+                return
+        except Exception:
+            pass
+        self.reconnect()
+
     def to(self, addrs, mail_from=None):
         mail_from = self.username if mail_from==None else mail_from
+        if isinstance(addrs, str):
+            addrs = [addrs]
+        rset = self.keepalive and self._used
+        if self._sock is None or (rset and not self.pipelining):
+            self._reuse()
+            rset = False
+        self._used = True # from here on the next message needs a RSET
+        if self.pipelining:
+            return self._to_pipelined(addrs, mail_from, rset)
+
         code, resp = self.cmd('MAIL FROM: <%s>' % mail_from)
         assert code==250, 'sender refused %d, %s' % (code, resp)
 
-        if isinstance(addrs, str):
-            addrs = [addrs]
         count = 0
         for addr in addrs:
             code, resp = self.cmd('RCPT TO: <%s>' % addr)
@@ -92,16 +179,87 @@ class SMTP:
         assert code==354, 'data refused, %d, %s' % (code, resp)
         return code, resp
 
+    def _to_pipelined(self, addrs, mail_from, rset):
+        # RSET (on a reused session), MAIL, every RCPT and DATA in one write,
+        # then all replies in order: one round trip instead of one per command
+        cmds = ['MAIL FROM: <%s>' % mail_from]
+        cmds += ['RCPT TO: <%s>' % addr for addr in addrs]
+        cmds.append('DATA')
+        if rset:
+            cmds.insert(0, CMD_RSET)
+        try:
+            self._sock.write('\r\n'.join(cmds) + '\r\n')
+            replies = [self._reply() for _ in cmds]
+        except Exception:
+            if not rset:
+                raise
+            replies = None
+        if rset:
+            if replies is None or replies[0][0] != 250:
+                # Server dropped the idle session: reopen and try again
+                self.reconnect()
+                return self.to(addrs, mail_from)
+            replies.pop(0)
+
+        error = None
+        code, resp = replies[0]
+        if code!=250:
+            error = 'sender refused %d, %s' % (code, resp)
+        count = 0
+        for addr, (code, resp) in zip(addrs, replies[1:-1]):
+            if code!=250 and code!=251:
+                print('%s refused, %s' % (addr, resp))
+                count += 1
+        if error is None and count==len(addrs):
+            error = 'recipient refused, %d, %s' % (code, resp)
+        code, resp = replies[-1]
+        if error is not None:
+            if code==354:
+                self.send() # server opened DATA anyway, close it
+            raise AssertionError(error)
+        assert code==354, 'data refused, %d, %s' % (code, resp)
+        return code, resp
+
     def write(self, content):
         self._sock.write(content)
 
+    def write_from(self, stream, size=512):
+        # Copy stream.readinto() to the socket through one reusable buffer, so the
+        # body never has to exist in RAM as a whole. The stream must not produce
+        # lines starting with '.' (no dot-stuffing here).
+        if self._wbuf is None or len(self._wbuf) != size:
+            self._wbuf = bytearray(size)
+        buf = self._wbuf
+        view = memoryview(buf)
+        total = 0
+        while True:
+            n = stream.readinto(buf)
+            if not n:
+                return total
+            self._sock.write(view[:n])
+            total += n
+
     def send(self, content=''):
         if content:
             self.write(content)
         self._sock.write('\r\n.\r\n') # the five letter sequence marked for ending
-        line = self._sock.readline()
-        return (int(line[:3]), line[4:].strip().decode())
+        code, resp = self._reply()
+        return (code, ' '.join(resp))
 
     def quit(self):
-        self.cmd("QUIT")
-        self._sock.close()
+        try:
+            self.cmd("QUIT")
+        finally:
+            self.close()
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+            self._sock = None
+        self._wbuf = None
+        self._rchunk = None
+        self._rbuf = b''
+        self._used = False